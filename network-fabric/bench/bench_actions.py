@@ -0,0 +1,253 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Offline benchmark for the network-fabric and network-tenant test actions.
+
+Runs FabricAction.fabric_test, TenantAction.tenant_test (once per tenant)
+and FabricAction.tenants_test (all tenants at once) against a synthetic
+fabric whose switches are replaced by the recorded-output device simulator
+(see device_simulator.py), and compares device collection strategies:
+
+    serial    - one device at a time (COLLECTION_MAX_WORKERS = 1)
+    parallel  - up to --workers devices at a time
+    pooled    - parallel, with sessions kept in the session pool between runs
+    incremental - parallel incremental fabric test after a full run, with
+                  --changed switches given a new transaction id
+    snapshots - parallel, with the snapshot store running, so the tenant tests
+                reuse the output parsed by the tests of the other tenants
+
+--fast-connect turns on the fabric's fast connect profile (no hostname
+discovery or init config commands on login).
+
+--unresponsive makes the last switches of the fabric hang, to check the
+actions still finish within their collection budget (--budget).
+
+Example, 100 simulated devices:
+
+    python bench/bench_actions.py --pairs 40 --switches 20 --latency-scale 0.1
+
+Use --recordings to replay output captured from real devices instead of
+recordings generated from the synthetic fabric, and --json for machine
+readable output.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "python"))
+
+import fake_ncs
+fake_ncs.install()
+import device_simulator
+device_simulator.install_genie()
+
+from synthetic import FabricSize, build_fabric, build_tenants
+from device_simulator import DeviceSimulator, recordings_from_fabric
+from network_fabric import pyats_helpers
+from network_fabric.session_pool import start_session_pool, stop_session_pool
+from network_fabric.snapshot_store import start_snapshot_store, stop_snapshot_store
+from network_fabric.fabric_actions import FabricAction
+from network_fabric.tenant_actions import TenantAction
+
+STRATEGIES = ["serial", "parallel", "pooled", "incremental", "snapshots"]
+
+
+def run_action(test, simulator):
+    """
+    Run one test action with fresh action output.
+
+    Return dictionary of wall time, action result and simulated device operations.
+    """
+
+    action_output = fake_ncs.ActionOutput()
+    simulator.stats.reset()
+    start = time.perf_counter()
+    test(action_output)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "wall_s": round(elapsed, 3),
+        "success": action_output.success,
+        "errors": len(action_output.error),
+        **simulator.stats.as_dict(),
+    }
+
+
+def change_devices(root, count):
+    """Give the first count devices a new transaction id, as a commit to them would."""
+
+    for device in list(root.devices.device)[:count]:
+        device.state.last_transaction_id = str(int(device.state.last_transaction_id) + 1)
+
+
+def run_strategy(strategy, tests, simulator, workers, repeat, changed=None):
+    """Benchmark every test action with one collection strategy."""
+
+    pyats_helpers.COLLECTION_MAX_WORKERS = 1 if strategy == "serial" else workers
+
+    if strategy == "incremental":
+        # A full run records what passed, then each timed run only tests the switches changed just before it
+        incremental = tests["fabric-incremental"]
+        incremental(fake_ncs.ActionOutput())
+
+        def test(output):
+            changed()
+            incremental(output)
+
+        tests = {"fabric": test}
+    else:
+        tests = {name: test for name, test in tests.items() if name != "fabric-incremental"}
+
+    if strategy == "pooled":
+        start_session_pool(max_sessions=len(simulator.recordings) + 1)
+        # Warm the pool so the timed runs reuse sessions like a busy NSO would
+        for test in tests.values():
+            run_action(test, simulator)
+
+    if strategy == "snapshots":
+        start_snapshot_store()
+
+    try:
+        results = {}
+        for name, test in tests.items():
+            runs = [run_action(test, simulator) for _ in range(repeat)]
+            results[name] = min(runs, key=lambda r: r["wall_s"])
+        return results
+    finally:
+        stop_session_pool()
+        stop_snapshot_store()
+
+
+def run(size, strategies=STRATEGIES, workers=10, repeat=1, latency_scale=1.0, jitter=0.1,
+        stp_vlans=10, recordings=None, changed=5, level="full", tenants=1, unresponsive=0, budget=None,
+        fast_connect=False, verbose=False):
+    """Benchmark the test actions for one fabric size."""
+
+    if budget:
+        pyats_helpers.QUICK_TEST_TIME_BUDGET = budget
+        pyats_helpers.FULL_TEST_TIME_BUDGET = budget
+
+    log = fake_ncs.Log(verbose=verbose)
+    root, fabric = build_fabric(size)
+    fabric_tenants = build_tenants(size, root, tenants)
+    fabric.test.fast_connect = fast_connect
+
+    # Unresponsive switches take far longer than any timeout for every operation. The last
+    # switches are picked so the layer3 switch-pair of the tenant tests keeps responding
+    switches = list(root.devices.device)
+    device_latency = {str(device.name): 1e6 for device in switches[len(switches) - unresponsive:]}
+    if recordings:
+        simulator = DeviceSimulator.from_file(recordings, jitter=jitter, scale=latency_scale, seed=1,
+                                              device_latency=device_latency)
+    else:
+        simulator = DeviceSimulator(
+            recordings_from_fabric(root, fabric, tenants=fabric_tenants, stp_vlans=stp_vlans),
+            jitter=jitter, scale=latency_scale, seed=1, device_latency=device_latency,
+        )
+    pyats_helpers.set_testbed_loader(simulator.load)
+
+    fabric_action = FabricAction(log=log)
+    tenant_action = TenantAction(log=log)
+    test_input = fake_ncs.Node(level=level, incremental=False, max_results=100, fresh=False)
+    incremental = fake_ncs.Node(level=level, incremental=True, max_results=100, fresh=False)
+    tests = {
+        "fabric": lambda output: fabric_action.fabric_test(fabric, root, test_input, output, username="admin"),
+        "tenant": lambda output: [tenant_action.tenant_test(tenant, root, test_input, output, username="admin") for tenant in fabric_tenants],
+        "tenants": lambda output: fabric_action.tenants_test(fabric, root, test_input, output, username="admin"),
+        "fabric-incremental": lambda output: fabric_action.fabric_test(fabric, root, incremental, output, username="admin"),
+    }
+
+    try:
+        return {
+            "size": vars(size),
+            "devices": len(simulator.recordings),
+            "workers": workers,
+            "latency_scale": latency_scale,
+            "level": level,
+            "tenants": tenants,
+            "changed": changed,
+            "unresponsive": unresponsive,
+            "fast_connect": fast_connect,
+            "strategies": {
+                strategy: run_strategy(strategy, tests, simulator, workers, repeat, changed=lambda: change_devices(root, changed))
+                for strategy in strategies
+            },
+        }
+    finally:
+        pyats_helpers.set_testbed_loader(None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the network-fabric and network-tenant test actions offline.")
+    parser.add_argument("--pairs", type=int, default=40, help="switch-pairs in the fabric")
+    parser.add_argument("--switches", type=int, default=20, help="standalone switches in the fabric")
+    parser.add_argument("--trunks", type=int, default=8, help="fabric-trunks per switch-pair/switch")
+    parser.add_argument("--members", type=int, default=2, help="member interfaces per fabric-trunk")
+    parser.add_argument("--vrfs", type=int, default=10, help="VRFs on each tenant")
+    parser.add_argument("--tenants", type=int, default=1, help="network-tenants on the fabric")
+    parser.add_argument("--stp-vlans", type=int, default=10, help="VLANs in the recorded spanning-tree output")
+    parser.add_argument("--workers", type=int, default=pyats_helpers.COLLECTION_MAX_WORKERS,
+                        help="devices collected at the same time by the parallel strategies")
+    parser.add_argument("--strategy", action="append", choices=STRATEGIES,
+                        help="collection strategy to run, may be repeated (default all)")
+    parser.add_argument("--level", choices=["quick", "full"], default="full", help="test action level")
+    parser.add_argument("--changed", type=int, default=5, help="switches changed before the incremental test")
+    parser.add_argument("--unresponsive", type=int, default=0, help="switches that never respond")
+    parser.add_argument("--fast-connect", action="store_true", help="use the fast connect profile on login")
+    parser.add_argument("--budget", type=float, help="seconds the actions may spend collecting device output")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per action, the fastest is reported")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="multiplier for the simulated device latency, 0 for no latency")
+    parser.add_argument("--jitter", type=float, default=0.1, help="random latency variation, 0.1 = +/-10%%")
+    parser.add_argument("--recordings", help="JSON file of recorded device output to replay")
+    parser.add_argument("--save-recordings", help="write the generated recordings to a JSON file and exit")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="print the action log")
+    args = parser.parse_args(argv)
+
+    size = FabricSize(args.pairs, args.switches, args.trunks, args.members, args.vrfs)
+
+    if args.save_recordings:
+        root, fabric = build_fabric(size)
+        fabric_tenants = build_tenants(size, root, args.tenants)
+        DeviceSimulator(recordings_from_fabric(root, fabric, tenants=fabric_tenants, stp_vlans=args.stp_vlans)).save(args.save_recordings)
+        return
+
+    results = run(
+        size,
+        strategies=args.strategy or STRATEGIES,
+        workers=args.workers,
+        repeat=args.repeat,
+        latency_scale=args.latency_scale,
+        jitter=args.jitter,
+        stp_vlans=args.stp_vlans,
+        recordings=args.recordings,
+        changed=args.changed,
+        level=args.level,
+        tenants=args.tenants,
+        unresponsive=args.unresponsive,
+        budget=args.budget,
+        fast_connect=args.fast_connect,
+        verbose=args.verbose,
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Fabric size: {size}  devices: {results['devices']}  workers: {results['workers']}  "
+          f"latency scale: {results['latency_scale']}  level: {results['level']}  tenants: {results['tenants']}  "
+          f"unresponsive: {results['unresponsive']}  fast connect: {results['fast_connect']}")
+    for strategy, actions in results["strategies"].items():
+        for name, r in actions.items():
+            print(f"  {strategy:11s} {name:7s} {r['wall_s']:>9.3f} s  success {str(r['success']):5s} "
+                  f"errors {r['errors']:>4d}  built {r['built']:>4d}  connects {r['connects']:>4d}  commands {r['commands']:>5d}  "
+                  f"learns {r['learns']:>4d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Offline benchmark for the network-fabric and network-tenant service create callbacks.
+
+Runs FabricServiceCallbacks.cb_create and TenantServiceCallbacks.cb_create
+against a synthetic fabric held in an in-memory stand-in for ncs.maagic,
+ncs.template and resource_manager.id_allocator (see fake_ncs.py), and reports
+wall time, template applies, device reads and peak memory. No NSO is needed.
+
+Example:
+
+    python bench/bench_create.py --pairs 20 --switches 10 --trunks 8 --members 4 --vrfs 50
+
+--partitioned also times a one trunk edit, as a full fabric redeploy and as a
+partitioned fabric (network-fabric-partition services) where only the changed
+switch-pair is redeployed.
+
+Use --json to get machine readable output for comparing runs.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "python"))
+
+import fake_ncs
+fake_ncs.install()
+
+from synthetic import FabricSize, build_fabric, build_tenant
+from network_fabric.fabric_create import FabricServiceCallbacks, FabricPartitionCallbacks
+from network_fabric.tenant_create import TenantServiceCallbacks
+
+
+class TransContext(object):
+    """Stand-in for the tctx passed to cb_create."""
+
+    username = "admin"
+
+
+def measure(create, repeat):
+    """
+    Run a create callback repeat times.
+
+    Return dictionary of wall time statistics, operation counts for a single run and peak memory.
+    """
+
+    times = []
+    for _ in range(repeat):
+        fake_ncs.counters.reset()
+        start = time.perf_counter()
+        create()
+        times.append(time.perf_counter() - start)
+
+    counts = {
+        "template_applies": fake_ncs.counters.template_applies,
+        "device_reads": fake_ncs.counters.device_reads,
+        "id_requests": fake_ncs.counters.id_requests,
+    }
+
+    tracemalloc.start()
+    create()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "min_ms": round(min(times) * 1000, 3),
+        "mean_ms": round(statistics.mean(times) * 1000, 3),
+        "max_ms": round(max(times) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+        **counts,
+    }
+
+
+def converge(create, max_creates=100):
+    """
+    Deploy a new fabric: run the create, let the resource-manager allocate what it
+    requested, and run the create again for every redeploy the allocations trigger
+    (one per allocation, or one from the VPC Domain Id kicker once they are all made).
+
+    Return dictionary of the creates run, the total create time and the allocations
+    still pending on the first create.
+    """
+
+    fake_ncs.id_allocator.reset(deferred=True)
+    creates = 0
+    redeploys = 1
+    total = 0.0
+    first_pending = None
+    try:
+        while redeploys and creates < max_creates:
+            redeploys -= 1
+            fake_ncs.counters.reset()
+            start = time.perf_counter()
+            create()
+            total += time.perf_counter() - start
+            creates += 1
+            if first_pending is None:
+                first_pending = len(fake_ncs.id_allocator.requested)
+            kicker = any(name == "fabric-vpc-domain-id-kicker" for name, _, _ in fake_ncs.counters.applies)
+            redeploys += fake_ncs.id_allocator.allocate_requested(kicker=kicker)
+    finally:
+        fake_ncs.id_allocator.reset()
+
+    return {
+        "creates": creates,
+        "redeploys": creates - 1,
+        "total_ms": round(total * 1000, 3),
+        "first_pending": first_pending,
+    }
+
+
+def edit_trunk(fabric):
+    """Change the description of the first fabric-trunk of the first switch-pair, as a small commit would."""
+
+    trunk = next(iter(next(iter(fabric.switch_pair)).fabric_trunk.port_channel))
+    trunk.description = "Edited trunk" if trunk.description != "Edited trunk" else "Synthetic trunk"
+
+
+def deploy_partitioned(tctx, root, fabric, fabric_callbacks, partition_callbacks, deployed):
+    """
+    Run the create of a partitioned network-fabric, then the create of every network-fabric-partition
+    whose entry it changed, the way FASTMAP redeploys stacked services. deployed holds the partition
+    entries written by the previous run and is updated.
+
+    Return number of partition creates run.
+    """
+
+    start = len(fake_ncs.counters.applies)
+    fabric_callbacks.cb_create(tctx, root, fabric, None)
+    entries = {(v["PARTITION_TYPE"], v["PARTITION_NAME"]): v for name, v, _ in fake_ncs.counters.applies[start:] if name == "fabric-partition"}
+
+    creates = 0
+    for (partition_type, partition_name), entry in entries.items():
+        if deployed.get((partition_type, partition_name)) == entry:
+            continue
+        partition = fake_ncs.Node(
+            _path=f"/network-fabric:network-fabric-partition{{{fabric.name} {partition_type} {partition_name}}}",
+            fabric=fabric.name, type=partition_type, name=partition_name,
+            vpc_domain_id=int(entry["VPC_DOMAIN_ID"]) if entry["VPC_DOMAIN_ID"] else None,
+            fingerprint=entry["FINGERPRINT"],
+        )
+        partition_callbacks.cb_create(tctx, root, partition, None)
+        creates += 1
+
+    deployed.clear()
+    deployed.update(entries)
+    return creates
+
+
+def run(size, repeat=5, pending_allocations=False, partitioned=False, verbose=False):
+    """Benchmark fabric and tenant create for one fabric size."""
+
+    log = fake_ncs.Log(verbose=verbose)
+    tctx = TransContext()
+
+    root, fabric = build_fabric(size)
+    tenant = build_tenant(size, root)
+
+    fabric_callbacks = FabricServiceCallbacks(log=log)
+    tenant_callbacks = TenantServiceCallbacks(log=log)
+
+    # A new fabric deploy, starting with no VPC Domain Ids allocated
+    convergence = converge(lambda: fabric_callbacks.cb_create(tctx, root, fabric, None))
+
+    fake_ncs.id_allocator.pending = pending_allocations
+    results = {
+        "size": vars(size),
+        "pending_allocations": pending_allocations,
+        "convergence": convergence,
+        "fabric": measure(lambda: fabric_callbacks.cb_create(tctx, root, fabric, None), repeat),
+        "tenant": measure(lambda: tenant_callbacks.cb_create(tctx, root, tenant, None), repeat),
+    }
+
+    if partitioned:
+        # A one trunk edit redeploys the whole fabric, or the fabric entry and a single partition
+        results["edit"] = measure(lambda: (edit_trunk(fabric), fabric_callbacks.cb_create(tctx, root, fabric, None)), repeat)
+
+        partition_callbacks = FabricPartitionCallbacks(log=log)
+        deployed = {}
+        fabric.partitioned = True
+        deploy_partitioned(tctx, root, fabric, fabric_callbacks, partition_callbacks, deployed)
+        results["partitioned-edit"] = measure(
+            lambda: (edit_trunk(fabric), deploy_partitioned(tctx, root, fabric, fabric_callbacks, partition_callbacks, deployed)), repeat
+        )
+        fabric.partitioned = False
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark network-fabric and network-tenant cb_create offline.")
+    parser.add_argument("--pairs", type=int, default=10, help="switch-pairs in the fabric")
+    parser.add_argument("--switches", type=int, default=10, help="standalone switches in the fabric")
+    parser.add_argument("--trunks", type=int, default=8, help="fabric-trunks per switch-pair/switch")
+    parser.add_argument("--members", type=int, default=2, help="member interfaces per fabric-trunk")
+    parser.add_argument("--vrfs", type=int, default=10, help="VRFs on the tenant")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per create")
+    parser.add_argument("--pending-allocations", action="store_true",
+                        help="leave VPC domain ids unallocated, like the first pass of a new fabric")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="also time a one trunk edit, redeploying the whole fabric and as a partitioned fabric")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="print the service log")
+    args = parser.parse_args(argv)
+
+    size = FabricSize(args.pairs, args.switches, args.trunks, args.members, args.vrfs)
+    results = run(size, repeat=args.repeat, pending_allocations=args.pending_allocations,
+                  partitioned=args.partitioned, verbose=args.verbose)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Fabric size: {size}")
+    c = results["convergence"]
+    print(f"  new fabric converged in {c['creates']} creates ({c['redeploys']} redeploys), "
+          f"{c['total_ms']:.3f} ms of create time, {c['first_pending']} allocations requested by the first create")
+    for name in [name for name in ["fabric", "tenant", "edit", "partitioned-edit"] if name in results]:
+        r = results[name]
+        print(f"  {name:16s} min {r['min_ms']:>10.3f} ms  mean {r['mean_ms']:>10.3f} ms  "
+              f"templates {r['template_applies']:>6d}  device reads {r['device_reads']:>6d}  "
+              f"peak {r['peak_kib']:>9.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
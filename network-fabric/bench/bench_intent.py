@@ -0,0 +1,207 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Offline benchmark for the dry-run intent renderer (network_fabric.intent_render).
+
+Builds a synthetic fabric and tenant, runs the service create callbacks against
+them (see fake_ncs.py) and checks the renderer field by field against the create:
+
+- every template apply of the create has a render apply with the same variables, and
+  the renderer makes no other applies
+- the device config paths and values the create's applies set, evaluated from the
+  template XML with the create's context nodes, are the ones the renderer sets
+
+Any drift is printed and the exit status is 1. Then times reading and rendering the
+fabric intent, with and without the switch-pair and switch renders cached, and diffing
+it against an unchanged revision and a revision with one fabric-trunk description
+changed. The exit status is also 1 when the diff of the changed revision takes longer
+than --budget-ms.
+
+Example, 100 devices:
+
+    python bench/bench_intent.py --pairs 40 --switches 20
+
+Use --json to get machine readable output for comparing runs.
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "python"))
+
+import fake_ncs
+fake_ncs.install()
+
+from synthetic import FabricSize, build_fabric, build_tenant
+from network_fabric.fabric_create import FabricServiceCallbacks
+from network_fabric.tenant_create import TenantServiceCallbacks
+from network_fabric.fabric_rules import DevicePlatform
+from network_fabric.intent_render import DeviceModel, device_ned, diff_intents, diff_models, format_diff, fabric_intent, render_intent
+from network_fabric.intent_render import clear_render_cache
+
+# Variables that tell the applies of a template apart
+APPLY_KEYS = ("DEVICE_NAME", "PORTCHANNEL_ID", "VRFNAME")
+
+# Milliseconds the diff of a one fabric-trunk change may take, it pre-screens every fabric change
+DIFF_BUDGET_MS = 100.0
+
+
+class TransContext(object):
+    """Stand-in for the tctx passed to cb_create."""
+
+    username = "admin"
+
+
+def timed(function, repeat):
+    """Run function repeat times, return its last result and the fastest run in ms."""
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, round(min(times) * 1000, 3)
+
+
+def port_channels(service):
+    """Every port-channel of a fabric by path, the context nodes of the member interface template applies."""
+
+    nodes = {}
+    for pair in service.switch_pair:
+        for port_channel in list(pair.multiswitch_peerlink.port_channel) + list(pair.fabric_trunk.port_channel):
+            nodes[port_channel._path] = port_channel
+    for switch in service.switch:
+        for port_channel in switch.fabric_trunk.port_channel:
+            nodes[port_channel._path] = port_channel
+    return nodes
+
+
+def create_model(root, service, applies):
+    """The device configuration of the create's device template applies, evaluated from the template XML."""
+
+    contexts = port_channels(service)
+    model = DeviceModel()
+    for name, variables, path in applies:
+        device_name = variables.get("DEVICE_NAME")
+        if not device_name:
+            continue
+        platform = root.devices.device[device_name].platform
+        ned = device_ned(DevicePlatform(platform.name, platform.model, platform.version))
+        model.apply(name, variables, context=contexts.get(path), ned=ned)
+    return model
+
+
+def apply_drift(create_applies, render_applies):
+    """Lines for the device template applies whose variables differ between the create and the renderer."""
+
+    def keyed(applies):
+        return {(name,) + tuple(variables.get(key, "") for key in APPLY_KEYS): variables for name, variables in applies}
+
+    create, render = keyed(create_applies), keyed(render_applies)
+    lines = []
+    for key in sorted(create.keys() | render.keys()):
+        label = " ".join(part for part in key if part)
+        if key not in render:
+            lines.append(f"missing apply {label}")
+        elif key not in create:
+            lines.append(f"extra apply {label}")
+        else:
+            for variable in sorted(create[key].keys() | render[key].keys()):
+                if create[key].get(variable) != render[key].get(variable):
+                    lines.append(f"{label} ${variable}: create {create[key].get(variable)!r} render {render[key].get(variable)!r}")
+    return lines
+
+
+def run(size, repeat=5, budget_ms=DIFF_BUDGET_MS, verbose=False):
+    """Check the renderer against the service create and time it for one fabric size."""
+
+    log = fake_ncs.Log(verbose=verbose)
+    tctx = TransContext()
+    root, fabric = build_fabric(size)
+    tenant = build_tenant(size, root)
+
+    # VPC Domain Ids are allocated during the create, so it configures every switch-pair
+    fake_ncs.id_allocator.reset()
+    fake_ncs.counters.reset()
+    FabricServiceCallbacks(log=log).cb_create(tctx, root, fabric, None)
+    TenantServiceCallbacks(log=log).cb_create(tctx, root, tenant, None)
+    applies = [(name, variables, path) for name, variables, path in fake_ncs.counters.applies if variables.get("DEVICE_NAME")]
+
+    # The intent with the VPC Domain Ids the create used
+    vpc_domain_ids = {
+        pair.name: fake_ncs.id_allocator.id_read(tctx.username, root, f"VPC-DOMAIN-ID-POOL-{fabric.name}", f"SWITCH-PAIR-{pair.name}")
+        for pair in fabric.switch_pair
+    }
+    tenants = [tenant for tenant in root.network_tenant if tenant.fabric == fabric.name]
+    intent, read_ms = timed(lambda: fabric_intent(fabric, root.devices.device, tenants=tenants, vpc_domain_ids=vpc_domain_ids), repeat)
+    _, cold_render_ms = timed(lambda: (clear_render_cache(), render_intent(intent)), repeat)
+    model, render_ms = timed(lambda: render_intent(intent), repeat)
+
+    drift = apply_drift([(name, variables) for name, variables, _ in applies], model.applies)
+    drift += format_diff(diff_models(create_model(root, fabric, applies).as_dict(), model.as_dict()))
+
+    unchanged, unchanged_ms = timed(lambda: diff_intents(intent, intent), repeat)
+    changed_intent = copy.deepcopy(intent)
+    changed_intent["switches"][0]["fabric-trunk"][0]["description"] = "changed"
+    changed, changed_ms = timed(lambda: diff_intents(intent, changed_intent), repeat)
+
+    return {
+        "size": vars(size),
+        "devices": len(intent["devices"]),
+        "sections": sum(len(sections) for sections in model.as_dict().values()),
+        "create_applies": len(applies),
+        "render_applies": len(model.applies),
+        "drift": drift,
+        "read_ms": read_ms,
+        "cold_render_ms": cold_render_ms,
+        "render_ms": render_ms,
+        "unchanged_diff_ms": unchanged_ms,
+        "unchanged_devices": len(unchanged),
+        "changed_diff_ms": changed_ms,
+        "changed_devices": len(changed),
+        "budget_ms": budget_ms,
+        "over_budget": changed_ms > budget_ms,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check and benchmark the network-fabric intent renderer offline.")
+    parser.add_argument("--pairs", type=int, default=20, help="switch-pairs in the fabric")
+    parser.add_argument("--switches", type=int, default=10, help="standalone switches in the fabric")
+    parser.add_argument("--trunks", type=int, default=8, help="fabric-trunks per switch-pair/switch")
+    parser.add_argument("--members", type=int, default=2, help="member interfaces per fabric-trunk")
+    parser.add_argument("--vrfs", type=int, default=10, help="VRFs on the tenant")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs, the fastest is reported")
+    parser.add_argument("--budget-ms", type=float, default=DIFF_BUDGET_MS,
+                        help="milliseconds the diff of the changed revision may take")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="print the service log")
+    args = parser.parse_args(argv)
+
+    size = FabricSize(args.pairs, args.switches, args.trunks, args.members, args.vrfs)
+    r = run(size, repeat=args.repeat, budget_ms=args.budget_ms, verbose=args.verbose)
+
+    if args.json:
+        print(json.dumps(r, indent=2))
+        return 1 if r["drift"] or r["over_budget"] else 0
+
+    print(f"Fabric size: {size}  devices: {r['devices']}  sections: {r['sections']}")
+    print(f"  applies    create {r['create_applies']:>6d}  render {r['render_applies']:>6d}  drift {len(r['drift']):>4d}")
+    for line in r["drift"]:
+        print(f"    {line}")
+    print(f"  read      {r['read_ms']:>10.3f} ms")
+    print(f"  render    {r['cold_render_ms']:>10.3f} ms  cached {r['render_ms']:>10.3f} ms")
+    print(f"  unchanged {r['unchanged_diff_ms']:>10.3f} ms  devices changed {r['unchanged_devices']:>4d}")
+    print(f"  changed   {r['changed_diff_ms']:>10.3f} ms  devices changed {r['changed_devices']:>4d}")
+    if r["over_budget"]:
+        print(f"  changed diff over budget of {r['budget_ms']:.3f} ms")
+    return 1 if r["drift"] or r["over_budget"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
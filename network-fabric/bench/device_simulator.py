@@ -0,0 +1,478 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Recorded-output device simulator for the network-fabric test actions.
+
+DeviceSimulator.load() takes the same testbed data as genie.testbed.load and
+returns a testbed of SimulatedDevice objects. Each simulated device replays
+recorded parser output for the commands the test actions use (show vpc,
+show port-channel summary, show etherchannel summary, show spanning-tree
+detail, show feature, show vrf, show ip ospf vrf all) and the learned
+vrf/ospf models, sleeping for a configurable per-command latency with jitter to
+stand in for the device round trip.
+
+Plug it in with pyats_helpers.set_testbed_loader(simulator.load).
+
+Recordings can be generated from a synthetic fabric (recordings_from_fabric),
+saved to and loaded from JSON, or captured from real devices with capture().
+"""
+
+import copy
+import importlib.util
+import json
+import random
+import sys
+import threading
+import time
+import types
+
+# Default latency in seconds for each kind of device operation
+DEFAULT_LATENCY = {
+    "connect": 1.0,
+    "learn_hostname": 0.2,
+    "init_config": 0.4,
+    "disconnect": 0.1,
+    "execute": 0.05,
+    "parse": 0.3,
+    "learn": 1.0,
+}
+
+# Per-command latency overrides, in seconds
+DEFAULT_COMMAND_LATENCY = {
+    "show spanning-tree detail": 0.6,
+    "learn ospf": 1.5,
+}
+
+# Commands recorded for every simulated device, keyed by pyATS OS
+RECORDED_COMMANDS = {
+    "nxos": ["show vpc", "show port-channel summary", "show spanning-tree detail", "show feature",
+             "show vrf", "show ip ospf vrf all"],
+    "ios": ["show etherchannel summary", "show spanning-tree detail"],
+    "iosxe": ["show etherchannel summary", "show spanning-tree detail"],
+}
+RECORDED_FEATURES = {
+    "nxos": ["vrf", "ospf"],
+}
+
+# NSO platform names to pyATS OS, the same mapping create_pyats_device uses
+PLATFORM_OS = {
+    "ios": "ios",
+    "ios-xe": "iosxe",
+    "NX-OS": "nxos",
+}
+
+
+class SimulatorStats(object):
+    """Operation counters for a simulator, safe to update from worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.built = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.commands = 0
+        self.learns = 0
+        self.device_time = 0.0
+
+    def count(self, kind, seconds):
+        with self._lock:
+            if kind in ("learn_hostname", "init_config"):
+                # Part of the login
+                pass
+            elif kind == "connect":
+                self.connects += 1
+            elif kind == "disconnect":
+                self.disconnects += 1
+            elif kind == "learn":
+                self.learns += 1
+            else:
+                self.commands += 1
+            self.device_time += seconds
+
+    def as_dict(self):
+        return {
+            "built": self.built,
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "commands": self.commands,
+            "learns": self.learns,
+            "device_time_s": round(self.device_time, 3),
+        }
+
+
+class DeviceSettings(object):
+    """The pyATS device settings the package changes before disconnecting."""
+
+    GRACEFUL_DISCONNECT_WAIT_SEC = 1
+    POST_DISCONNECT_WAIT_SEC = 10
+
+
+class LearnedFeature(object):
+    """Stand-in for a Genie Ops object. Only .info is used by the tests."""
+
+    def __init__(self, info):
+        self.info = info
+
+
+def empty_output(command, device_name):
+    """The exception Genie raises when a command returns no output to parse."""
+
+    from genie.metaparser.util.exceptions import SchemaEmptyParserError
+
+    error = SchemaEmptyParserError({})
+    error.args = (f"Parser Output is empty: no recorded output for '{command}' on {device_name}",)
+    return error
+
+
+class SimulatedDevice(object):
+    """A pyATS device that replays recorded output."""
+
+    def __init__(self, simulator, name, data):
+        self.simulator = simulator
+        self.name = name
+        self.os = data.get("os")
+        self.custom = data.get("custom", {})
+        self.arguments = data.get("connections", {}).get("default", {}).get("arguments", {})
+        self.settings = DeviceSettings()
+        self.connected = False
+
+    def connect(self, learn_hostname=False, log_stdout=True, connection_timeout=None, **kwargs):
+        start = time.monotonic()
+
+        def time_left():
+            return None if connection_timeout is None else connection_timeout - (time.monotonic() - start)
+
+        self.simulator.delay("connect", "connect", device=self.name, timeout=time_left())
+        if self.name not in self.simulator.recordings:
+            raise ConnectionError(f"no recorded output for device {self.name}")
+        # Login round trips after authentication, like unicon's hostname discovery and init config commands
+        if learn_hostname:
+            self.simulator.delay("learn_hostname", "learn_hostname", device=self.name, timeout=time_left())
+        if self.arguments.get("init_config_commands", True):
+            self.simulator.delay("init_config", "init_config", device=self.name, timeout=time_left())
+        self.connected = True
+
+    def disconnect(self):
+        self.simulator.delay("disconnect", "disconnect")
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    def execute(self, command, timeout=None, **kwargs):
+        self._check_connected()
+        if not command:
+            # Session health check
+            self.simulator.delay("execute", command, device=self.name, timeout=timeout)
+            return ""
+        self.simulator.delay("parse", command, device=self.name, timeout=timeout)
+        return self.simulator.raw_output(self.name, command)
+
+    def parse(self, command, output=None, **kwargs):
+        if output is None:
+            self._check_connected()
+            self.simulator.delay("parse", command)
+        elif not output:
+            raise empty_output(command, self.name)
+        # With output provided only the (local) parser runs
+        return copy.deepcopy(self._recorded(command))
+
+    def learn(self, feature, **kwargs):
+        self._check_connected()
+        command = f"learn {feature}"
+        self.simulator.delay("learn", command)
+        return LearnedFeature(copy.deepcopy(self._recorded(command)))
+
+    def _check_connected(self):
+        if not self.connected:
+            raise ConnectionError(f"device {self.name} is not connected")
+
+    def _recorded(self, command):
+        try:
+            return self.simulator.recordings[self.name][command]
+        except KeyError:
+            # Genie raises SchemaEmptyParserError for empty output
+            raise empty_output(command, self.name)
+
+
+class SimulatedTestbed(object):
+    """A pyATS testbed holding SimulatedDevice objects."""
+
+    def __init__(self, name, devices):
+        self.name = name
+        self.devices = devices
+
+    def __repr__(self):
+        return f"<SimulatedTestbed {self.name} devices={list(self.devices)}>"
+
+
+class DeviceSimulator(object):
+    """
+    Replay recorded device output with simulated latency.
+
+    recordings      - dictionary of {device name: {command: parsed output}}. Learned
+                      features are recorded under "learn <feature>" with the .info dictionary.
+    latency         - seconds per operation kind, see DEFAULT_LATENCY
+    command_latency - seconds per command, overriding latency for that command
+    jitter          - fraction of the latency added or removed at random (0.1 = +/-10%)
+    scale           - multiplier applied to every latency, 0 disables sleeping
+    device_latency  - multiplier per device name, to simulate slow or unresponsive switches.
+                      An operation that would take longer than the timeout passed to
+                      connect()/execute() sleeps for the timeout and raises TimeoutError.
+    """
+
+    def __init__(self, recordings=None, latency=None, command_latency=None, jitter=0.1, scale=1.0, seed=None,
+                 device_latency=None):
+        self.recordings = recordings or {}
+        self.device_latency = device_latency or {}
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.command_latency = {**DEFAULT_COMMAND_LATENCY, **(command_latency or {})}
+        self.jitter = jitter
+        self.scale = scale
+        self.stats = SimulatorStats()
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def load(self, testbed_data):
+        """Testbed loader, called with the same data as genie.testbed.load."""
+
+        devices = {name: SimulatedDevice(self, name, data) for name, data in testbed_data.get("devices", {}).items()}
+        with self.stats._lock:
+            self.stats.built += len(devices)
+        return SimulatedTestbed(testbed_data["testbed"]["name"], devices)
+
+    def delay(self, kind, command, device=None, timeout=None):
+        """Sleep for the simulated latency of an operation, up to timeout seconds."""
+
+        base = self.command_latency.get(command, self.latency[kind]) * self.device_latency.get(device, 1)
+        with self._random_lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        seconds = max(0.0, base * factor * self.scale)
+        timed_out = timeout is not None and seconds > timeout
+        if timed_out:
+            seconds = max(0.0, timeout)
+        if seconds:
+            time.sleep(seconds)
+        self.stats.count(kind, seconds)
+        if timed_out:
+            raise TimeoutError(f"{kind} '{command}' on {device} timed out after {timeout:.1f} seconds")
+
+    def raw_output(self, device_name, command):
+        """
+        Stand-in for the CLI text of a recorded command, with a size in proportion to
+        the parsed output. Empty when nothing is recorded, like a command that fails.
+        """
+
+        recorded = self.recordings.get(device_name, {}).get(command)
+        if recorded is None:
+            return ""
+        return json.dumps(recorded, indent=4, default=str)
+
+    def save(self, path):
+        """Write the recordings to a JSON file."""
+
+        with open(path, "w") as f:
+            json.dump(self.recordings, f, indent=2, sort_keys=True)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Create a simulator from recordings in a JSON file."""
+
+        with open(path) as f:
+            recordings = json.load(f)
+        return cls(recordings, **kwargs)
+
+
+# -------------------------
+# recordings
+# -------------------------
+def member_interfaces(port_channel):
+    """Full member interface names configured on a fabric-trunk port-channel."""
+
+    for case in port_channel.member_interface:
+        if case != "network-fabric:member-interface" and len(port_channel.member_interface[case]) > 0:
+            interface_type = case.split(":")[1]
+            return [f"{interface_type}{interface}" for interface in port_channel.member_interface[case]]
+    return []
+
+
+def portchannel_summary(port_channels):
+    """Parsed port-channel / etherchannel summary with every member bundled (flag P)."""
+
+    interfaces = {}
+    for port_channel in port_channels:
+        interfaces[f"Port-channel{port_channel.name}"] = {
+            "bundle_id": int(port_channel.name),
+            "oper_status": "up",
+            "protocol": "lacp",
+            "members": {member: {"flags": "P"} for member in member_interfaces(port_channel)},
+        }
+    return {"interfaces": interfaces}
+
+
+def show_vpc(peerlink, trunks):
+    """Parsed show vpc for a healthy switch-pair member."""
+
+    peerlink_id = int(list(peerlink)[0].name)
+    return {
+        "vpc_domain_id": "10",
+        "vpc_peer_status": "peer adjacency formed ok",
+        "vpc_peer_keepalive_status": "peer is alive",
+        "peer_link": {
+            1: {
+                "peer_link_id": peerlink_id,
+                "peer_link_ifindex": f"Port-channel{peerlink_id}",
+                "peer_link_port_state": "up",
+            }
+        },
+        "num_of_vpcs": len(trunks),
+        "vpc": {
+            int(trunk.name): {
+                "vpc_id": int(trunk.name),
+                "vpc_ifindex": f"Port-channel{trunk.name}",
+                "vpc_port_state": "up",
+            } for trunk in trunks
+        },
+    }
+
+
+def show_spanning_tree_detail(is_root, vlans):
+    """Parsed show spanning-tree detail running rapid-pvst on vlans VLANs."""
+
+    vlan_details = {}
+    for vlan_id in range(1, vlans + 1):
+        details = {"vlan_id": vlan_id, "bridge_priority": 24576 if is_root else 32768}
+        if is_root:
+            details["root_of_the_spanning_tree"] = True
+        vlan_details[vlan_id] = details
+    return {"rapid_pvst": {"vlans": vlan_details}}
+
+
+def show_feature(features=("hsrp_engine", "interface-vlan", "ospf", "lacp", "vpc")):
+    """Parsed NX-OS show feature with the given features enabled."""
+
+    return {"feature": {feature: {"instance": {"1": {"state": "enabled"}}} for feature in features}}
+
+
+def recordings_from_fabric(root, service, tenants=(), stp_vlans=10):
+    """
+    Build recordings for every switch in a network-fabric matching its configured intent,
+    so a fabric test against the simulator passes. Tenant VRFs are recorded on the
+    layer3 switch-pair for each network-tenant in tenants.
+    """
+
+    recordings = {}
+    root_bridge_name = None
+    for case in service.spanning_tree.root:
+        if case != "network-fabric:choice-root" and service.spanning_tree.root[case]:
+            root_bridge_name = service.spanning_tree.root[case]
+
+    def stp(device_name):
+        return show_spanning_tree_detail(bool(root_bridge_name) and root_bridge_name in device_name, stp_vlans)
+
+    layer3_devices = []
+    for pair in service.switch_pair:
+        trunks = list(pair.fabric_trunk.port_channel)
+        peerlink = list(pair.multiswitch_peerlink.port_channel)
+        for switch in pair.switch:
+            recordings[switch.device] = {
+                "show vpc": show_vpc(peerlink, trunks),
+                "show port-channel summary": portchannel_summary(peerlink + trunks),
+                "show spanning-tree detail": stp(switch.device),
+                "show feature": show_feature(),
+                "learn vrf": {"vrfs": {"default": {}, "management": {}}},
+                "learn ospf": {"feature_ospf": True, "vrf": {"default": {}}},
+                "show vrf": {"vrfs": {
+                    "default": {"vrf_id": 1, "vrf_state": "Up", "reason": "--"},
+                    "management": {"vrf_id": 2, "vrf_state": "Up", "reason": "--"},
+                }},
+                "show ip ospf vrf all": {"vrf": {"default": {"address_family": {"ipv4": {"instance": {"1": {}}}}}}},
+            }
+            if pair.layer3:
+                layer3_devices.append(switch.device)
+
+    for switch in service.switch:
+        os = PLATFORM_OS.get(str(root.devices.device[switch.device].platform.name))
+        command = "show port-channel summary" if os == "nxos" else "show etherchannel summary"
+        recordings[switch.device] = {
+            command: portchannel_summary(switch.fabric_trunk.port_channel),
+            "show spanning-tree detail": stp(switch.device),
+        }
+
+    for tenant in tenants:
+        for vrf in tenant.layer3.vrf:
+            vrf_name = f"{tenant.name}_{vrf}"
+            for device_name in layer3_devices:
+                recordings[device_name]["learn vrf"]["vrfs"][vrf_name] = {"address_family": {"ipv4": {}}}
+                recordings[device_name]["learn ospf"]["vrf"][vrf_name] = {"address_family": {"ipv4": {}}}
+                recordings[device_name]["show vrf"]["vrfs"][vrf_name] = {"vrf_id": 3, "vrf_state": "Up", "reason": "--"}
+                recordings[device_name]["show ip ospf vrf all"]["vrf"][vrf_name] = {"address_family": {"ipv4": {"instance": {"1": {}}}}}
+
+    return recordings
+
+
+def capture(testbed, log=None):
+    """
+    Record the output of every recorded command from the connected devices of a real pyATS testbed.
+
+    Return dictionary of recordings for DeviceSimulator.
+    """
+
+    recordings = {}
+    for device_name, device in testbed.devices.items():
+        recordings[device_name] = {}
+        for command in RECORDED_COMMANDS.get(device.os, []):
+            try:
+                recordings[device_name][command] = device.parse(command)
+            except Exception as e:
+                if log: log.info(f"Unable to record '{command}' on {device_name}: {e}")
+        for feature in RECORDED_FEATURES.get(device.os, []):
+            try:
+                recordings[device_name][f"learn {feature}"] = device.learn(feature).info
+            except Exception as e:
+                if log: log.info(f"Unable to record 'learn {feature}' on {device_name}: {e}")
+    return recordings
+
+
+def install_genie():
+    """
+    Register placeholder genie, genie.testbed, genie.metaparser.util.exceptions and
+    unicon.core.errors modules in sys.modules when pyATS isn't installed. Their load()
+    refuses to run so a missing set_testbed_loader is obvious.
+    """
+
+    if "genie" in sys.modules or importlib.util.find_spec("genie") is not None:
+        return
+
+    def load(testbed_data):
+        raise RuntimeError("genie is not installed, use pyats_helpers.set_testbed_loader(simulator.load)")
+
+    class SchemaEmptyParserError(Exception):
+        def __init__(self, data, device_output=None):
+            super().__init__("Parser Output is empty")
+            self.data = data
+            self.device_output = device_output
+
+    class UniconTimeoutError(Exception):
+        pass
+
+    genie = types.ModuleType("genie")
+    testbed = types.ModuleType("genie.testbed")
+    testbed.load = load
+    genie.testbed = testbed
+    exceptions = types.ModuleType("genie.metaparser.util.exceptions")
+    exceptions.SchemaEmptyParserError = SchemaEmptyParserError
+    errors = types.ModuleType("unicon.core.errors")
+    errors.TimeoutError = UniconTimeoutError
+    sys.modules.update({
+        "genie": genie,
+        "genie.testbed": testbed,
+        "genie.metaparser": types.ModuleType("genie.metaparser"),
+        "genie.metaparser.util": types.ModuleType("genie.metaparser.util"),
+        "genie.metaparser.util.exceptions": exceptions,
+        "unicon": types.ModuleType("unicon"),
+        "unicon.core": types.ModuleType("unicon.core"),
+        "unicon.core.errors": errors,
+    })
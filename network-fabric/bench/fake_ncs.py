@@ -0,0 +1,429 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+In-memory stand-ins for the NSO Python API used by the network-fabric service code.
+
+The benchmarks drive FabricServiceCallbacks.cb_create and
+TenantServiceCallbacks.cb_create without a running NSO. install() registers
+fake ncs, _ncs and resource_manager modules in sys.modules so the package
+can be imported, and the classes below build a maagic-like tree that the
+service code can walk.
+
+Only what the package actually touches is implemented.
+"""
+
+import sys
+import types
+from contextlib import contextmanager
+
+
+class Counters(object):
+    """Operation counters shared by all fakes."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.template_applies = 0
+        self.device_reads = 0
+        self.id_requests = 0
+        self.oper_writes = 0
+        # (device, template) of every template applied, and (template, variables, context node path) of every apply
+        self.applied = set()
+        self.applies = []
+
+
+counters = Counters()
+
+
+# -------------------------
+# maagic tree
+# -------------------------
+class Node(object):
+    """A maagic container. Children are set as attributes."""
+
+    _path = ""
+
+    def __init__(self, _path="", **children):
+        self._path = _path
+        for name, value in children.items():
+            setattr(self, name, value)
+
+    def __getitem__(self, name):
+        # Maagic nodes also allow dictionary style access to children
+        return getattr(self, name)
+
+
+class LeafList(list):
+    """A maagic leaf-list."""
+
+
+class List(object):
+    """A maagic list, iterable in order and indexable by key."""
+
+    def __init__(self, _path="", entries=None, _key=None):
+        self._path = _path
+        self._key = _key
+        self._entries = {}
+        for key, entry in (entries or []):
+            self._entries[key] = entry
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, key):
+        return self._entries[key]
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __delitem__(self, key):
+        del self._entries[key]
+
+    def add(self, key, entry):
+        entry._path = f"{self._path}{{{key}}}"
+        self._entries[key] = entry
+        return entry
+
+    def create(self, key):
+        if key not in self._entries:
+            entry = self.add(key, OperNode())
+            if self._key:
+                entry._values[self._key] = key
+        return self._entries[key]
+
+    def delete(self):
+        self._entries = {}
+
+
+class KeylessList(list):
+    """A keyless list, like the error and details lists in action output."""
+
+    def __init__(self, entry_lists=()):
+        super().__init__()
+        self._entry_lists = entry_lists
+
+    def create(self):
+        # Entries get an empty keyless list for each name in entry_lists
+        entry = Node(**{name: KeylessList() for name in self._entry_lists})
+        self.append(entry)
+        return entry
+
+
+class Choice(object):
+    """
+    A container holding a YANG choice.
+
+    Iterating yields the choice name followed by every case child, the way
+    the package code walks member-interface and spanning-tree/root.
+    """
+
+    def __init__(self, choice, cases, _path=""):
+        self._path = _path
+        self._choice = choice
+        self._cases = cases
+
+    def __iter__(self):
+        yield self._choice
+        for case in self._cases:
+            yield case
+
+    def __getitem__(self, case):
+        if case == self._choice:
+            return None
+        return self._cases[case]
+
+    def __getattr__(self, name):
+        # Case children are also attributes, ie member_interface.Ethernet
+        cases = self.__dict__.get("_cases", {})
+        if f"network-fabric:{name}" not in cases:
+            raise AttributeError(name)
+        return cases[f"network-fabric:{name}"]
+
+
+class CountingNode(Node):
+    """A container whose attribute reads are counted as device reads."""
+
+    def __getattribute__(self, name):
+        if not name.startswith("_"):
+            counters.device_reads += 1
+        return object.__getattribute__(self, name)
+
+
+# Key leaf of the operational lists the package writes
+OPER_LIST_KEYS = {
+    "phase": "name",
+    "verified_device": "device",
+    "result": "id",
+}
+
+
+class OperNode(object):
+    """Operational data written by the package."""
+
+    def __init__(self):
+        self.__dict__["_values"] = {}
+        self.__dict__["_lists"] = {}
+
+    def __setattr__(self, name, value):
+        counters.oper_writes += 1
+        self._values[name] = value
+
+    def __getattr__(self, name):
+        if name in self._values:
+            return self._values[name]
+        if name not in OPER_LIST_KEYS:
+            # An unset leaf
+            return None
+        if name not in self._lists:
+            self._lists[name] = List(_key=OPER_LIST_KEYS[name])
+        return self._lists[name]
+
+    def __delattr__(self, name):
+        self._values.pop(name, None)
+
+
+def get_node(trans, path):
+    return trans.node(path)
+
+
+def get_root(trans):
+    return trans.root
+
+
+# -------------------------
+# templates
+# -------------------------
+class Variables(list):
+    """Template variables, stored quoted the way ncs.template.Variables does."""
+
+    def add(self, name, value):
+        self.append((name, f"'{value}'"))
+
+
+class Template(object):
+    def __init__(self, node, path=None):
+        self.node = node
+        self.path = path
+
+    def apply(self, name, vars=None, flags=0):
+        counters.template_applies += 1
+        variables = {var: value.strip("'") for var, value in (vars or [])}
+        counters.applies.append((name, variables, self.path))
+        if variables.get("DEVICE_NAME"):
+            counters.applied.add((variables["DEVICE_NAME"], name))
+
+
+# -------------------------
+# maapi
+# -------------------------
+# Operational data by path, shared by every transaction like CDB
+oper_data = {}
+
+
+def oper_node(path):
+    return oper_data.setdefault(path, OperNode())
+
+
+class OperTransaction(object):
+    def node(self, path):
+        return oper_node(path)
+
+    def apply(self):
+        pass
+
+
+@contextmanager
+def single_write_trans(user, context, db=None):
+    yield OperTransaction()
+
+
+# -------------------------
+# services and logging
+# -------------------------
+class Log(object):
+    """Logger accepting the ncs.log.Log calling convention."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+
+    def _log(self, *args):
+        if self.verbose:
+            print("".join(str(arg) for arg in args))
+
+    info = debug = warning = error = _log
+
+
+class Service(object):
+    def __init__(self, log=None):
+        self.log = log or Log()
+
+    @staticmethod
+    def create(fn):
+        return fn
+
+    @staticmethod
+    def pre_lock_create(fn):
+        return fn
+
+    @staticmethod
+    def pre_modification(fn):
+        return fn
+
+    @staticmethod
+    def post_modification(fn):
+        return fn
+
+
+class Action(object):
+    def __init__(self, log=None):
+        self.log = log or Log()
+
+    @staticmethod
+    def action(fn):
+        return fn
+
+
+class ActionOutput(object):
+    """Output of the network-fabric and network-tenant test and history actions."""
+
+    def __init__(self):
+        self.success = None
+        self.message = None
+        self.error = KeylessList()
+        self.details = KeylessList()
+        self.tenant = List(_key="name")
+        self.run = KeylessList(entry_lists=("error",))
+        self.device_run = KeylessList()
+
+
+class Application(object):
+    pass
+
+
+class NcsError(Exception):
+    """Stand-in for ncs.error.Error."""
+
+
+# -------------------------
+# resource-manager id allocator
+# -------------------------
+class IdAllocator(object):
+    """
+    Allocates ids from a counter. With pending=True every request is left
+    unallocated, matching the first FASTMAP pass of a new fabric.
+    """
+
+    def __init__(self):
+        self.pending = False
+        self.deferred = False
+        self.allocations = {}
+        self.requested = {}
+        self.next_id = 10
+
+    def id_request(self, service, svc_xpath, username, pool_name, allocation_name, sync_pool, requested_id=-1,
+                   redeploy_type="default", *args, **kwargs):
+        counters.id_requests += 1
+        key = (pool_name, allocation_name)
+        if self.deferred:
+            # Allocated by allocate_requested(), like the resource-manager does after the commit
+            self.requested[key] = redeploy_type
+        elif key not in self.allocations:
+            self.allocations[key] = self.next_id
+            self.next_id += 1
+
+    def id_read(self, username, root, pool_name, allocation_name):
+        if self.pending:
+            return None
+        return self.allocations.get((pool_name, allocation_name))
+
+    def allocate_requested(self, kicker=False):
+        """
+        Allocate every request not allocated yet, one at a time, as the resource-manager
+        does once the requesting transaction is committed. Each allocation requested with
+        the default redeploy type redeploys the requesting service. no-redeploy allocations
+        don't, a data kicker on the pool (kicker=True) redeploys the service once after
+        the last of them.
+
+        Return the number of redeploys of the requesting service triggered.
+        """
+
+        new = [key for key in self.requested if key not in self.allocations]
+        redeploys = 0
+        for key in sorted(new):
+            self.allocations[key] = self.next_id
+            self.next_id += 1
+            if self.requested[key] != "no-redeploy":
+                redeploys += 1
+        if kicker and any(self.requested[key] == "no-redeploy" for key in new):
+            redeploys += 1
+        self.requested = {}
+        return redeploys
+
+    def reset(self, deferred=False):
+        self.allocations = {}
+        self.requested = {}
+        self.deferred = deferred
+
+
+id_allocator = IdAllocator()
+
+
+def install():
+    """Register the fake modules in sys.modules."""
+
+    ncs = types.ModuleType("ncs")
+    ncs.OPERATIONAL = 2
+    ncs.RUNNING = 1
+
+    maagic = types.ModuleType("ncs.maagic")
+    maagic.LeafList = LeafList
+    maagic.get_node = get_node
+    maagic.get_root = get_root
+
+    template = types.ModuleType("ncs.template")
+    template.Template = Template
+    template.Variables = Variables
+
+    maapi = types.ModuleType("ncs.maapi")
+    maapi.single_write_trans = single_write_trans
+
+    application = types.ModuleType("ncs.application")
+    application.Service = Service
+    application.Application = Application
+
+    dp = types.ModuleType("ncs.dp")
+    dp.Action = Action
+
+    error = types.ModuleType("ncs.error")
+    error.Error = NcsError
+
+    ncs.maagic, ncs.template, ncs.maapi, ncs.application, ncs.dp, ncs.error = maagic, template, maapi, application, dp, error
+
+    _ncs = types.ModuleType("_ncs")
+    _ncs.decrypt = lambda value: value
+    _ncs_dp = types.ModuleType("_ncs.dp")
+    _ncs_dp.action_set_timeout = lambda uinfo, timeout: None
+    _ncs.dp = _ncs_dp
+
+    resource_manager = types.ModuleType("resource_manager")
+    allocator = types.ModuleType("resource_manager.id_allocator")
+    allocator.id_request = id_allocator.id_request
+    allocator.id_read = id_allocator.id_read
+    resource_manager.id_allocator = allocator
+
+    sys.modules.update({
+        "ncs": ncs,
+        "ncs.maagic": maagic,
+        "ncs.template": template,
+        "ncs.maapi": maapi,
+        "ncs.application": application,
+        "ncs.dp": dp,
+        "ncs.error": error,
+        "_ncs": _ncs,
+        "_ncs.dp": _ncs_dp,
+        "resource_manager": resource_manager,
+        "resource_manager.id_allocator": allocator,
+    })
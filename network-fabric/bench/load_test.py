@@ -0,0 +1,273 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Load test of network-fabric commit throughput at increasing fabric scale.
+
+For every scale step the payloads are generated (see payloads.py) and committed to a
+running NSO with ncs_load, measuring:
+
+    commit latency      - wall time of the ncs_load commit of the fabric, then of the tenants
+    converge time       - until the fabric's create metrics show no pending VPC Domain Id allocations
+    create time         - total-time and template-applies of the last create, from the
+                          operational metrics container of the service
+    Python VM RSS       - of the package's Python VM, before and after the commits
+
+Results are written as CSV, one row per step, to compare runs over time. The fabric
+and tenants are deleted after each step, the dummy devices are kept and reused.
+
+Run from the NSO runtime directory (or pass --ncs-run-dir) with ncs_load and ncs_cli on the PATH
+and the NSO Python API importable (source ncsrc):
+
+    python bench/load_test.py --steps 10:10,20:10,40:20,80:40 --csv load-test.csv
+
+--offline runs the same steps against the in-memory stand-in for NSO used by the other
+benchmarks (fake_ncs.py) instead, with the create time and RSS of this process, so the
+trend of the service code alone can be tracked where no NSO is available.
+"""
+
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import FabricSize
+from payloads import IOS_NED_ID, NX_NED_ID, write_payloads
+
+FIELDS = [
+    "timestamp", "mode", "pairs", "switches", "trunks", "members", "vrfs", "tenants", "devices",
+    "payload_kib", "fabric_commit_s", "fabric_converge_s", "fabric_create_ms", "fabric_template_applies",
+    "tenant_commit_s", "tenant_create_ms", "rss_before_kib", "rss_after_kib",
+]
+
+# Seconds to wait for the resource-manager to allocate the VPC Domain Ids of a new fabric
+CONVERGE_TIMEOUT = 300
+
+# Leaves read from the metrics container of a service
+METRICS_LEAVES = ["total-time", "template-applies", "pending-allocations", "converge-time", "converge-creates"]
+
+
+def parse_steps(steps):
+    """Scale steps from "pairs:switches,pairs:switches", ie "10:10,40:20"."""
+
+    parsed = []
+    for step in steps.split(","):
+        pairs, _, switches = step.partition(":")
+        parsed.append((int(pairs), int(switches or 0)))
+    return parsed
+
+
+def rss_kib(pid="self"):
+    """Resident set size of a process in KiB, or None if it can't be read."""
+
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def python_vm_pid(package="network-fabric"):
+    """Process id of the NSO Python VM running the package, or None if it isn't found on this host."""
+
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().split(b"\0")
+        except OSError:
+            continue
+        if any(b"ncs_pyvm" in arg for arg in cmdline) and package.encode() in cmdline:
+            return pid
+    return None
+
+
+class NsoRunner(object):
+    """Load payloads into a running NSO with the NSO command line tools, and read the create metrics back over MAAPI."""
+
+    def __init__(self, run_dir=None, username="admin"):
+        self.run_dir = run_dir
+        self.username = username
+
+    def _run(self, args, input=None):
+        result = subprocess.run(args, cwd=self.run_dir, input=input, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} failed: {result.stderr.strip() or result.stdout.strip()}")
+        return result.stdout
+
+    def load(self, path, operational=False):
+        """Merge a payload into NSO in one commit, return the wall time of the commit in seconds."""
+
+        args = ["ncs_load", "-u", self.username, "-lm"] + (["-O"] if operational else []) + [path]
+        start = time.perf_counter()
+        self._run(args)
+        return time.perf_counter() - start
+
+    def create_metrics(self, service_type, name):
+        """The metrics of the last create of a service as a dictionary of {leaf: text}, empty if it has none."""
+
+        import ncs
+
+        with ncs.maapi.single_read_trans(self.username, "system", db=ncs.OPERATIONAL) as t:
+            services = getattr(ncs.maagic.get_root(t), service_type.replace("-", "_"))
+            if name not in services:
+                return {}
+            metrics = services[name].metrics
+            values = {leaf: getattr(metrics, leaf.replace("-", "_")) for leaf in METRICS_LEAVES}
+            return {leaf: str(value) for leaf, value in values.items() if value is not None}
+
+    def wait_converged(self, service_type, name, timeout=CONVERGE_TIMEOUT):
+        """Wait until a service's last create had no pending allocations, return the seconds waited or None on timeout."""
+
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            if self.create_metrics(service_type, name).get("pending-allocations", "0") == "0":
+                return time.perf_counter() - start
+            time.sleep(0.5)
+        return None
+
+    def delete(self, paths):
+        """Delete configuration in one commit."""
+
+        commands = ["config"] + [f"no {path}" for path in paths] + ["commit", "end"]
+        self._run(["ncs_cli", "-u", self.username, "-C"], input="\n".join(commands) + "\n")
+
+
+def run_nso_step(runner, size, tenants, directory, fabric_name="bench", partitioned=False,
+                 nx_ned_id=NX_NED_ID, ios_ned_id=IOS_NED_ID, keep=False):
+    """Commit one scale step to NSO and measure it."""
+
+    written = write_payloads(size, directory, tenants=tenants, fabric_name=fabric_name, partitioned=partitioned,
+                             nx_ned_id=nx_ned_id, ios_ned_id=ios_ned_id)
+    runner.load(written["devices"][0])
+    runner.load(written["devices-oper"][0], operational=True)
+
+    pid = python_vm_pid()
+    row = {"rss_before_kib": rss_kib(pid) if pid else None}
+
+    row["fabric_commit_s"] = round(runner.load(written["fabric"][0]), 3)
+    converge = runner.wait_converged("network-fabric", fabric_name)
+    row["fabric_converge_s"] = round(converge, 3) if converge is not None else None
+    metrics = runner.create_metrics("network-fabric", fabric_name)
+    row["fabric_create_ms"] = metrics.get("total-time")
+    row["fabric_template_applies"] = metrics.get("template-applies")
+
+    if tenants:
+        row["tenant_commit_s"] = round(runner.load(written["tenants"][0]), 3)
+        row["tenant_create_ms"] = runner.create_metrics("network-tenant", "tenant000").get("total-time")
+
+    row["rss_after_kib"] = rss_kib(pid) if pid else None
+    row["payload_kib"] = round(sum(length for _, length in written.values()) / 1024, 1)
+
+    if not keep:
+        runner.delete([f"network-tenant tenant{t:03d}" for t in range(tenants)] + [f"network-fabric {fabric_name}"])
+    return row
+
+
+def run_offline_step(size, tenants, partitioned=False):
+    """Measure one scale step against the in-memory stand-in for NSO (see bench_create.py)."""
+
+    import fake_ncs
+    fake_ncs.install()
+    import bench_create
+    from synthetic import build_fabric, build_tenants
+    from network_fabric.fabric_create import FabricServiceCallbacks, FabricPartitionCallbacks
+    from network_fabric.tenant_create import TenantServiceCallbacks
+
+    log = fake_ncs.Log()
+    tctx = bench_create.TransContext()
+    root, fabric = build_fabric(size)
+    fabric_tenants = build_tenants(size, root, tenants)
+    fabric.partitioned = partitioned
+
+    fabric_callbacks = FabricServiceCallbacks(log=log)
+    partition_callbacks = FabricPartitionCallbacks(log=log)
+    tenant_callbacks = TenantServiceCallbacks(log=log)
+    deployed = {}
+
+    def fabric_create():
+        if partitioned:
+            bench_create.deploy_partitioned(tctx, root, fabric, fabric_callbacks, partition_callbacks, deployed)
+        else:
+            fabric_callbacks.cb_create(tctx, root, fabric, None)
+
+    # There's no commit, the converge time is the create time until every allocation is ready
+    row = {"rss_before_kib": rss_kib()}
+    convergence = bench_create.converge(fabric_create)
+    row["fabric_converge_s"] = round(convergence["total_ms"] / 1000, 3)
+
+    # A full deploy, every partition of a partitioned fabric is created
+    fabric_metrics = bench_create.measure(lambda: (deployed.clear(), fabric_create()), 1)
+    row["fabric_create_ms"] = fabric_metrics["min_ms"]
+    row["fabric_template_applies"] = fabric_metrics["template_applies"]
+    if fabric_tenants:
+        row["tenant_create_ms"] = bench_create.measure(lambda: [tenant_callbacks.cb_create(tctx, root, tenant, None) for tenant in fabric_tenants], 1)["min_ms"]
+    row["rss_after_kib"] = rss_kib()
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test network-fabric commits at increasing scale, results as CSV.")
+    parser.add_argument("--steps", default="2:2,10:10,20:10,40:20", help="scale steps as pairs:switches, comma separated")
+    parser.add_argument("--trunks", type=int, default=8, help="fabric-trunks per switch-pair/switch")
+    parser.add_argument("--members", type=int, default=2, help="member interfaces per fabric-trunk")
+    parser.add_argument("--vrfs", type=int, default=10, help="VRFs on each tenant")
+    parser.add_argument("--tenants", type=int, default=1, help="network-tenants on the fabric")
+    parser.add_argument("--partitioned", action="store_true", help="deploy the fabric as network-fabric-partitions")
+    parser.add_argument("--offline", action="store_true", help="measure against the in-memory stand-in for NSO")
+    parser.add_argument("--ncs-run-dir", help="NSO runtime directory to run ncs_load and ncs_cli in")
+    parser.add_argument("--username", default="admin", help="NSO user to commit as")
+    parser.add_argument("--nx-ned-id", default=NX_NED_ID, help="NED id of the NX-OS dummy devices")
+    parser.add_argument("--ios-ned-id", default=IOS_NED_ID, help="NED id of the IOS dummy devices")
+    parser.add_argument("--payloads", help="directory to keep the generated payloads in (default a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="leave the last step's fabric and tenants in NSO")
+    parser.add_argument("--max-commit", type=float, help="stop once a fabric commit takes longer than this many seconds")
+    parser.add_argument("--csv", help="CSV file to append the results to (default standard output)")
+    args = parser.parse_args(argv)
+
+    steps = parse_steps(args.steps)
+    runner = NsoRunner(args.ncs_run_dir, args.username)
+    payload_dir = args.payloads or tempfile.mkdtemp(prefix="network-fabric-load-")
+
+    exists = args.csv and os.path.exists(args.csv) and os.path.getsize(args.csv) > 0
+    output = open(args.csv, "a", newline="") if args.csv else sys.stdout
+    writer = csv.DictWriter(output, fieldnames=FIELDS)
+    if not exists:
+        writer.writeheader()
+
+    try:
+        for i, (pairs, switches) in enumerate(steps):
+            size = FabricSize(pairs, switches, args.trunks, args.members, args.vrfs)
+            if args.offline:
+                row = run_offline_step(size, args.tenants, partitioned=args.partitioned)
+            else:
+                row = run_nso_step(runner, size, args.tenants, os.path.join(payload_dir, f"step-{pairs}-{switches}"),
+                                   partitioned=args.partitioned, nx_ned_id=args.nx_ned_id, ios_ned_id=args.ios_ned_id,
+                                   keep=args.keep and i == len(steps) - 1)
+
+            row.update({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "mode": ("offline" if args.offline else "nso") + ("-partitioned" if args.partitioned else ""),
+                "pairs": pairs, "switches": switches, "trunks": args.trunks, "members": args.members,
+                "vrfs": args.vrfs, "tenants": args.tenants, "devices": pairs * 2 + switches,
+            })
+            writer.writerow(row)
+            output.flush()
+
+            if args.max_commit and (row.get("fabric_commit_s") or 0) > args.max_commit:
+                print(f"Stopping at {pairs}:{switches}, the fabric commit took {row['fabric_commit_s']} s", file=sys.stderr)
+                break
+    finally:
+        if args.csv:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Generator of network-fabric, network-tenant and device payloads at a given scale,
+for loading into a real NSO with ncs_load (see load_test.py).
+
+Writes, for a FabricSize:
+
+    devices.xml       - netsim-style dummy devices like test/internal/lux/service/dummy-device.xml,
+                        southbound-locked, with the NED ids and NX-OS management addresses
+                        the network-fabric YANG constraints and create need
+    devices-oper.xml  - the platform details NSO normally learns on sync-from,
+                        load with ncs_load -O -lm
+    fabric.xml        - a network-fabric, same topology as the offline benchmarks (synthetic.py)
+    tenants.xml       - layer3 network-tenants on the fabric
+
+The payloads follow src/yang: port-channel and interface names match their patterns,
+member interfaces are unique per switch and there are at most MAX_MEMBER_INTERFACES
+members per port-channel.
+
+Example, 40 switch-pairs and 20 switches:
+
+    python bench/payloads.py --pairs 40 --switches 20 --output /tmp/fabric-40
+"""
+
+import argparse
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import FabricSize, NX_OS_PLATFORM, member_interfaces, mgmt_address, switch_platform
+
+CONFIG_NS = "http://tail-f.com/ns/config/1.0"
+NCS_NS = "http://tail-f.com/ns/ncs"
+FABRIC_NS = "http://learning.cisco.com/network-fabric"
+TENANT_NS = "http://learning.cisco.com/network-tenant"
+NX_NED_NS = "http://tail-f.com/ned/cisco-nx"
+
+# NED ids the dummy devices are given, override to match the NEDs loaded in NSO
+NX_NED_ID = "cisco-nx-cli-5.23"
+IOS_NED_ID = "cisco-ios-cli-6.91"
+
+# max-elements of the member-interface leaf-lists
+MAX_MEMBER_INTERFACES = 8
+
+
+class FabricDevice(object):
+    """A switch of the generated fabric."""
+
+    def __init__(self, name, platform, interface_type, mgmt_ip):
+        self.name = name
+        self.platform = platform
+        self.interface_type = interface_type
+        self.mgmt_ip = mgmt_ip
+
+
+def fabric_devices(size):
+    """
+    The switches of a fabric of the given size, named and addressed like synthetic.build_fabric.
+
+    Return tuple with (dictionary of {switch-pair name: [FabricDevice, FabricDevice]}, list of standalone FabricDevice)
+    """
+
+    address = 0
+    pairs = {}
+    for p in range(size.pairs):
+        pair_name = f"pair{p:03d}"
+        pairs[pair_name] = []
+        for s in range(2):
+            address += 1
+            pairs[pair_name].append(FabricDevice(f"{pair_name}-{s + 1:02d}", NX_OS_PLATFORM, "Ethernet", mgmt_address(address)))
+
+    switches = []
+    for s in range(size.switches):
+        address += 1
+        platform, interface_type = switch_platform(s)
+        switches.append(FabricDevice(f"switch{s:03d}", platform, interface_type, mgmt_address(address)))
+
+    return (pairs, switches)
+
+
+def _leaf(parent, name, value):
+    element = ET.SubElement(parent, name)
+    element.text = str(value)
+    return element
+
+
+def _document(root_tag, namespace):
+    config = ET.Element("config", xmlns=CONFIG_NS)
+    return config, ET.SubElement(config, root_tag, xmlns=namespace)
+
+
+def _write(config, path):
+    ET.indent(config)
+    ET.ElementTree(config).write(path, encoding="unicode", xml_declaration=False)
+    return os.path.getsize(path)
+
+
+def devices_xml(size, nx_ned_id=NX_NED_ID, ios_ned_id=IOS_NED_ID):
+    """Dummy device definitions, southbound-locked so commits only exercise NSO and the service code."""
+
+    config, devices = _document("devices", NCS_NS)
+    pairs, switches = fabric_devices(size)
+    for fabric_device in [d for pair in pairs.values() for d in pair] + switches:
+        nxos = fabric_device.platform == NX_OS_PLATFORM
+        ned_id = nx_ned_id if nxos else ios_ned_id
+
+        device = ET.SubElement(devices, "device")
+        _leaf(device, "name", fabric_device.name)
+        _leaf(device, "address", fabric_device.mgmt_ip)
+        _leaf(device, "authgroup", "default")
+        cli = ET.SubElement(ET.SubElement(device, "device-type"), "cli")
+        _leaf(cli, "ned-id", f"{ned_id}:{ned_id}").set(f"xmlns:{ned_id}", f"http://tail-f.com/ns/ned-id/{ned_id}")
+        _leaf(ET.SubElement(device, "state"), "admin-state", "southbound-locked")
+
+        # The VPC peer-keepalive is sourced from the NX-OS management interface
+        if nxos:
+            interface = ET.SubElement(ET.SubElement(device, "config"), "interface", xmlns=NX_NED_NS)
+            mgmt = ET.SubElement(interface, "mgmt")
+            _leaf(mgmt, "name", "0")
+            _leaf(ET.SubElement(ET.SubElement(mgmt, "ip"), "address"), "ipaddr", f"{fabric_device.mgmt_ip}/24")
+
+    return config
+
+
+def devices_oper_xml(size):
+    """Platform details of the dummy devices, as NSO would learn them from the switches."""
+
+    config, devices = _document("devices", NCS_NS)
+    pairs, switches = fabric_devices(size)
+    for fabric_device in [d for pair in pairs.values() for d in pair] + switches:
+        device = ET.SubElement(devices, "device")
+        _leaf(device, "name", fabric_device.name)
+        platform = ET.SubElement(device, "platform")
+        for leaf, value in zip(["name", "model", "version"], fabric_device.platform):
+            _leaf(platform, leaf, value)
+
+    return config
+
+
+def _port_channels(parent, trunks, members, interface_type, first_id=11, first_interface=3, peer=None):
+    for t in range(trunks):
+        port_channel = ET.SubElement(parent, "port-channel")
+        _leaf(port_channel, "name", first_id + t)
+        if first_id != 1:
+            _leaf(port_channel, "description", f"Synthetic trunk {first_id + t}")
+        if peer:
+            peer_type, peer_name = peer(t)
+            _leaf(ET.SubElement(port_channel, "fabric-peer"), peer_type, peer_name)
+        member_interface = ET.SubElement(port_channel, "member-interface")
+        for interface in member_interfaces(t, members, first_interface):
+            _leaf(member_interface, interface_type, interface)
+
+
+def fabric_xml(size, fabric_name="bench", partitioned=False):
+    """
+    A network-fabric of the given size. The first switch-pair is the layer3 pair and spanning-tree root,
+    its trunks peer with the other switch-pairs and every other trunk peers with it.
+    """
+
+    if size.members > MAX_MEMBER_INTERFACES:
+        raise ValueError(f"At most {MAX_MEMBER_INTERFACES} member interfaces per port-channel, not {size.members}")
+
+    config, fabric = _document("network-fabric", FABRIC_NS)
+    pairs, switches = fabric_devices(size)
+    pair_names = list(pairs)
+
+    _leaf(fabric, "name", fabric_name)
+    _leaf(fabric, "description", "Synthetic load test fabric")
+    if partitioned:
+        _leaf(fabric, "partitioned", "true")
+
+    root = ET.SubElement(ET.SubElement(fabric, "spanning-tree"), "root")
+    if pair_names:
+        _leaf(root, "switch-pair", pair_names[0])
+    elif switches:
+        _leaf(root, "switch", switches[0].name)
+
+    def peer(pair_name):
+        if not pair_names:
+            return None
+        if pair_name != pair_names[0]:
+            return lambda t: ("switch-pair", pair_names[0])
+        if len(pair_names) > 1:
+            return lambda t: ("switch-pair", pair_names[1 + t % (len(pair_names) - 1)])
+        return None
+
+    for p, (pair_name, members) in enumerate(pairs.items()):
+        pair = ET.SubElement(fabric, "switch-pair")
+        _leaf(pair, "name", pair_name)
+        for member in members:
+            _leaf(ET.SubElement(pair, "switch"), "device", member.name)
+        _leaf(pair, "layer3", str(p == 0).lower())
+        _port_channels(ET.SubElement(pair, "multiswitch-peerlink"), 1, 2, "Ethernet", first_id=1, first_interface=1)
+        _port_channels(ET.SubElement(pair, "fabric-trunk"), size.trunks, size.members, "Ethernet", peer=peer(pair_name))
+
+    for switch in switches:
+        element = ET.SubElement(fabric, "switch")
+        _leaf(element, "device", switch.name)
+        _leaf(element, "description", "Synthetic switch")
+        _port_channels(ET.SubElement(element, "fabric-trunk"), size.trunks, size.members, switch.interface_type,
+                       peer=peer(None) if pair_names else None)
+
+    return config
+
+
+def tenants_xml(size, count, fabric_name="bench"):
+    """count layer3 network-tenants with size.vrfs VRFs each."""
+
+    config = ET.Element("config", xmlns=CONFIG_NS)
+    for t in range(count):
+        tenant = ET.SubElement(config, "network-tenant", xmlns=TENANT_NS)
+        _leaf(tenant, "name", f"tenant{t:03d}")
+        _leaf(tenant, "fabric", fabric_name)
+        layer3 = ET.SubElement(tenant, "layer3")
+        _leaf(layer3, "enabled", "true")
+        for v in range(size.vrfs):
+            _leaf(layer3, "vrf", f"vrf{v:03d}")
+
+    return config
+
+
+def write_payloads(size, directory, tenants=1, fabric_name="bench", partitioned=False,
+                   nx_ned_id=NX_NED_ID, ios_ned_id=IOS_NED_ID):
+    """
+    Write the payloads for a fabric size to a directory.
+
+    Return dictionary of {payload: (path, size in bytes)}
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    payloads = {
+        "devices": devices_xml(size, nx_ned_id, ios_ned_id),
+        "devices-oper": devices_oper_xml(size),
+        "fabric": fabric_xml(size, fabric_name, partitioned),
+        "tenants": tenants_xml(size, tenants, fabric_name),
+    }
+
+    written = {}
+    for name, config in payloads.items():
+        path = os.path.join(directory, f"{name}.xml")
+        written[name] = (path, _write(config, path))
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate network-fabric, network-tenant and dummy device payloads.")
+    parser.add_argument("--pairs", type=int, default=10, help="switch-pairs in the fabric")
+    parser.add_argument("--switches", type=int, default=10, help="standalone switches in the fabric")
+    parser.add_argument("--trunks", type=int, default=8, help="fabric-trunks per switch-pair/switch")
+    parser.add_argument("--members", type=int, default=2, help=f"member interfaces per fabric-trunk, at most {MAX_MEMBER_INTERFACES}")
+    parser.add_argument("--vrfs", type=int, default=10, help="VRFs on each tenant")
+    parser.add_argument("--tenants", type=int, default=1, help="network-tenants on the fabric")
+    parser.add_argument("--fabric", default="bench", help="network-fabric name")
+    parser.add_argument("--partitioned", action="store_true", help="deploy the fabric as network-fabric-partitions")
+    parser.add_argument("--nx-ned-id", default=NX_NED_ID, help="NED id of the NX-OS dummy devices")
+    parser.add_argument("--ios-ned-id", default=IOS_NED_ID, help="NED id of the IOS dummy devices")
+    parser.add_argument("--output", default=".", help="directory to write the payloads to")
+    args = parser.parse_args(argv)
+
+    size = FabricSize(args.pairs, args.switches, args.trunks, args.members, args.vrfs)
+    written = write_payloads(size, args.output, tenants=args.tenants, fabric_name=args.fabric,
+                             partitioned=args.partitioned, nx_ned_id=args.nx_ned_id, ios_ned_id=args.ios_ned_id)
+    for name, (path, length) in written.items():
+        print(f"  {name:12s} {length / 1024:>10.1f} KiB  {path}")
+
+
+if __name__ == "__main__":
+    main()
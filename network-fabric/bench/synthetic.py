@@ -0,0 +1,191 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Synthetic network-fabric and network-tenant instances built on the fake maagic tree.
+"""
+
+from fake_ncs import Node, List, LeafList, Choice, CountingNode, oper_data, oper_node
+
+NX_MEMBER_CASES = ["Ethernet"]
+IOS_MEMBER_CASES = ["GigabitEthernet", "TenGigabitEthernet", "FortyGigabitEthernet",
+                    "HundredGigE", "TwentyFiveGigE", "TwoGigabitEthernet"]
+
+# (name, model, version) of the synthetic switches. Switch-pairs are Nexus,
+# standalone switches alternate between Catalyst and Nexus
+NX_OS_PLATFORM = ("NX-OS", "N9K-C93180YC-EX", "9.3(7)")
+IOS_PLATFORM = ("ios", "C3850", "15.2(7)E3")
+
+
+class FabricSize(object):
+    """
+    Size of a synthetic fabric.
+
+    pairs       - number of switch-pairs (NX-OS)
+    switches    - number of standalone switches (alternating IOS and NX-OS)
+    trunks      - fabric-trunk port-channels per switch-pair / switch
+    members     - member interfaces per fabric-trunk
+    vrfs        - VRFs on the synthetic tenant
+    """
+
+    def __init__(self, pairs=2, switches=2, trunks=4, members=2, vrfs=4):
+        self.pairs = pairs
+        self.switches = switches
+        self.trunks = trunks
+        self.members = members
+        self.vrfs = vrfs
+
+    def __str__(self):
+        return (f"pairs={self.pairs} switches={self.switches} trunks={self.trunks} "
+                f"members={self.members} vrfs={self.vrfs}")
+
+
+def switch_platform(index):
+    """Tuple with (platform, member interface type) of a standalone switch."""
+
+    if index % 2 == 0:
+        return (IOS_PLATFORM, "GigabitEthernet")
+    return (NX_OS_PLATFORM, "Ethernet")
+
+
+def mgmt_address(index):
+    """Management address of the index'th synthetic device."""
+
+    return f"10.{index // 65536}.{(index // 256) % 256}.{index % 256}"
+
+
+def member_interfaces(trunk_index, members, first_interface=3):
+    """
+    Member interfaces of a port-channel, consecutive from 1/first_interface. Fabric-trunks
+    start at 1/3 so they never overlap the peerlink on 1/1 and 1/2.
+    """
+
+    return [f"1/{first_interface + trunk_index * members + m}" for m in range(members)]
+
+
+def member_interface(interface_type, interfaces, path):
+    """A member-interface choice container with one populated case."""
+
+    cases = {f"network-fabric:{case}": LeafList() for case in NX_MEMBER_CASES + IOS_MEMBER_CASES}
+    cases[f"network-fabric:{interface_type}"] = LeafList(interfaces)
+    return Choice("network-fabric:member-interface", cases, _path=f"{path}/member-interface")
+
+
+def port_channel_list(path, trunks, members, interface_type, first_id=11, first_interface=3):
+    port_channels = List(_path=f"{path}/port-channel")
+    for t in range(trunks):
+        name = str(first_id + t)
+        interfaces = member_interfaces(t, members, first_interface)
+        trunk = Node(name=name, description=f"Synthetic trunk {name}")
+        port_channels.add(name, trunk)
+        trunk.member_interface = member_interface(interface_type, interfaces, trunk._path)
+        trunk.fabric_peer = Node()
+    return port_channels
+
+
+def device(name, platform_name, model, version, mgmt_ip):
+    """An NSO device entry with platform details, SSH connection details and an NX-OS style mgmt interface."""
+
+    platform = CountingNode(name=platform_name, model=model, version=version)
+    address = CountingNode(ipaddr=f"{mgmt_ip}/24")
+    mgmt = {"0": Node(ip=Node(address=address))}
+    return CountingNode(
+        name=name,
+        address=mgmt_ip,
+        port=None,
+        authgroup="default",
+        state=Node(last_transaction_id="1"),
+        device_type=Node(cli=Node(protocol="ssh")),
+        platform=platform,
+        config=Node(hostname=name, interface=Node(mgmt=mgmt)),
+    )
+
+
+def build_fabric(size, fabric_name="bench"):
+    """
+    Build a synthetic fabric.
+
+    Return tuple with (root, service) fake maagic nodes.
+    """
+
+    path = f"/network-fabric:network-fabric{{{fabric_name}}}"
+    devices = List(_path="/ncs:devices/device")
+    service = Node(_path=path, name=fabric_name, description="Synthetic benchmark fabric")
+    service.partitioned = False
+    # Operational data from earlier runs on a fabric of the same name doesn't apply to this one
+    oper_data.pop(f"{path}/test", None)
+    service.test = oper_node(f"{path}/test")
+    service.test.fast_connect = False
+    service.fabric_interconnect = List()
+    service.vcenter = List()
+
+    address = 0
+
+    def next_ip():
+        nonlocal address
+        address += 1
+        return mgmt_address(address)
+
+    service.switch_pair = List(_path=f"{path}/switch-pair")
+    for p in range(size.pairs):
+        pair_name = f"pair{p:03d}"
+        pair = Node(name=pair_name, layer3=(p == 0))
+        service.switch_pair.add(pair_name, pair)
+
+        pair.switch = List(_path=f"{pair._path}/switch")
+        for s in range(2):
+            device_name = f"{pair_name}-{s + 1:02d}"
+            pair.switch.add(device_name, Node(device=device_name))
+            devices.add(device_name, device(device_name, *NX_OS_PLATFORM, next_ip()))
+
+        peerlink_path = f"{pair._path}/multiswitch-peerlink"
+        pair.multiswitch_peerlink = Node(_path=peerlink_path)
+        pair.multiswitch_peerlink.port_channel = port_channel_list(peerlink_path, 1, 2, "Ethernet", first_id=1, first_interface=1)
+        trunk_path = f"{pair._path}/fabric-trunk"
+        pair.fabric_trunk = Node(_path=trunk_path)
+        pair.fabric_trunk.port_channel = port_channel_list(trunk_path, size.trunks, size.members, "Ethernet")
+
+    service.switch = List(_path=f"{path}/switch")
+    for s in range(size.switches):
+        device_name = f"switch{s:03d}"
+        switch = Node(device=device_name, description="Synthetic switch")
+        service.switch.add(device_name, switch)
+
+        platform, interface_type = switch_platform(s)
+        devices.add(device_name, device(device_name, *platform, next_ip()))
+
+        trunk_path = f"{switch._path}/fabric-trunk"
+        switch.fabric_trunk = Node(_path=trunk_path)
+        switch.fabric_trunk.port_channel = port_channel_list(trunk_path, size.trunks, size.members, interface_type)
+
+    # Spanning-Tree root is the first switch-pair, or the first switch if there are no pairs
+    root_cases = {"network-fabric:switch-pair": None, "network-fabric:switch": None}
+    if size.pairs:
+        root_cases["network-fabric:switch-pair"] = "pair000"
+    elif size.switches:
+        root_cases["network-fabric:switch"] = "switch000"
+    service.spanning_tree = Node(root=Choice("network-fabric:choice-root", root_cases))
+
+    fabrics = List(_path="/network-fabric:network-fabric")
+    fabrics.add(fabric_name, service)
+    authgroups = Node(group={"default": Node(default_map=Node(remote_name="admin", remote_password="admin"))})
+    root = Node(devices=Node(device=devices, authgroups=authgroups), network_fabric=fabrics,
+                network_fabric_metrics=Node(log_enabled=False))
+
+    return (root, service)
+
+
+def build_tenant(size, root, fabric_name="bench", tenant_name="tenant"):
+    """Build a synthetic layer3 tenant with size.vrfs VRFs on an existing fabric."""
+
+    if not hasattr(root, "network_tenant"):
+        root.network_tenant = List(_path="/network-tenant:network-tenant")
+
+    tenant = Node(name=tenant_name, fabric=fabric_name)
+    root.network_tenant.add(tenant_name, tenant)
+    tenant.layer3 = Node(enabled=True, vrf=LeafList(f"vrf{v:03d}" for v in range(size.vrfs)))
+    return tenant
+
+
+def build_tenants(size, root, count, fabric_name="bench"):
+    """Build count synthetic layer3 tenants on an existing fabric."""
+
+    return [build_tenant(size, root, fabric_name, tenant_name=f"tenant{t:03d}") for t in range(count)]
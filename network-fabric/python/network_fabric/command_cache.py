@@ -0,0 +1,235 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Per-run cache of parsed and learned device output used by the test actions.
+"""
+
+import threading
+import time
+
+
+class CacheUsage(object):
+    """Device round trips, time spent waiting on devices and bytes of output received."""
+
+    def __init__(self, commands=0, device_time=0.0, bytes_received=0):
+        self.commands = commands
+        self.device_time = device_time
+        self.bytes_received = bytes_received
+
+    def __sub__(self, other):
+        return CacheUsage(
+            self.commands - other.commands, 
+            self.device_time - other.device_time, 
+            self.bytes_received - other.bytes_received,
+        )
+
+    def __str__(self):
+        return f"{self.commands} commands, {self.device_time * 1000:.0f} ms device time, {self.bytes_received} bytes received"
+
+
+class CommandCache(object):
+    """
+    Cache of device.parse() and device.learn() results keyed by (device, command).
+
+    A cache is created for a single test action run so that every command is
+    only sent to a device once, no matter how many tests need its output.
+    Failed commands are remembered as well so a broken command isn't retried
+    by every test that depends on it.
+
+    The time spent on each miss and the size of command output received are
+    totalled so tests can report what they cost (see usage()).
+
+    With a SnapshotStore, parsed output is also shared with tests of other services:
+    a miss is first looked up in the store, which gives source (the test this cache
+    is for, ie "/network-tenant{t1}/test/tenant") each snapshot of another test only
+    once, and share() adds
+    the parsed output of the devices that passed their checks once the test is done.
+    versions maps device names to the version (last transaction id) snapshots
+    of the device must match, see verification_state.device_versions().
+    """
+
+    def __init__(self, snapshots=None, versions=None, source=None):
+        self.hits = 0
+        self.misses = 0
+        self.snapshot_hits = 0
+        self.device_time = 0.0
+        self.bytes_received = 0
+        self.snapshots = snapshots
+        self.versions = versions or {}
+        self.source = source
+        self._entries = {}
+        self._restored = set()
+        self._from_snapshots = set()
+        self._lock = threading.Lock()
+
+    def parse(self, device, command, timeout=None):
+        """
+        Return the parsed output of a command, running it on the device only on a miss.
+
+        timeout limits the seconds the device may take to return the command output.
+        """
+
+        return self._lookup(device, command, lambda: self._execute_parse(device, command, timeout))
+
+    def learn(self, device, feature):
+        """Return the learned Genie Ops object for a feature, learning it only on a miss."""
+
+        def run():
+            start = time.perf_counter()
+            try:
+                return device.learn(feature)
+            finally:
+                # A learn runs several commands internally, only its time can be measured
+                self._count(time.perf_counter() - start, 0)
+
+        return self._lookup(device, f"learn {feature}", run)
+
+    def restore(self, device_name, command):
+        """
+        Load the output of a command on a device from the snapshot store into the cache.
+
+        Return True if the command output is cached for the device afterwards, so it
+        doesn't need to be run.
+        """
+
+        if self.contains(device_name, command):
+            return True
+        if self.snapshots is None or command.startswith("learn "):
+            return False
+
+        # Each command is looked up in the store once per run
+        with self._lock:
+            if (device_name, command) in self._restored:
+                return False
+            self._restored.add((device_name, command))
+
+        output = self.snapshots.get(device_name, command, self.versions.get(device_name), source=self.source)
+        if output is None:
+            return False
+
+        with self._lock:
+            self._entries.setdefault((device_name, command), (output, None))
+            self._from_snapshots.add((device_name, command))
+            self.snapshot_hits += 1
+        return True
+
+    def usage(self):
+        """Snapshot of the device usage of the cache so far, subtract two to get the usage in between."""
+
+        with self._lock:
+            return CacheUsage(self.misses, self.device_time, self.bytes_received)
+
+    def _execute_parse(self, device, command, timeout=None):
+        """Run a command and parse its output, measuring the round trip and output size."""
+
+        start = time.perf_counter()
+        output = ""
+        try:
+            output = device.execute(command, timeout=timeout) if timeout else device.execute(command)
+        finally:
+            self._count(time.perf_counter() - start, len(output.encode()) if output else 0)
+
+        return device.parse(command, output=output)
+
+    def _count(self, elapsed, size):
+        with self._lock:
+            self.device_time += elapsed
+            self.bytes_received += size
+
+    def contains(self, device_name, command):
+        """True if a successful result for the command is cached for the device."""
+
+        entry = self._entries.get((device_name, command))
+        return entry is not None and entry[1] is None
+
+    def attempted(self, device_name, command):
+        """True if the command was run on the device, whether it succeeded or not."""
+
+        return (device_name, command) in self._entries
+
+    def failure(self, device_name, command):
+        """The exception the command raised on the device, or None if it succeeded or wasn't run."""
+
+        entry = self._entries.get((device_name, command))
+        return entry[1] if entry is not None else None
+
+    def _lookup(self, device, command, run):
+        key = (device.name, command)
+        self.restore(device.name, command)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            try:
+                entry = (run(), None)
+            except Exception as e:
+                entry = (None, e)
+
+            with self._lock:
+                self._entries[key] = entry
+
+        output, error = entry
+        if error is not None:
+            raise error
+        return output
+
+    def share(self, failed_devices=()):
+        """
+        Add the output parsed by this run to the snapshot store, for the tests of other services.
+
+        Output of failed_devices, the devices a check failed on, is never shared, nor are
+        failed commands, learn() results and output that was itself restored from a snapshot.
+
+        Return the number of outputs shared
+        """
+
+        if self.snapshots is None:
+            return 0
+
+        with self._lock:
+            entries = [
+                (key, output) for key, (output, error) in self._entries.items() 
+                if error is None and key[0] not in failed_devices and not key[1].startswith("learn ") and key not in self._from_snapshots
+            ]
+
+        for (device_name, command), output in entries:
+            self.snapshots.put(device_name, command, output, self.versions.get(device_name), source=self.source)
+        return len(entries)
+
+    def snapshot_summary(self):
+        """Action output message for output reused from the snapshot store, or None if there was none."""
+
+        if not self.snapshot_hits:
+            return None
+        return (
+            f"{self.snapshot_hits} command outputs were reused from snapshots taken by another test in the last "
+            f"{self.snapshots.ttl} seconds rather than run on the switches. Run the test with fresh to run every command."
+        )
+
+    def summary(self):
+        """Human readable hit/miss summary for action output."""
+
+        return (
+            f"{self.hits} hits, {self.misses} misses, {self.snapshot_hits} from snapshots. "
+            f"{self.hits + self.snapshot_hits} device round trips saved. Total {self.usage()}."
+        )
+
+
+def cached_parse(device, command, cache=None):
+    """Parse a command through a CommandCache if one is provided."""
+
+    if cache is not None:
+        return cache.parse(device, command)
+    return device.parse(command)
+
+
+def cached_learn(device, feature, cache=None):
+    """Learn a feature through a CommandCache if one is provided."""
+
+    if cache is not None:
+        return cache.learn(device, feature)
+    return device.learn(feature)
@@ -0,0 +1,353 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Timing spans and counters collected during a service create.
+
+Nothing is written from inside the create. The metrics of the last create of each
+service are kept in memory by the package (MetricsStore, started by the Main
+application in setup()) and read as operational data from the config false metrics
+container of each network-fabric, network-fabric-partition and network-tenant
+service, served by MetricsDataCallbacks on the network-fabric-metrics callpoint.
+Logging them on every create is switched on with /network-fabric-metrics/log-enabled,
+which is outside the services so changing it doesn't redeploy anything.
+"""
+
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import ncs
+import _ncs
+
+
+class PhaseMetrics(object):
+    """Aggregated metrics for one named phase of a create."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.template_applies = 0
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "total-time": round(self.total_time * 1000, 3),
+            "max-time": round(self.max_time * 1000, 3),
+            "template-applies": self.template_applies,
+        }
+
+
+class CreateMetrics(object):
+    """
+    Collect per-phase timing spans for a single service create.
+
+    Phases are opened with the span() context manager. Spans can be nested,
+    times are inclusive of nested spans, and template applies are counted
+    against the innermost open span as well as the create total.
+
+    Resource allocations that weren't ready are counted as well. A service is
+    converged once a create runs with every allocation ready, the MetricsStore
+    keeps how long and how many creates that took.
+    """
+
+    def __init__(self, service_type, service_name, log=None):
+        self.service_type = service_type
+        self.service_name = service_name
+        self.log = log
+        self.phases = {}
+        self.template_applies = 0
+        self.pending_allocations = 0
+        self.total_time = 0.0
+        self._started = time.perf_counter()
+        self._stack = []
+
+    @contextmanager
+    def span(self, name):
+        """Time a phase of the create."""
+
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = PhaseMetrics(name)
+
+        self._stack.append(phase)
+        start = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            phase.calls += 1
+            phase.total_time += elapsed
+            phase.max_time = max(phase.max_time, elapsed)
+
+    def count_template_applies(self, count=1):
+        self.template_applies += count
+        if self._stack:
+            self._stack[-1].template_applies += count
+
+    def count_pending_allocations(self, count=1):
+        self.pending_allocations += count
+
+    def finish(self):
+        """Stop the overall create timer."""
+
+        self.total_time = time.perf_counter() - self._started
+
+    def complete(self, root, service):
+        """Finish the create metrics, log them if enabled and keep them in the package metrics store."""
+
+        self.finish()
+        if log_enabled(root) and self.log:
+            self.log.info(self.log_line())
+
+        store = get_metrics_store()
+        if store:
+            store.record(service._path, self, dry_run=is_dry_run(root))
+
+    def as_dict(self):
+        return {
+            "service-type": self.service_type,
+            "service": self.service_name,
+            "total-time": round(self.total_time * 1000, 3),
+            "template-applies": self.template_applies,
+            "pending-allocations": self.pending_allocations,
+            "phases": [phase.as_dict() for phase in self.phases.values()],
+        }
+
+    def log_line(self):
+        """Structured (JSON) log line for the create."""
+
+        return f"create-metrics {json.dumps(self.as_dict(), sort_keys=True)}"
+
+
+def log_enabled(root):
+    """Whether create metrics are logged on every create, from /network-fabric-metrics/log-enabled."""
+
+    return bool(root.network_fabric_metrics.log_enabled)
+
+
+def is_dry_run(root):
+    """
+    Whether the create is run for a commit dry-run.
+
+    False where NSO doesn't provide the commit parameters of the transaction (before NSO 5.4).
+    """
+
+    try:
+        return bool(ncs.maagic.get_trans(root).get_params().is_dry_run())
+    except (AttributeError, ncs.error.Error):
+        return False
+
+
+class ServiceMetrics(object):
+    """The metrics of the last create of a service, and how long its resource allocations took to be ready."""
+
+    def __init__(self, service_path):
+        self.service_path = service_path
+        self.last_create = None
+        self.dry_run = False
+        self.metrics = None
+        self.pending_since = None
+        self.pending_creates = 0
+        self.converge_time = None
+        self.converge_creates = None
+
+    def record_convergence(self, metrics, now):
+        """
+        Track the creates a service runs with resource allocations pending, and once every
+        allocation is ready record how long and how many creates it took to converge.
+        """
+
+        if metrics.pending_allocations:
+            if self.pending_since is None:
+                self.pending_since = now
+                self.pending_creates = 0
+            self.pending_creates += 1
+        elif self.pending_since is not None:
+            self.converge_time = (now - self.pending_since).total_seconds()
+            self.converge_creates = self.pending_creates + 1
+            self.pending_since = None
+            self.pending_creates = 0
+
+
+class MetricsStore(object):
+    """
+    The metrics of the last create of each service, kept in memory by service path.
+
+    A create run for a commit dry-run is kept as the last create, flagged as a dry-run,
+    but doesn't count towards convergence as its allocations are never made.
+    Metrics are lost on a package reload.
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def record(self, service_path, metrics, dry_run=False):
+        """Keep the metrics of a finished create."""
+
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._services.get(service_path)
+            if entry is None:
+                entry = self._services[service_path] = ServiceMetrics(service_path)
+            entry.last_create = now
+            entry.dry_run = dry_run
+            entry.metrics = metrics
+            if not dry_run:
+                entry.record_convergence(metrics, now)
+
+    def get(self, service_path):
+        """The ServiceMetrics of a service, or None if it hasn't been created since the package started."""
+
+        with self._lock:
+            return self._services.get(service_path)
+
+    def services(self, service_type=None, service=None):
+        """
+        The ServiceMetrics of the services created since the package started, ordered by service path.
+
+        service_type and service (the service name, as in the create-metrics log line) filter the services returned.
+        """
+
+        with self._lock:
+            entries = sorted(self._services.values(), key=lambda entry: entry.service_path)
+        return [
+            entry for entry in entries
+            if (service_type is None or entry.metrics.service_type == service_type)
+            and (service is None or str(entry.metrics.service_name) == service)
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._services.clear()
+
+
+# Callpoint of the config false metrics container of every network-fabric, network-fabric-partition
+# and network-tenant service
+METRICS_CALLPOINT = "network-fabric-metrics"
+
+
+def service_values(entry):
+    """The leaves of a service's metrics container as {leaf: text}, leaves without a value are left out."""
+
+    metrics = entry.metrics
+    values = {
+        "last-create": entry.last_create.isoformat(),
+        "dry-run": "true" if entry.dry_run else "false",
+        "total-time": f"{metrics.total_time * 1000:.3f}",
+        "template-applies": str(metrics.template_applies),
+        "pending-allocations": str(metrics.pending_allocations),
+    }
+    if entry.pending_since is not None:
+        values["pending-since"] = entry.pending_since.isoformat()
+        values["pending-creates"] = str(entry.pending_creates)
+    if entry.converge_time is not None:
+        values["converge-time"] = f"{entry.converge_time:.3f}"
+        values["converge-creates"] = str(entry.converge_creates)
+    return values
+
+
+def phase_values(phase):
+    """The leaves of a phase list entry of a service's metrics container as {leaf: text}."""
+
+    return {
+        "name": phase.name,
+        "calls": str(phase.calls),
+        "total-time": f"{phase.total_time * 1000:.3f}",
+        "max-time": f"{phase.max_time * 1000:.3f}",
+        "template-applies": str(phase.template_applies),
+    }
+
+
+class MetricsDataCallbacks(object):
+    """
+    Data callbacks of the network-fabric-metrics callpoint, serving the metrics container
+    of a service from the package MetricsStore.
+
+    The container is empty for a service that hasn't been created since the package started.
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+
+    def cb_get_elem(self, tctx, kp):
+        values = self._values(kp)
+        leaf = str(kp[0])
+        if values is None or leaf not in values:
+            _ncs.dp.data_reply_not_found(tctx)
+        else:
+            _ncs.dp.data_reply_value(tctx, _leaf_value(kp, values[leaf]))
+        return _ncs.CONFD_OK
+
+    def cb_get_next(self, tctx, kp, next):
+        """The entries of the phase list, in the order the create opened them. next is -1 for the first entry."""
+
+        entry = _service_entry(kp)
+        phases = list(entry.metrics.phases) if entry else []
+        index = 0 if next == -1 else next
+        if index < len(phases):
+            _ncs.dp.data_reply_next_key(tctx, [_ncs.Value(phases[index], _ncs.C_BUF)], index + 1)
+        else:
+            _ncs.dp.data_reply_next_key(tctx, None, -1)
+        return _ncs.CONFD_OK
+
+    def _values(self, kp):
+        """The leaves of the metrics container, or of the phase list entry, kp is in."""
+
+        entry = _service_entry(kp)
+        if entry is None:
+            return None
+        if isinstance(kp[1], tuple):
+            phase = entry.metrics.phases.get(str(kp[1][0]))
+            return phase_values(phase) if phase else None
+        return service_values(entry)
+
+
+def _service_entry(kp):
+    """The ServiceMetrics of the service whose metrics container kp is in, or None."""
+
+    store = get_metrics_store()
+    match = re.match(r"(.*?\})/metrics(/|$)", str(kp))
+    if not store or not match:
+        return None
+    return store.get(match.group(1))
+
+
+def _leaf_value(kp, text):
+    """The value of the leaf at kp from its text, converted to the leaf's YANG type."""
+
+    node = _ncs.cs_node_cd(None, str(kp))
+    return _ncs.Value.str2val(text, node.info().type())
+
+
+# The store used by the package. Set by Main.setup() and cleared by Main.teardown()
+_metrics_store = None
+
+
+def start_metrics_store(log=None, **kwargs):
+    """Create the package create metrics store."""
+
+    global _metrics_store
+    _metrics_store = MetricsStore(log=log, **kwargs)
+    return _metrics_store
+
+
+def stop_metrics_store():
+    """Drop the metrics kept and remove the package create metrics store."""
+
+    global _metrics_store
+    store, _metrics_store = _metrics_store, None
+    if store:
+        store.clear()
+
+
+def get_metrics_store():
+    """Return the package create metrics store, or None if it isn't running."""
+
+    return _metrics_store
@@ -1,8 +1,17 @@
 import ncs
 from ncs.dp import Action
-from _ncs import decrypt
 from _ncs.dp import action_set_timeout
-import genie.testbed
+from .pyats_helpers import collect_device_outputs, DeviceRegistry, PORTCHANNEL_SUMMARY_COMMANDS
+from .pyats_helpers import test_time_budget, FULL_TEST_ACTION_TIMEOUT
+from .pyats_tests import nxos_features_enabled, vrfs_exist, ospf_vrfs_running, ospf_collected, FEATURE_COMMAND, VRF_COMMAND, OSPF_VRF_COMMAND
+from .pyats_tests import spanning_tree_table, spanning_tree_root_errors, SPANNING_TREE_COMMAND
+from .command_cache import CommandCache
+from .snapshot_store import get_snapshot_store
+from .fabric_topology import FabricTopology, SWITCH_PAIR, SWITCH
+from .test_progress import TestProgress
+from .result_collector import ResultCollector
+from .result_store import record_run, history_action_output
+from .verification_state import fabric_device_intents, device_fingerprint, device_versions, unchanged_devices, verification_age, record_verifications
 
 class FabricAction(Action): 
     @Action.action
@@ -14,179 +23,401 @@ class FabricAction(Action):
         trans.maapi.install_crypto_keys()
 
         if name == 'fabric':
-            # This test can run longer than the default. Increasing timeout to 6 minutes
-            action_set_timeout(uinfo, 360)
-
-            self.fabric_test(service, root, action_input, action_output)
-
-    def fabric_test(self, service, root, action_input, action_output): 
-        self.log.info(f'Running fabric_test on network-fabric {service.name}')
-
-        # Setup
-        # - Create testbed(s) object 
-        #   - switch-pairs 
-        #   - switches
-        # - Connect to devices/testbeds 
-
-        switchpair_testbed, switch_testbed = self.create_fabric_testbeds(service, root)
+            # The full test can run longer than the default. Increasing timeout to 6 minutes
+            if str(action_input.level) == "full": 
+                action_set_timeout(uinfo, FULL_TEST_ACTION_TIMEOUT)
+
+            self.fabric_test(service, root, action_input, action_output, username=uinfo.username)
+
+        elif name == 'tenants': 
+            # The full test can run longer than the default. Increasing timeout to 6 minutes
+            if str(action_input.level) == "full": 
+                action_set_timeout(uinfo, FULL_TEST_ACTION_TIMEOUT)
+
+            self.tenants_test(service, root, action_input, action_output, username=uinfo.username)
+
+        elif name == 'history': 
+            history_action_output("network-fabric", service.name, action_input, action_output)
+
+    def fabric_test(self, service, root, action_input, action_output, username=None): 
+        # Test level 
+        # - quick: one command per switch ("show vpc" on switch-pairs, port-channel summary on switches)
+        #          within QUICK_TEST_TIME_BUDGET seconds 
+        # - full: every test, including fabric trunk members on switch-pairs and spanning-tree
+        #         within FULL_TEST_TIME_BUDGET seconds
+        # Switches that don't respond within their connect/command timeout are reported and skipped
+        level = str(action_input.level)
+        self.log.info(f'Running {level} fabric_test on network-fabric {service.name}')
+
+        # Results are streamed to the test progress container as they come in
+        progress = TestProgress(username, f"{service._path}/test", "fabric", log=self.log)
+        progress.start()
+
+        # Errors and details are collected during the test and written to the action output at the end
+        collector = ResultCollector(max_entries=action_input.max_results)
+
+        # Switch-pair membership and spanning-tree root lookups for every test
+        topology = FabricTopology(service)
+
+        # Fingerprint the configuration and device transaction id of every switch in the fabric.
+        # Incremental tests skip switches that passed last time with the same fingerprint.
+        fingerprints = {
+            device_name: device_fingerprint(root, device_name, intent, level) 
+            for device_name, intent in fabric_device_intents(service, topology).items()
+        }
 
-        # Connect to all devices in the testbeds
-        for testbed in [switchpair_testbed, switch_testbed]:
-            self.testbed_connect(testbed)
-            # self.testbed_connection_status(testbed)
+        cached = {}
+        if action_input.incremental: 
+            cached = unchanged_devices(service, fingerprints)
 
-            # NOTE: Should any test/validation/error message be logged if a device can't be connected to?
+            # Switch-pairs are tested together, so only skip a pair if both switches are unchanged
+            changed_pairs = {topology.pair_name(device_name) for device_name in fingerprints if device_name not in cached}
+            cached = {
+                device_name: verified for device_name, verified in cached.items() 
+                if topology.role(device_name) != SWITCH_PAIR or topology.pair_name(device_name) not in changed_pairs
+            }
 
+            for device_name, verified in cached.items(): 
+                msg = f"device {device_name} unchanged since it passed {verification_age(verified)} ago, not tested"
+                collector.detail("incremental", msg)
+                progress.result("incremental", True, msg, device=device_name)
+            self.log.info(f"Incremental test skipping {len(cached)} unchanged switches of {len(fingerprints)}")
 
+        # Setup
+        # - Register the switches to test, switch-pair members first
+        # - A switch's pyATS device is only built (and its credentials decrypted) when there's 
+        #   output to collect from it, and only connected when a command has to run on it
+
+        registry = DeviceRegistry(root, name=f"fabric-{service.name}", fast_connect=service.test.fast_connect, log=self.log)
+        pair_devices = [device_name for device_name in topology.devices() if topology.role(device_name) == SWITCH_PAIR and device_name not in cached]
+        switch_devices = [device_name for device_name in topology.devices() if topology.role(device_name) == SWITCH and device_name not in cached]
+
+        # Gather the output every test needs from all switches in parallel
+        # Every parse for this run goes through one cache, so each command runs once per device.
+        # Output parsed by another recent test is reused from the snapshot store while the switch is unchanged, unless fresh
+        devices = registry.devices(pair_devices + switch_devices)
+        cache = CommandCache(
+            snapshots=None if action_input.fresh else get_snapshot_store(), 
+            versions=device_versions(root, devices), 
+            source=f"{service._path}/test/fabric"
+        )
+        collection_errors = collect_device_outputs(
+            devices=devices, 
+            commands=self.fabric_command_plan(devices, vpc_devices=pair_devices, level=level), 
+            cache=cache, 
+            timeout=test_time_budget(level), 
+            on_collected=lambda device, errors: progress.result("device collection", not errors, "; ".join(errors) or "collected", device=device), 
+            log=self.log
+        )
+
+        # Switches that failed any test, these are always tested again by an incremental test
+        failed_devices = set(collection_errors)
+
+        for device, errors in collection_errors.items(): 
+            for msg in errors: 
+                collector.error("device collection", msg)
 
         # Test VPC Domain for switchpairs 
         for pair in service.switch_pair: 
-            vpc_domain_test = self.test_vpc_domain(pair, switchpair_testbed, action_output)
+            if pair.switch and all(device_name in cached for device_name in topology.pair_devices(pair.name)): 
+                continue
+            if level == "quick": 
+                vpc_domain_test = self.quick_vpc_test(pair, devices, cache, collector)
+            else: 
+                vpc_domain_test = self.test_vpc_domain(pair, devices, cache, collector)
+            progress.test_result(f"switch-pair {pair.name} vpc domain", vpc_domain_test)
+            if not vpc_domain_test["success"]: 
+                failed_devices.update(topology.pair_devices(pair.name))
 
         # Test Fabric Trunks 
         # - Test port-channel interface is up 
         # - Test all member-interfaces are up 
         # - TODO: Test CDP neighbors on member interfaces match configured peer 
+        # Quick tests only check switch-pair trunks are up as VPCs (above)
 
-        for pair in service.switch_pair: 
+        for pair in service.switch_pair if level == "full" else []: 
             for switch in pair.switch: 
-                trunk_test = self.fabric_trunk_test(switch.device, pair.fabric_trunk, switchpair_testbed, action_output, 
+                if switch.device in cached: 
+                    continue
+                trunk_test = self.fabric_trunk_test(switch.device, pair.fabric_trunk, devices, cache, collector, 
                                                     ignore_trunks=[ str(trunk.name) for trunk in pair.multiswitch_peerlink.port_channel])
+                progress.test_result("fabric trunk", trunk_test, device=switch.device)
+                if not trunk_test["success"]: 
+                    failed_devices.add(switch.device)
 
         # TODO: Test this with a fabric that has a switch included (not just switch-pairs)
         for switch in service.switch: 
-            trunk_test = self.fabric_trunk_test(switch.device, switch.fabric_trunk, switch_testbed, action_output)
+            if switch.device in cached: 
+                continue
+            trunk_test = self.fabric_trunk_test(switch.device, switch.fabric_trunk, devices, cache, collector)
+            progress.test_result("fabric trunk", trunk_test, device=switch.device)
+            if not trunk_test["success"]: 
+                failed_devices.add(switch.device)
 
         # Run Spanning-Tree Test
-        self.spanning_tree_test(service, root, switchpair_testbed, switch_testbed, action_input, action_output)
+        if level == "full": 
+            spanning_tree_test = self.spanning_tree_test(service, topology, devices, cache, action_input, collector, progress=progress)
+            failed_devices.update(spanning_tree_test["failed_devices"])
+
+        # Report how many device round trips the command cache saved
+        collector.detail("command cache", cache.summary())
+        self.log.info(f"Command cache: {cache.summary()}")
+
+        # Output from snapshots may not show a change made on the switch itself since it was taken
+        if cache.snapshot_hits: 
+            collector.detail("snapshots", cache.snapshot_summary())
+
+        # Output of the switches that passed is shared with the tests of other services
+        cache.share(failed_devices)
+
+        # Be sure to cleanup connections to devices (pooled sessions are returned to the pool)
+        registry.release()
+        collector.detail("device registry", registry.summary())
+
+        # Remember which switches passed for the next incremental test
+        record_verifications(
+            username=username, 
+            service_path=service._path, 
+            fingerprints=fingerprints, 
+            passed=[device for device in devices if device not in failed_devices], 
+            failed=failed_devices, 
+            log=self.log
+        )
+
+        collector.write(action_output, success_message="Fabric test was successful")
+        progress.finish(collector.success)
+        record_run("fabric", "network-fabric", service.name, level, progress, collector, log=self.log)
+
+    def tenants_test(self, service, root, action_input, action_output, username=None): 
+        """
+        Test every layer3 network-tenant on the fabric in one pass. 
 
-        # Be sure to cleanup connections to devices
-        for testbed in [switchpair_testbed, switch_testbed]:
-            self.testbed_disconnect(testbed)
-            # self.testbed_connection_status(testbed)
+        The layer3 switch-pair is connected to once and each command collected once 
+        per switch, then the output is checked for each tenant and reported per tenant. 
+        Quick tests only check OSPF is running in the tenant VRFs, full tests also check 
+        the layer3 features are enabled and the VRFs exist.
+        """
 
-        # if len(output["error"]) == 0: 
-        if len(action_output.error) == 0: 
-            action_output.message = "Fabric test was successful"
-            action_output.success = True
-        else: 
-            action_output.message = "Errors were encountered during test."
-            action_output.success = False
+        level = str(action_input.level)
+        self.log.info(f'Running {level} tenants test on network-fabric {service.name}')
+
+        progress = TestProgress(username, f"{service._path}/test", "tenants", log=self.log)
+        progress.start()
+        collector = ResultCollector(max_entries=action_input.max_results)
+
+        tenants = [ tenant for tenant in root.network_tenant if tenant.fabric == service.name and tenant.layer3.enabled ]
+        layer3_pair = FabricTopology(service).layer3_pair
+
+        if not tenants or layer3_pair is None: 
+            self.log.info(f"network-fabric {service.name} has no layer3 network-tenants. No tests to run.")
+            collector.write(action_output)
+            progress.finish(collector.success)
+            record_run("tenants", "network-fabric", service.name, level, progress, collector, log=self.log)
+            return
+
+        registry = DeviceRegistry(
+            root, 
+            name=f"fabric-{service.name}-tenants-layer3pair-{layer3_pair.name}", 
+            fast_connect=service.test.fast_connect, 
+            log=self.log
+        )
+
+        # Collect every command once per switch for all tenants
+        commands = [OSPF_VRF_COMMAND] if level == "quick" else [FEATURE_COMMAND, VRF_COMMAND, OSPF_VRF_COMMAND]
+        devices = registry.devices([switch.device for switch in layer3_pair.switch])
+        cache = CommandCache(
+            snapshots=None if action_input.fresh else get_snapshot_store(), 
+            versions=device_versions(root, devices), 
+            source=f"{service._path}/test/tenants"
+        )
+        collection_errors = collect_device_outputs(
+            devices=devices, 
+            commands={device: commands for device in devices}, 
+            cache=cache, 
+            timeout=test_time_budget(level), 
+            on_collected=lambda device, errors: progress.result("device collection", not errors, "; ".join(errors) or "collected", device=device), 
+            empty_output=[OSPF_VRF_COMMAND], 
+            log=self.log
+        )
+
+        # Each collection failure is reported once, the tenants can't pass on a device that wasn't collected
+        uncollected = []
+        failed_devices = set()
+        for device_name in devices: 
+            # Empty OSPF output means OSPF isn't running, any other failure wasn't collected
+            missing = [
+                command for command in commands 
+                if not (ospf_collected(device_name, cache) if command == OSPF_VRF_COMMAND else cache.contains(device_name, command))
+            ]
+            if not missing: 
+                continue
+            uncollected.append(device_name)
+            failed_devices.add(device_name)
+            for msg in collection_errors.get(device_name) or [f"device {device_name} was not collected: {', '.join(missing)}"]: 
+                collector.error("device collection", msg)
+
+        # Layer 3 - Features Enabled (hsrp, interface-vlan, ospf) are shared by all tenants so only checked once
+        feature_errors = []
+        for device_name, device in devices.items(): 
+            if level == "full" and cache.contains(device_name, FEATURE_COMMAND): 
+                result = nxos_features_enabled(device, features=["hsrp_engine", "interface-vlan", "ospf"], cache=cache, log=self.log)
+                collector.test_result("nxos feature enabled", result)
+                progress.test_result("nxos feature enabled", result, device=device_name)
+                feature_errors.extend(result["error"])
+                if not result["success"]: 
+                    failed_devices.add(device_name)
+
+        # Fan the collected output out into results for each tenant. Results are reported with the 
+        # labels of the tenant test, the VRF names in the messages tell the tenants apart
+        for tenant in tenants: 
+            vrfs = [f"{tenant.name}_{vrf}" for vrf in tenant.layer3.vrf]
+            tenant_errors = list(feature_errors)
+
+            for device_name, device in devices.items(): 
+                if device_name in uncollected: 
+                    tenant_errors.append(f"device {device_name} was not collected")
+
+                results = []
+                if level == "full" and cache.contains(device_name, VRF_COMMAND): 
+                    results.append(("tenant vrfs exist", vrfs_exist(device, vrfs=vrfs, cache=cache, log=self.log)))
+                if ospf_collected(device_name, cache): 
+                    results.append(("tenant ospf vrfs running", ospf_vrfs_running(device, vrfs=vrfs, cache=cache, log=self.log)))
+
+                for test_name, result in results: 
+                    collector.test_result(test_name, result)
+                    tenant_errors.extend(result["error"])
+                    if not result["success"]: 
+                        failed_devices.add(device_name)
+
+            tenant_status = action_output.tenant.create(tenant.name)
+            tenant_status.success = len(tenant_errors) == 0
+            tenant_status.message = "Test was successful" if tenant_status.success else f"{len(tenant_errors)} errors were encountered during test."
+            progress.test_result(f"network-tenant {tenant.name}", {"success": tenant_status.success, "error": tenant_errors})
+
+        self.log.info(f"Tested {len(tenants)} network-tenants on network-fabric {service.name}")
+
+        # Report how many device round trips the command cache saved
+        collector.detail("command cache", cache.summary())
+        self.log.info(f"Command cache: {cache.summary()}")
+
+        # Output from snapshots may not show a change made on the switch itself since it was taken
+        if cache.snapshot_hits: 
+            collector.detail("snapshots", cache.snapshot_summary())
+
+        # Output of the switches that passed every tenant is shared with the tests of other services
+        cache.share(failed_devices)
+
+        # Cleanup - Release devices (pooled sessions are returned to the pool)
+        registry.release()
+        collector.detail("device registry", registry.summary())
+
+        collector.write(action_output)
+        progress.finish(collector.success)
+        record_run("tenants", "network-fabric", service.name, level, progress, collector, log=self.log)
+
+    def fabric_command_plan(self, devices, vpc_devices=(), level="full"): 
+        """
+        Build the list of commands each fabric test needs from every device. 
+        vpc_devices are the names of the switch-pair members. 
+
+        Quick tests use a single command per device, "show vpc" on switch-pair 
+        members and the port-channel summary on other switches.
+
+        Return dictionary of {device_name: [commands]}
+        """
+
+        plan = {}
+        for device_name, device in devices.items(): 
+            commands = []
+            # VPC details are only available on switch-pair (NX-OS) members
+            if device.os == "nxos" and device_name in vpc_devices: 
+                commands.append("show vpc")
+            if device.os in PORTCHANNEL_SUMMARY_COMMANDS: 
+                commands.append(PORTCHANNEL_SUMMARY_COMMANDS[device.os])
+            commands.append(SPANNING_TREE_COMMAND)
+            plan[device_name] = commands[:1] if level == "quick" else commands
 
-    def spanning_tree_test(self, service, root, switchpair_testbed, switch_testbed, action_input, action_output):
+        return plan
+
+    def spanning_tree_test(self, service, topology, devices, cache, action_input, collector, progress=None):
 
         self.log.info(f"Testing Spanning-Tree State for network-fabric {service.name}")
 
         results = {
             "success": True, 
             "details": [], 
-            "error": []
+            "error": [], 
+            "failed_devices": [], 
         }
 
-        # Lookup Spanning-Tree Root details from service
-        root_type, root_bridge, root_bridge_name = self.lookup_spanning_tree_root(service)
-        self.log.info(f"Spanning-Tree root is {root_bridge_name}")
+        self.log.info(f"Spanning-Tree root is {topology.root_bridge_name}")
 
-        spanning_tree_details = {}
+        # One row per device and VLAN, so the root test runs once over the whole fabric
+        stp_table = []
+        device_errors = {}
 
-        for testbed in [switchpair_testbed, switch_testbed]: 
-            # self.log.info(f"Running testbed {testbed.name}. {testbed.devices}")
-            for device in testbed.devices: 
-                spanning_tree_details[device] = testbed.devices[device].parse("show spanning-tree detail")
+        for device in devices: 
+            # Devices that couldn't be collected were already reported during collection
+            if not cache.contains(device, SPANNING_TREE_COMMAND): 
+                continue
+            spanning_tree_details = cache.parse(devices[device], SPANNING_TREE_COMMAND)
+            device_errors[device] = []
 
-                # - Verify all switches running rapid-pvst 
-                stp_proto_msg = self.spanning_tree_protocol_test(device, spanning_tree_details[device], action_output)
-                if stp_proto_msg: 
-                    results["error"].append(stp_proto_msg)
+            # - Verify all switches running rapid-pvst 
+            stp_proto_msg = self.spanning_tree_protocol_test(device, spanning_tree_details, collector)
+            if stp_proto_msg: 
+                device_errors[device].append(stp_proto_msg)
 
-                # - Verify configured spanning-tree root is root on all switches
-                stp_root_msg = self.spanning_tree_root_test(device, spanning_tree_details[device], root_bridge_name, action_output)
-                if stp_root_msg: 
-                    results["error"].append(stp_root_msg)
+            stp_table.extend(spanning_tree_table(device, spanning_tree_details))
 
+        # - Verify configured spanning-tree root is root on all switches
+        for device, msgs in self.spanning_tree_root_test(stp_table, topology, collector).items(): 
+            device_errors[device].extend(msgs)
 
-        # For debugging print spanning-tree-details
-        # self.log.info(spanning_tree_details)
+        for device, errors in device_errors.items(): 
+            if errors: 
+                results["error"].extend(errors)
+                results["failed_devices"].append(device)
+            if progress: 
+                progress.result("spanning-tree", not errors, "; ".join(errors) or "passed", device=device)
 
         if len(results["error"]) > 0: 
             results["success"] = False
 
-        self.log.info(f"results: {results}")
+        self.log.info(f"Spanning-Tree test checked {len(stp_table)} VLANs on {len(device_errors)} devices, {len(results['failed_devices'])} failed")
 
         return results
 
-    def spanning_tree_root_test(self, device, spanning_tree_details, root_bridge_name, action_output): 
-
-        msgs = []
-
-        self.log.info(f"Running Spanning-Tree Root Test on device {device}")
+    def spanning_tree_root_test(self, stp_table, topology, collector): 
+        """
+        Check the spanning-tree root of every VLAN in a spanning_tree_table in bulk.
 
-        for protocol, stp_details in spanning_tree_details.items():
-            self.log.info(f"Checking Spanning-Tree Protocol {protocol} for root per vlan.")
-            for vlan_id, vlan_details in stp_details["vlans"].items(): 
-                self.log.info(f"Checking VLAN ID {vlan_id}.")
-                # self.log.info(vlan_details)
+        Return dictionary of {device: [messages]}, with VLANs aggregated into ranges.
+        """
 
-                if root_bridge_name in device and "root_of_the_spanning_tree" not in vlan_details.keys(): 
-                    self.log.info(f"Device {device} is NOT the Spanning-Tree root for VLAN {vlan_id} but should be.")
-                    msgs.append(f"Device {device} is NOT the Spanning-Tree root for VLAN {vlan_id} but should be.")
-                elif (root_bridge_name not in device and "root_of_the_spanning_tree" in vlan_details.keys()) and vlan_details["root_of_the_spanning_tree"]: 
-                    self.log.info(f"Device {device} is the Spanning-Tree root for VLAN {vlan_id} but should NOT be.")
-                    msgs.append(f"Device {device} is the Spanning-Tree root for VLAN {vlan_id} but should NOT be.")
+        self.log.info(f"Running Spanning-Tree Root Test on {len(stp_table)} VLANs")
 
-        if len(msgs) == 0: 
-            msgs = None
-        else: 
+        errors = spanning_tree_root_errors(stp_table, topology.root_bridge_devices)
+        for device, msgs in errors.items(): 
             for msg in msgs: 
-                test_error = action_output.error.create()
-                test_error.test = "spanning-tree root bridge"
-                test_error.message = msg 
-                
-        return msgs
+                self.log.info(msg)
+                collector.error("spanning-tree root bridge", msg)
+
+        return errors
 
 
-    def spanning_tree_protocol_test(self, device, spanning_tree_details, action_output, spanning_tree_protocol="rapid_pvst"): 
+    def spanning_tree_protocol_test(self, device, spanning_tree_details, collector, spanning_tree_protocol="rapid_pvst"): 
 
         # self.log.info(f"Device {device} is running {spanning_tree_details.keys()}")
         msg = None
 
         if "rapid_pvst" not in spanning_tree_details.keys(): 
             msg = f'device {device} is running Spanning-Tree Protocol {", ".join(spanning_tree_details.keys())}. It should be "rapid-pvst"'
-            test_error = action_output.error.create()
-            test_error.test = "spanning-tree protocol version"
-            test_error.message = msg 
+            collector.error("spanning-tree protocol version", msg)
 
         return msg
 
-    def lookup_spanning_tree_root(self, service): 
-        """
-        Lookup the spanning-tree root configured for a service. 
-
-        Return tuple with (root_type, root_bridge, root_bridge_name)
-
-        If no spanning-tree root is configured, return (None, None, None)
-        """
-
-        # Determine Spanning-Tree Root and Configure 
-        root_type, root_bridge, root_bridge_name = None, None, None
-
-        # Check if a spanning-tree root is configured
-        for case in service.spanning_tree.root: 
-            # Check for a configured value for each choice option
-            if case == "network-fabric:switch-pair" and service.spanning_tree.root[case]: 
-                # self.log.info(f"The switch-pair {service.spanning_tree.root[case]} was selected as root.")
-                root_type = "switch-pair"
-                root_bridge = service.switch_pair[service.spanning_tree.root[case]]
-                root_bridge_name = root_bridge.name
-            elif case == "network-fabric:switch" and service.spanning_tree.root[case]: 
-                # self.log.info(f"The switch {service.spanning_tree.root[case]} was selected as root.")
-                root_type = "switch"
-                root_bridge = service.switch[service.spanning_tree.root[case]]
-                root_bridge_name = root_bridge.device
-
-        return (root_type, root_bridge, root_bridge_name)
-
-    def fabric_trunk_test(self, switch, fabric_trunks, testbed, action_output, ignore_trunks=[]): 
+    def fabric_trunk_test(self, switch, fabric_trunks, devices, cache, collector, ignore_trunks=[]): 
 
         results = {
             "success": True, 
@@ -199,11 +430,12 @@ class FabricAction(Action):
         self.log.info(f"Testing fabric trunk status on switch {switch}")
         self.log.info(f"The following port-channel ids will be ignored during testing: {', '.join(ignore_trunks)}")
 
-        if testbed.devices[switch].os == "nxos": 
-            show_portchannel_summary = testbed.devices[switch].parse("show port-channel summary")
+        portchannel_command = PORTCHANNEL_SUMMARY_COMMANDS.get(devices[switch].os)
+        if not cache.contains(switch, portchannel_command): 
+            self.log.info(f"No port-channel details were collected from switch {switch}. Skipping fabric trunk test.")
+            return results
 
-        elif testbed.devices[switch].os in ["ios", "iosxe"]: 
-            show_portchannel_summary = testbed.devices[switch].parse("show etherchannel summary")
+        show_portchannel_summary = cache.parse(devices[switch], portchannel_command)
         
         # for debug, print parsed data
         self.log.info(f"show_portchannel_summary={show_portchannel_summary}")
@@ -225,18 +457,14 @@ class FabricAction(Action):
         if missing_fabric_trunks != set(): 
             msg = f'switch {switch} is missing port-channels for fabric-trunks [{", ".join(missing_fabric_trunks)}]'
             results["error"].append(msg)
-            test_error = action_output.error.create()
-            test_error.test = "fabric trunk exist"
-            test_error.message = msg 
+            collector.error("fabric trunk exist", msg)
 
         # Make sure there are no EXTRA port-channels configured 
         extra_port_channels = set_port_channels.difference(set_fabric_trunks).difference(set_ignore_trunks)
         if extra_port_channels != set(): 
             msg = f'switch {switch} has extra port-channels [{", ".join(extra_port_channels)}]'
             results["error"].append(msg)
-            test_error = action_output.error.create()
-            test_error.test = "fabric trunk exist"
-            test_error.message = msg 
+            collector.error("fabric trunk exist", msg)
 
         # Make sure member interfaces from fabric-trunks match configured port-channel members and are up
         for trunk in fabric_trunks.port_channel: 
@@ -245,7 +473,8 @@ class FabricAction(Action):
             for case in trunk.member_interface: 
                 # Skip the "choice" case and find the actual case with members
                 if case != "network-fabric:member-interface" and len(trunk.member_interface[case]) > 0: 
-                    member_interface_type = trunk.member_interface[case]
+                    # Pull interface type out of case value (ie 'network-fabric:FortyGigabitEthernet') 
+                    member_interface_type = case.split(":")[1]
                     member_interfaces = [ f'{member_interface_type}{interface}' for interface in trunk.member_interface[case] ]
             
             self.log.info(f'Configured member interfaces on trunk are {member_interface_type} {member_interfaces}')
@@ -257,9 +486,7 @@ class FabricAction(Action):
             except KeyError: 
                 msg = f'Port-channel{trunk.name} is not operational on switch {switch}'
                 results["error"].append(msg)
-                test_error = action_output.error.create()
-                test_error.test = "fabric member test"
-                test_error.message = msg 
+                collector.error("fabric member test", msg)
                 break
 
             # See if member interfaces match (set math)
@@ -268,9 +495,7 @@ class FabricAction(Action):
             if set_member_interfaces != set_operational_members: 
                 msg = f'Port-channel{trunk.name} on switch {switch} member interfaces incorrect. Should be [{", ".join(set_member_interfaces)}] but is [{", ".join(set_operational_members)}]'
                 results["error"].append(msg)
-                test_error = action_output.error.create()
-                test_error.test = "fabric member test"
-                test_error.message = msg 
+                collector.error("fabric member test", msg)
 
             # debug and dev 
             # self.log.info(f"set_member_interfaces={set_member_interfaces}")
@@ -281,9 +506,7 @@ class FabricAction(Action):
                 if details["flags"] != "P": 
                     msg = f'Port-channel{trunk.name} on switch {switch} member interface {interface_name} is not up. Currently has flag {details["flags"]}'
                     results["error"].append(msg)
-                    test_error = action_output.error.create()
-                    test_error.test = "fabric member test"
-                    test_error.message = msg 
+                    collector.error("fabric member test", msg)
 
 
         if len(results["error"]) > 0: 
@@ -294,7 +517,58 @@ class FabricAction(Action):
         return results
 
 
-    def test_vpc_domain(self, pair, testbed, action_output): 
+    def quick_vpc_test(self, pair, devices, cache, collector): 
+        """
+        Quick switch-pair test using only "show vpc" from each switch. 
+
+        Checks the keepalive, peer adjacency and peer-link are up and that every 
+        fabric-trunk port-channel is an up VPC (VPC ids match the port-channel ids). 
+        """
+
+        results = {
+            "success": True, 
+            "details": [], 
+            "error": []
+        }
+
+        self.log.info(f'Quick testing VPC Domain on switch-pair {pair.name}')
+
+        fabric_trunks = [ str(trunk.name) for trunk in pair.fabric_trunk.port_channel ]
+
+        for switch in pair.switch: 
+            # Devices that couldn't be collected were already reported during collection
+            if not cache.contains(switch.device, "show vpc"): 
+                continue
+            show_vpc = cache.parse(devices[switch.device], "show vpc")
+
+            msgs = []
+            if show_vpc.get("vpc_peer_keepalive_status") != "peer is alive": 
+                msgs.append(("vpc keepalive test", f'switch-pair {pair.name}, switch {switch.device}, vpc keepalive down'))
+            if show_vpc.get("vpc_peer_status") != "peer adjacency formed ok": 
+                msgs.append(("vpc peerlink test", f'switch-pair {pair.name}, switch {switch.device},  {show_vpc.get("vpc_peer_status")}'))
+            for peerlink in show_vpc.get("peer_link", {}).values(): 
+                if peerlink["peer_link_port_state"] != "up": 
+                    msgs.append(("vpc peerlink test", f'switch-pair {pair.name}, switch {switch.device}, peer-link {peerlink["peer_link_ifindex"]} is {peerlink["peer_link_port_state"]}'))
+
+            vpcs = { str(vpc_id): details for vpc_id, details in show_vpc.get("vpc", {}).items() }
+            for trunk in fabric_trunks: 
+                if trunk not in vpcs: 
+                    msgs.append(("vpc status test", f'switch-pair {pair.name}, switch {switch.device}, no vpc for fabric-trunk Port-channel{trunk}'))
+                elif vpcs[trunk]["vpc_port_state"] != "up": 
+                    msgs.append(("vpc status test", f'switch-pair {pair.name}, switch {switch.device}, vpc {trunk} for Port-channel {vpcs[trunk]["vpc_ifindex"]} is {vpcs[trunk]["vpc_port_state"]}'))
+
+            for test, msg in msgs: 
+                results["error"].append(msg)
+                collector.error(test, msg)
+
+        if len(results["error"]) > 0: 
+            results["success"] = False
+
+        self.log.info(f"results: {results}")
+
+        return results
+
+    def test_vpc_domain(self, pair, devices, cache, collector): 
 
         results = {
             "success": True, 
@@ -313,10 +587,10 @@ class FabricAction(Action):
         show_portchannel_summary = {}
 
         for switch in pair.switch: 
-            # Parse "show vpc" for switch 
+            # Parsed "show vpc" for switch 
             self.log.info(f'Gathering show vpc details from {switch.device}')
             # Parser Docs: https://pubhub.devnetcloud.com/media/genie-feature-browser/docs/#/parsers/show%2520vpc
-            show_vpc[switch.device] = testbed.devices[switch.device].parse("show vpc")
+            show_vpc[switch.device] = cache.parse(devices[switch.device], "show vpc") if cache.contains(switch.device, "show vpc") else {}
         
         # self.log.info(f"show_vpc: {show_vpc}")
 
@@ -329,15 +603,11 @@ class FabricAction(Action):
                 if show_vpc[switch.device]["vpc_peer_keepalive_status"] != "peer is alive": 
                     msg = f'switch-pair {pair.name}, switch {switch.device}, vpc keepalive down'
                     results["error"].append(msg)
-                    test_error = action_output.error.create()
-                    test_error.test = "vpc keepalive test"
-                    test_error.message = msg
+                    collector.error("vpc keepalive test", msg)
             except KeyError: 
                 msg = f'switch-pair {pair.name}, switch {switch.device}, no vpc operational status discovered'
                 results["error"].append(msg)
-                test_error = action_output.error.create()
-                test_error.test = "vpc keepalive test"
-                test_error.message = msg
+                collector.error("vpc keepalive test", msg)
 
 
             # - Peerlink up 
@@ -345,15 +615,11 @@ class FabricAction(Action):
             try: 
                 if show_vpc[switch.device]["vpc_peer_status"] != "peer adjacency formed ok": 
                     results["error"].append(f'switch-pair {pair.name}, switch {switch.device},  {show_vpc[switch.device]["vpc_peer_status"]}')
-                    test_error = action_output.error.create()
-                    test_error.test = "vpc peerlink test"
-                    test_error.message = f'switch-pair {pair.name}, switch {switch.device},  {show_vpc[switch.device]["vpc_peer_status"]}'
+                    collector.error("vpc peerlink test", f'switch-pair {pair.name}, switch {switch.device},  {show_vpc[switch.device]["vpc_peer_status"]}')
             except KeyError: 
                 msg = f'switch-pair {pair.name}, switch {switch.device}, no vpc operational status discovered'
                 results["error"].append(msg)
-                test_error = action_output.error.create()
-                test_error.test = "vpc peerlink test"
-                test_error.message = msg
+                collector.error("vpc peerlink test", msg)
 
             # - Both member interfaces in peer-link port-channel are up 
             self.log.info(f'Checking peerlink member status on {switch.device}')
@@ -362,23 +628,21 @@ class FabricAction(Action):
                 for peerlink_portchannel in peerlink_portchannel_data.values(): 
                     self.log.info(f'Peer Link ID is {peerlink_portchannel["peer_link_id"]}, Peer Link Interface {peerlink_portchannel["peer_link_ifindex"]}, Peer Link Port State, {peerlink_portchannel["peer_link_port_state"]}')
                     # Parser docs: https://pubhub.devnetcloud.com/media/genie-feature-browser/docs/#/parsers/show%2520port-channel%2520summary
-                    show_portchannel_summary[switch.device] = testbed.devices[switch.device].parse("show port-channel summary")
+                    if not cache.contains(switch.device, "show port-channel summary"): 
+                        raise KeyError("show port-channel summary")
+                    show_portchannel_summary[switch.device] = cache.parse(devices[switch.device], "show port-channel summary")
 
                     peerlink_details = show_portchannel_summary[switch.device]["interfaces"][f'Port-channel{peerlink_portchannel["peer_link_id"]}']
                     for member, details in peerlink_details["members"].items(): 
                         if details["flags"] != "P": 
                             msg = f'switch-pair {pair.name}, switch {switch.device}, peer-link member interface {member} status {details["flags"]}'
                             results["error"].append(msg)
-                            test_error = action_output.error.create()
-                            test_error.test = "vpc peerlink member test"
-                            test_error.message = msg 
+                            collector.error("vpc peerlink member test", msg)
 
             except KeyError: 
                 msg = f'switch-pair {pair.name}, switch {switch.device}, no vpc operational status discovered'
                 results["error"].append(msg)
-                test_error = action_output.error.create()
-                test_error.test = "vpc peerlink member test"
-                test_error.message = msg
+                collector.error("vpc peerlink member test", msg)
 
             # self.log.info(f'show_portchannel_summary: {show_portchannel_summary}')
 
@@ -392,17 +656,13 @@ class FabricAction(Action):
                         if details["vpc_port_state"] != "up": 
                             msg = f'switch-pair {pair.name}, switch {switch.device}, vpc {vpc_id} for Port-channel {details["vpc_ifindex"]} is {details["vpc_port_state"]}'
                             results["error"].append(msg)
-                            test_error = action_output.error.create()
-                            test_error.test = "vpc status test"
-                            test_error.message = msg
+                            collector.error("vpc status test", msg)
                 else: 
                     self.log.info(f'Device {switch.device} has no VPCs configured.')
             except KeyError: 
                 msg = f'switch-pair {pair.name}, switch {switch.device}, no vpc operational status discovered'
                 results["error"].append(msg)
-                test_error = action_output.error.create()
-                test_error.test = "vpc peerlink member test"
-                test_error.message = msg
+                collector.error("vpc peerlink member test", msg)
 
             # Verifications related to intent from service model 
             #   - interface relationships on peerlink 
@@ -415,117 +675,3 @@ class FabricAction(Action):
         self.log.info(f"results: {results}")
 
         return results
-
-    # TODO: Refactor to use the create_testbed and create_pyats_device from helper_functions
-    def create_fabric_testbeds(self, service, root):
-
-        self.log.info('Setting up testbed for switch-pairs.')
-        switchpair_testbed_data = {
-            "testbed": {
-                "name": f"fabric-{service.name}-switchpairs", 
-            }, 
-            "devices": {}
-            }
-        for pair in service.switch_pair: 
-            self.log.info(f'Setting up testbed for switch-pair {pair.name}.')
-            for switch in pair.switch: 
-                switchpair_testbed_data["devices"].update(self.create_pyats_device(root, switch.device))
-
-        # NOTE: Uncomment this line just for dev and debugging. Will print credentials in clear text
-        # self.log.info(f"switchpair_testbed_data: {switchpair_testbed_data}")
-
-        switchpair_testbed = genie.testbed.load(switchpair_testbed_data)
-
-        switch_testbed = None
-        self.log.info('Setting up testbed for switches.')
-
-        switch_testbed_data = {
-            "testbed": {
-                "name": f"fabric-{service.name}-switches", 
-            }, 
-            "devices": {}
-            }
-        for switch in service.switch: 
-            switch_testbed_data["devices"].update(self.create_pyats_device(root, switch.device))
-
-        # NOTE: Uncomment this line just for dev and debugging. Will print credentials in clear text
-        # self.log.info(f"switch_testbed_data: {switch_testbed_data}")
-
-        switch_testbed = genie.testbed.load(switch_testbed_data)
-
-        return (switchpair_testbed, switch_testbed)
-
-
-
-
-    def create_pyats_device(self, root, device_name): 
-        self.log.info(f'Creating pyATS device definition for device {device_name}')
-
-        device = root.devices.device[device_name]
-        auth = root.devices.authgroups.group[device.authgroup].default_map
-
-        # Keys are NSO Platform Names and Values are pyATS OS options
-        device_os_map = {
-            "ios": "ios", 
-            "ios-xe": "iosxe", 
-            "NX-OS": "nxos", 
-            "ios-xr": "iosxr", 
-            "asa": "asa"
-        }
-
-        # Default ports for CLI protocols
-        connection_port_map = { 
-            "ssh": 22, 
-            "telnet": 23
-        }
-
-        # Determine the protocol and port for the testbed 
-        protocol = str(device.device_type.cli.protocol)
-        port = device.port if device.port else connection_port_map[protocol] 
-
-        device_data = {
-            device_name: {
-                "os": device_os_map[device.platform.name], 
-                "connections": {
-                    "default": {
-                        "ip": device.address, 
-                        "protocol": protocol, 
-                        "port": port,
-                    },
-                },
-                "credentials": {
-                    "default": {
-                        "username": auth.remote_name, 
-                        "password": decrypt(auth.remote_password), 
-                    }
-                }
-            }
-        }
-
-        return device_data
-
-
-    # TODO: Refactor to use versions from helper_functions
-    def testbed_connect(self, testbed): 
-        # Only if a valid testbed was created
-        if testbed: 
-            self.log.info(f"Connecting testbed {testbed.name}")
-            testbed.connect(learn_hostname=True, log_stdout=False)
-
-    def testbed_connection_status(self, testbed): 
-        # Only if a valid testbed was created
-        if testbed: 
-            # Print connection status
-            for device in testbed.devices: 
-                self.log.info(f"Connection status {device}: {testbed.devices[device].connected}")
-
-
-    def testbed_disconnect(self, testbed): 
-        # Only if a valid testbed was created
-        if testbed: 
-            self.log.info(f"Disconnecting testbed {testbed.name}")
-            for device in testbed.devices: 
-                self.log.info(f"Disconnecting device {device}")
-                testbed.devices[device].settings.GRACEFUL_DISCONNECT_WAIT_SEC = 0
-                testbed.devices[device].settings.POST_DISCONNECT_WAIT_SEC = 0
-                testbed.devices[device].disconnect()
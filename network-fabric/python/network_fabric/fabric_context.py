@@ -0,0 +1,80 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Values resolved once per network-fabric create and shared by the create helpers.
+"""
+
+from .fabric_topology import FabricTopology
+from .fabric_rules import DevicePlatform, stp_guard_mode, trunk_negotiation_disabled
+from .template_batch import TemplateBatch
+
+
+class FabricContext(object):
+    """
+    Fabric wide lookups for a single FabricServiceCallbacks.cb_create.
+
+    Everything the create helpers used to re-read for every trunk and member
+    interface (spanning-tree root, device platforms, trunk negotiation and
+    management addresses) is resolved here once per device. The context also
+    carries the FabricTopology index and the TemplateBatch the helpers queue
+    their template applies on.
+
+    A network-fabric-partition create passes its own service as owner, so the
+    templates are applied (and owned) by the partition, and the devices of the
+    partition so only their platforms are read.
+    """
+
+    def __init__(self, root, service, metrics=None, log=None, owner=None, devices=None):
+        self.root = root
+        self.metrics = metrics
+        self.log = log
+        self.templates = TemplateBatch(owner if owner is not None else service, metrics=metrics, log=log)
+
+        # Switch-pairs, roles, spanning-tree root and layer3 pair of the fabric
+        self.topology = FabricTopology(service)
+        self.root_type, self.root_bridge, self.root_bridge_name = self.topology.spanning_tree_root
+
+        # Platform details for every switch in the fabric (or partition)
+        self.platforms = {}
+        for device_name in (devices if devices is not None else self.topology.devices()):
+            self.platforms[device_name] = self._read_platform(device_name)
+
+        # Resolved on first use as not every device needs them
+        self._trunk_negotiation = {}
+        self._mgmt_ips = {}
+
+    def _read_platform(self, device_name):
+        platform = self.root.devices.device[device_name].platform
+        return DevicePlatform(platform.name, platform.model, platform.version)
+
+    def platform(self, device_name):
+        """Platform details for a fabric switch."""
+
+        return self.platforms[device_name]
+
+    def is_root_bridge(self, device_name):
+        """True if the device is (part of) the spanning-tree root bridge."""
+
+        return self.topology.is_root_bridge(device_name)
+
+    def stp_guard_mode(self, device_name):
+        """Default spanning-tree guard mode for fabric links on a device."""
+
+        return stp_guard_mode(device_name, self.topology.root_bridge_devices)
+
+    def disable_trunk_negotiation(self, device_name):
+        """
+        Older IOS Switches supported both ISL and DOT1Q trunk negotiation.
+        This means it must be explicitly disabled on these platforms.
+        """
+
+        if device_name not in self._trunk_negotiation:
+            self._trunk_negotiation[device_name] = trunk_negotiation_disabled(self.platform(device_name))
+        return self._trunk_negotiation[device_name]
+
+    def mgmt_ip(self, device_name):
+        """Management IP address (without prefix length) of an NX-OS switch."""
+
+        if device_name not in self._mgmt_ips:
+            device = self.root.devices.device[device_name]
+            self._mgmt_ips[device_name] = device.config.interface.mgmt["0"].ip.address.ipaddr.split("/")[0]
+        return self._mgmt_ips[device_name]
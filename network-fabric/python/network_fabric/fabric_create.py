@@ -2,7 +2,16 @@
 import ncs
 from ncs.application import Service
 import resource_manager.id_allocator as id_allocator
-from .helper_functions import find_layer3_switch_pair
+from .fabric_context import FabricContext
+from .fabric_partition import fabric_partitions
+from .fabric_topology import FabricTopology, SWITCH_PAIR
+from .template_batch import TemplateBatch
+from .fabric_rules import system_mtu_configured, jumbo_frame_size, member_interface_template, vpc_keepalive_peers
+from .fabric_rules import FABRIC_TRUNK_MTU, SPANNING_TREE_ROOT_PRIORITY
+from .create_metrics import CreateMetrics
+
+# VPC Domain Id allocations don't redeploy the fabric one by one, the fabric-vpc-domain-id-kicker does it once
+VPC_DOMAIN_ID_REDEPLOY_TYPE = "no-redeploy"
 
 
 # ------------------------
@@ -16,33 +25,57 @@ class FabricServiceCallbacks(Service):
     def cb_create(self, tctx, root, service, proplist):
         self.log.info('Service create(service=', service._path, ')')
 
+        # Timing spans for each phase of the create
+        metrics = CreateMetrics("network-fabric", service.name, log=self.log)
+
         vars = ncs.template.Variables()
         template = ncs.template.Template(service)
         # template.apply('network-fabric-template', vars)
 
         # Setup service wide resource pools 
         self.log.info(f"Creating id-pool VPC-DOMAIN-ID-POOL-{service.name} for fabric")
-        template.apply("fabric-vpc-domain-id-pool")
+        with metrics.span("id-pool-setup"): 
+            template.apply("fabric-vpc-domain-id-pool")
+            metrics.count_template_applies()
+
+        # Reserve the VPC Domain ID of every switch-pair, the fabric is redeployed once they are all allocated
+        with metrics.span("reserve-vpc-domain-ids"): 
+            vpc_domain_ids = self.reserve_vpc_domain_ids(tctx, root, service, metrics)
+
+        # A partitioned fabric leaves the device configuration to a network-fabric-partition per switch-pair and switch
+        if service.partitioned: 
+            with metrics.span("partitions"): 
+                self.partitions_create(service, vpc_domain_ids, metrics)
+            metrics.complete(root, service)
+            return
+
+        # Resolve spanning-tree root, device platforms, etc once for the whole fabric
+        with metrics.span("fabric-context"): 
+            context = FabricContext(root, service, metrics=metrics, log=self.log)
 
         # Process switch-pair 
         for pair in service.switch_pair: 
             self.log.info(f"Calling create for switch-pair {pair.name}")
-            self.switch_pair_create(tctx, root, service, pair)
+            with metrics.span(f"switch-pair-create {pair.name}"): 
+                self.switch_pair_create(tctx, root, context, service, pair, vpc_domain_ids.get(pair.name))
 
         # Process switch 
         for switch in service.switch: 
             self.log.info(f"Calling create for switch {switch.device}")
-            self.switch_create(root, service, switch)
+            with metrics.span(f"switch-create {switch.device}"): 
+                self.switch_create(context, service, switch)
 
         # Spanning-Tree Configuration for Fabric 
         self.log.info(f"Applying Spanning-Tree Root Bridge Configuration to Fabric {service}")
-        self.fabric_spanning_tree_root(tctx, root, service)
+        with metrics.span("fabric-spanning-tree-root"): 
+            self.fabric_spanning_tree_root(tctx, context, service)
 
         # Layer 3 switch-pair setup 
-        layer3_pair = find_layer3_switch_pair(service)
+        layer3_pair = context.topology.layer3_pair
         if layer3_pair: 
             self.log.info(f"Applying Layer 3 Base config onto layer3 pair [{layer3_pair.name}]")
-            self.layer3_switch_pair_setup(tctx, root, layer3_pair, service)
+            with metrics.span("layer3-switch-pair-setup"): 
+                self.layer3_switch_pair_setup(tctx, context, layer3_pair, service)
 
         # Process fabric-interconnects 
         for fi in service.fabric_interconnect: 
@@ -54,46 +87,80 @@ class FabricServiceCallbacks(Service):
             self.log.info(f"Calling create for vcenter {vcenter.device}")
             # NOTE: Currently there are no Fabric level configurations for a vCenter. Configuration is done during Segment Create
 
+        # Apply all of the template applications collected during the create
+        with metrics.span("template-apply"): 
+            context.templates.flush()
+        self.log.info(f"Template batching for {service.name}: {context.templates.summary()}")
+
+        # Keep the create timing in the package metrics store
+        metrics.complete(root, service)
+
+    def partitions_create(self, service, vpc_domain_ids, metrics): 
+        """
+        Create the network-fabric-partition of every switch-pair and switch in the fabric.
+
+        Each partition carries the VPC Domain Id of its switch-pair and the fingerprint of 
+        its part of the fabric, so FASTMAP only redeploys the partitions that changed.
+        """
+
+        templates = TemplateBatch(service, metrics=metrics, log=self.log)
+        partitions = fabric_partitions(service, FabricTopology(service))
+        self.log.info(f"Creating {len(partitions)} network-fabric-partitions for fabric {service.name}")
+
+        for partition_type, partition_name, fingerprint in partitions: 
+            # Left unset on switches, and on switch-pairs while their allocation is pending
+            vpc_domain_id = vpc_domain_ids.get(partition_name) if partition_type == SWITCH_PAIR else None
+
+            partition_vars = ncs.template.Variables()
+            partition_vars.add("PARTITION_TYPE", partition_type)
+            partition_vars.add("PARTITION_NAME", partition_name)
+            partition_vars.add("VPC_DOMAIN_ID", vpc_domain_id or "")
+            partition_vars.add("FINGERPRINT", fingerprint)
+            self.log.info(f"partition_vars={partition_vars}")
+            templates.add("fabric-partition", partition_vars)
+
+        templates.flush()
+        self.log.info(f"Template batching for {service.name}: {templates.summary()}")
+
     # Create and apply configurations for a switch-pair object in the fabric 
-    def switch_pair_create(self, tctx, root, service, pair): 
+    def switch_pair_create(self, tctx, root, context, service, pair, vpc_domain_id=None): 
         self.log.info(f"Processing switch-pair {pair.name}")
 
         # Basic switch setup steps 
         for switch in pair.switch: 
             # Configure Jumbo MTU
-            self.jumbo_mtu_configure(root, service, switch)
+            self.jumbo_mtu_configure(context, service, switch)
 
             # Configure Spanning-Tree mode 
-            self.spanning_tree_mode_apply(service, switch)
+            self.spanning_tree_mode_apply(context, service, switch)
 
         # multiswitch-peerlink configuration 
 
-        # Allocate VPC Domain ID 
-        vpc_domain_id = self.allocate_vpc_domain_id(tctx, root, service, pair)
-
+        # VPC Domain ID from reserve_vpc_domain_ids()
         if not vpc_domain_id: 
             self.log.info(f"VPC Domain ID Allocation not ready - {pair.name}")
         else: 
             self.log.info(f"VPC Domain ID Allocation is {pair.name}: {vpc_domain_id}")
 
             # Build Multiswitch Relationship 
-            multiswitch = self.multiswitch_setup(tctx, root, service, pair, vpc_domain_id)
+            with context.metrics.span("multiswitch-setup"): 
+                multiswitch = self.multiswitch_setup(tctx, context, service, pair, vpc_domain_id)
 
             # Process Fabric Trunks 
             for switch in pair.switch: 
                 self.log.info(f"Setting up fabric-trunks on switch {switch.device}")
                 for trunk in pair.fabric_trunk.port_channel: 
                     self.log.info(f"Calling create for trunk port-channel {trunk.name} [{trunk.description}]")
-                    self.fabric_trunk_create(root, service, switch, trunk, vpc=True)
+                    with context.metrics.span("fabric-trunk-create"): 
+                        self.fabric_trunk_create(context, service, switch, trunk, vpc=True)
 
 
 
-    def multiswitch_setup(self, tctx, root, service, pair, vpc_domain_id): 
+    def multiswitch_setup(self, tctx, context, service, pair, vpc_domain_id): 
 
         self.log.info(f"Setting Multiswitch relationship for {pair.name}")
 
         multiswitch_vars = ncs.template.Variables()
-        template = ncs.template.Template(service)
 
         # Gather common template variables for pair 
         # For consistency with other parts of YANG model, pair.multiswitch_peerlink.port_channel is 
@@ -112,36 +179,16 @@ class FabricServiceCallbacks(Service):
         multiswitch_vars.add("MTU_SIZE", "")
 
 
-        for i, device in enumerate(pair.switch): 
-            if i==0: 
-                primary = root.devices.device[device.device]
-                primary_ip_address = primary.config.interface.mgmt["0"].ip.address.ipaddr
-            elif i==1: 
-                secondary = root.devices.device[device.device]
-                secondary_ip_address = secondary.config.interface.mgmt["0"].ip.address.ipaddr
-
-
-
-        # Setup primary switch-pair member 
-        self.log.info(f"Setting up primary multiswitch member: {primary.name} IP: {primary_ip_address}")
+        # Setup primary and secondary switch-pair members, each keepalive sourced from its own management address
+        for role, (device_name, source, destination) in zip(["primary", "secondary"], vpc_keepalive_peers([switch.device for switch in pair.switch], context.mgmt_ip)): 
+            self.log.info(f"Setting up {role} multiswitch member: {device_name} IP: {source}")
 
-        multiswitch_vars.add("DEVICE_NAME", primary.name)
-        multiswitch_vars.add("VPC_PEER_KEEPALIVE_SOURCE", primary_ip_address.split("/")[0])
-        multiswitch_vars.add("VPC_PEER_KEEPALIVE_DESTINATION", secondary_ip_address.split("/")[0])
+            multiswitch_vars.add("DEVICE_NAME", device_name)
+            multiswitch_vars.add("VPC_PEER_KEEPALIVE_SOURCE", source)
+            multiswitch_vars.add("VPC_PEER_KEEPALIVE_DESTINATION", destination)
 
-        self.log.info(f"multiswitch_vars: {multiswitch_vars}")
-        template.apply("fabric-vpc-domain-base", multiswitch_vars)
-
-
-        # Setup secondary switch-pair member
-        self.log.info(f"Setting up secondary multiswitch member: {secondary.name} IP: {secondary_ip_address}")
-
-        multiswitch_vars.add("DEVICE_NAME", secondary.name)
-        multiswitch_vars.add("VPC_PEER_KEEPALIVE_SOURCE", secondary_ip_address.split("/")[0])
-        multiswitch_vars.add("VPC_PEER_KEEPALIVE_DESTINATION", primary_ip_address.split("/")[0])
-
-        self.log.info(f"multiswitch_vars: {multiswitch_vars}")
-        template.apply("fabric-vpc-domain-base", multiswitch_vars)
+            self.log.info(f"multiswitch_vars: {multiswitch_vars}")
+            context.templates.add("fabric-vpc-domain-base", multiswitch_vars)
 
         # Setup Multiswitch Peerlink Interfaces 
         for switch in pair.switch:
@@ -156,18 +203,24 @@ class FabricServiceCallbacks(Service):
             # VPC Peerlinks can't have explicit jumbo MTU set, switch will set itself
             peerlink_vars.add("MTU_SIZE", "")
 
-            self.port_channel_member_setup(root, service, switch, port_channel, peerlink_vars, stp_guard_mode="")            
+            with context.metrics.span("port-channel-member-setup"): 
+                self.port_channel_member_setup(context, service, switch, port_channel, peerlink_vars, stp_guard_mode="")
 
 
 
-    def port_channel_member_setup(self, root, service, switch, port_channel, vars, stp_guard_mode=None): 
+    def port_channel_member_setup(self, context, service, switch, port_channel, vars, stp_guard_mode=None): 
 
         self.log.info(f"Setting up member interfaces for port-channel {port_channel.name} on switch {switch.device}")
 
-        template = ncs.template.Template(service)
-        switch_platform = root.devices.device[switch.device].platform 
+        switch_platform = context.platform(switch.device)
+
+        # See if an explicit stp_guard_mode provided, else set root guard if the switch is a root bridge
+        if stp_guard_mode is None: 
+            stp_guard_mode = context.stp_guard_mode(switch.device)
 
         vars.add("PORTCHANNEL_ID", port_channel.name)
+        # Spanning-Tree Guard Mode Configuration 
+        vars.add("STP_GUARD_MODE", stp_guard_mode)
 
         for case in port_channel.member_interface: 
             # Note: Reference that there is a "case" that is a "Case" object... this needs to be skipped as finding value in it is unclear 
@@ -175,136 +228,125 @@ class FabricServiceCallbacks(Service):
 
             # Logic to work out which YANG case representing an interface type is used for this trunk
             if isinstance(port_channel.member_interface[case], ncs.maagic.LeafList) and len(port_channel.member_interface[case]) > 0:
-                self.log.info(f"port-channel {port_channel.name} uses member-interface type {case} with {len(port_channel.member_interface[case])} members")
+                member_count = len(port_channel.member_interface[case])
+                self.log.info(f"port-channel {port_channel.name} uses member-interface type {case} with {member_count} members")
 
                 # Pull interface type out of case value (ie 'network-fabric:FortyGigabitEthernet') 
                 member_interface_type = case.split(":")[1]
 
-                # Loop over and process the individual interface members 
-                for interface in port_channel.member_interface[case]: 
-                    self.log.info(f"Processing member-interface {member_interface_type} {interface}")
-
-                    vars.add("INTERFACE_ID", interface)
-                    self.log.info("vars=", vars)
-
-                    # Apply template for member interface based on Platform and Interface Type 
-                    member_interface_template_name = "fabric-portchannel-member-interface-{platform}"
-                    if switch_platform["name"] == "NX-OS" and member_interface_type == "Ethernet": 
-                        member_interface_template_name = member_interface_template_name.format(platform="nxos")
-                    elif switch_platform["name"] == "ios": 
-                        member_interface_template_name = member_interface_template_name.format(platform=f"ios-{member_interface_type.lower()}")
-
-                    # Spanning-Tree Guard Mode Configuration 
-                    root_type, root_bridge, root_bridge_name = self.lookup_spanning_tree_root(service)
-
-                    # See if an explicit stp_guard_mode provided
-                    if stp_guard_mode is None: 
-                        # See if the switch being configured is a root bridge for spanning-tree. if so set root guard
-                        if ((root_type == "switch-pair" and switch.device in [switch.device for switch in root_bridge.switch]) 
-                            or (root_type == "switch" and switch.device == root_bridge.device)): 
-
-                            stp_guard_mode = "root"
-                        
-                        # else default to an empty string to NOT apply a guard mode 
-                        else: 
-                            stp_guard_mode = ""
-
-                    vars.add("STP_GUARD_MODE", stp_guard_mode)
-
-
-
-                    self.log.info(f"Applying interface template {member_interface_template_name}")
-                    template.apply(member_interface_template_name, vars)
-
+                # Apply template for member interface based on Platform and Interface Type 
+                member_interface_template_name = member_interface_template(switch_platform, member_interface_type)
+                if member_interface_template_name is None: 
+                    self.log.info(f"No member interface template for {member_interface_type} interfaces on {switch_platform.name} switch {switch.device}")
+                    continue
 
+                # The member interface templates loop over the member-interface leaf-list of the 
+                # port-channel, so a single apply with the port-channel as context covers all members
+                self.log.info("vars=", vars)
+                self.log.info(f"Applying interface template {member_interface_template_name} for {member_count} {member_interface_type} members")
+                context.templates.add(member_interface_template_name, vars, context=port_channel, count=member_count)
 
         return True
 
     # Resource Allocation for VPC Domain ID for Nexus VPC 
-    def allocate_vpc_domain_id(self, tctx, root, service, pair): 
+    def reserve_vpc_domain_ids(self, tctx, root, service, metrics): 
+        """
+        Request and read the VPC Domain ID of every switch-pair. 
+
+        The requests don't redeploy the fabric as each id is allocated, which would 
+        redeploy a new fabric once per switch-pair. The data kicker of the 
+        fabric-vpc-domain-id-kicker template redeploys it once instead, when every 
+        allocation of the fabric's pool has a response. Pending allocations are counted 
+        in the create metrics to measure how many creates a fabric takes to converge. 
+
+        Return dictionary of {switch-pair name: VPC Domain ID, or None while pending}
+        """
 
-        self.log.info(f"Allocating VPC Domain Id for switch-pair {pair.name}")
         pool_name = "VPC-DOMAIN-ID-POOL-{}".format(service.name)
-        alloc_name = "SWITCH-PAIR-{}".format(pair.name)
-        id_allocator.id_request(
-            service, 
-            "/network-fabric[name='%s']" % (service.name),
-            tctx.username,
-            pool_name,
-            alloc_name,
-            False)
-        vpc_domain_id = id_allocator.id_read(
-            tctx.username,
-            root,
-            pool_name,
-            alloc_name,
-        )
-        self.log.info("vpc_domain_id = {}".format(vpc_domain_id))
-        return vpc_domain_id 
+        pairs = [pair.name for pair in service.switch_pair]
+        if not pairs: 
+            return {}
+
+        self.log.info(f"Requesting VPC Domain Ids for {len(pairs)} switch-pairs")
+        template = ncs.template.Template(service)
+        template.apply("fabric-vpc-domain-id-kicker")
+        metrics.count_template_applies()
+
+        for pair_name in pairs: 
+            id_allocator.id_request(
+                service, 
+                "/network-fabric[name='%s']" % (service.name),
+                tctx.username,
+                pool_name,
+                "SWITCH-PAIR-{}".format(pair_name),
+                False,
+                redeploy_type=VPC_DOMAIN_ID_REDEPLOY_TYPE)
+
+        vpc_domain_ids = {}
+        for pair_name in pairs: 
+            vpc_domain_ids[pair_name] = id_allocator.id_read(
+                tctx.username,
+                root,
+                pool_name,
+                "SWITCH-PAIR-{}".format(pair_name),
+            )
+
+        pending = [pair_name for pair_name, vpc_domain_id in vpc_domain_ids.items() if not vpc_domain_id]
+        metrics.count_pending_allocations(len(pending))
+        if pending: 
+            self.log.info(f"VPC Domain Id allocations pending for {len(pending)} of {len(pairs)} switch-pairs: {', '.join(pending)}")
+        self.log.info("vpc_domain_ids = {}".format(vpc_domain_ids))
+        return vpc_domain_ids
 
 
     # Apply MTU Configuration on switch 
-    def jumbo_mtu_configure(self, root, service, switch):
+    def jumbo_mtu_configure(self, context, service, switch):
         mtu_vars = ncs.template.Variables()
-        template = ncs.template.Template(service)
 
-        switch_platform = root.devices.device[switch.device].platform 
+        switch_platform = context.platform(switch.device)
 
         # Enable System Jumbo Frames
         # Catalyst Switches 3850 and 9300 max at 9198
-        if switch_platform["name"] == "ios" and switch_platform["model"] in ["3850", "9300", "NETSIM"]:
-            mtu_vars.add("FRAME_SIZE", "9198")
-        else: 
-            mtu_vars.add("FRAME_SIZE", "9216")
+        mtu_vars.add("FRAME_SIZE", jumbo_frame_size(switch_platform))
 
         mtu_vars.add("DEVICE_NAME", switch.device)
         self.log.info("Setting up Jumbo System MTU on switch {}".format(switch.device))
         self.log.info("mtu_vars=", mtu_vars)
 
-        # Nexus switches have jumbomtu set to 9216 as default, setting it in NSO can cause compare-config failures 
-        if switch_platform.name == "NX-OS": 
-            self.log.info(f"Skipping explicit configuration of Jumbo System MTU on switch {switch.device} because {switch_platform.name} defaults to 9216.")
-        # IOSv L2 switches in CML do not have the same system Jumbo configu for MTU that physical switches do
-        elif switch_platform["model"] == "IOSv": 
-            self.log.info(f"Skipping explicit configuration of Jumbo System MTU on switch {switch.device} because {switch_platform['model']} doesn't support system wide MTU setting.")
+        # Nexus switches default to 9216 and IOSv L2 switches in CML don't support a system wide MTU setting
+        if not system_mtu_configured(switch_platform): 
+            self.log.info(f"Skipping explicit configuration of Jumbo System MTU on switch {switch.device} because {switch_platform.name} {switch_platform.model} sets its own.")
         else: 
-            template.apply("fabric-system-jumbo-frames", mtu_vars)
+            context.templates.add("fabric-system-jumbo-frames", mtu_vars)
 
     # Create and apply configurations for switch objects in the fabric
-    def switch_create(self, root, service, switch):
+    def switch_create(self, context, service, switch):
         self.log.info(f"Processing switch {switch.device}")
 
         # Switch platform specific configuration values
-        switch_platform = root.devices.device[switch.device].platform 
+        switch_platform = context.platform(switch.device)
         self.log.info(f"Platform Name: {switch_platform.name} Version: {switch_platform.version} Model: {switch_platform.model}")
 
         # Configure Jumbo MTU
-        self.jumbo_mtu_configure(root, service, switch)
+        self.jumbo_mtu_configure(context, service, switch)
 
         # TODO: If NX-OS switch need to enable feature lacp
 
         # Configure Spanning-Tree mode 
-        self.spanning_tree_mode_apply(service, switch)
+        self.spanning_tree_mode_apply(context, service, switch)
 
         # Process Fabric Trunks 
         for trunk in switch.fabric_trunk.port_channel: 
             self.log.info(f"Calling create for trunk port-channel {trunk.name} [{trunk.description}]")
-            self.fabric_trunk_create(root, service, switch, trunk)
+            with context.metrics.span("fabric-trunk-create"): 
+                self.fabric_trunk_create(context, service, switch, trunk)
 
     # Function to create a Fabric Trunk Interface 
-    def fabric_trunk_create(self, root, service, switch, trunk, vpc=""): 
+    def fabric_trunk_create(self, context, service, switch, trunk, vpc=""): 
         trunk_vars = ncs.template.Variables()
-        template = ncs.template.Template(service)
-
-        # Switch platform specific configuration values
-        switch_platform = root.devices.device[switch.device].platform 
-        # self.log.info(f"Platform Name: {switch_platform.name} Version: {switch_platform.version} Model: {switch_platform.model}")
 
         # Older IOS Switches supported both ISL and DOT1Q trunk negotiation. This means it must be explicitly disabled on these platforms
-        if switch_platform["model"] != "NETSIM" and switch_platform["name"] == "ios" and int(switch_platform["version"][0:2]) < 16: 
-            disable_trunk_negotiation = True 
-        else: 
-            disable_trunk_negotiation = False
+        disable_trunk_negotiation = context.disable_trunk_negotiation(switch.device)
 
         self.log.info("Setting up fabric-trunk port-channel {} on switch {}".format(trunk.name, switch.device))
         trunk_vars.add("DEVICE_NAME", switch.device)
@@ -316,49 +358,42 @@ class FabricServiceCallbacks(Service):
         trunk_vars.add("VLAN_ID", "all")
         trunk_vars.add("DISABLE_TRUNK_NEGOTIATION", disable_trunk_negotiation)
         # Note: IOS switches don't use an interface level MTU configuration so this value is ignored
-        trunk_vars.add("MTU_SIZE", "9216")
+        trunk_vars.add("MTU_SIZE", FABRIC_TRUNK_MTU)
 
         # Spanning-Tree Guard Mode Configuration 
-        root_type, root_bridge, root_bridge_name = self.lookup_spanning_tree_root(service)
-        stp_guard_mode = ""
-
         # See if the switch being configured is a root bridge for spanning-tree. if so set root guard
-        if ((root_type == "switch-pair" and switch.device in [switch.device for switch in root_bridge.switch]) 
-            or (root_type == "switch" and switch.device == root_bridge.device)): 
-
-            stp_guard_mode = "root"
-
+        stp_guard_mode = context.stp_guard_mode(switch.device)
         trunk_vars.add("STP_GUARD_MODE", stp_guard_mode)
 
         self.log.info("trunk_vars=", trunk_vars)
-        template.apply("fabric-portchannel-interface", trunk_vars)
+        context.templates.add("fabric-portchannel-interface", trunk_vars)
 
 
         # self.log.info(f"choice_member_interface = {trunk.member_interface.choice_member_interface}")
         # self.log.info(f"choice_member_interface value = {type(trunk.member_interface.choice_member_interface._parent.get_value())}")
 
         # Setup member interfaces
-        self.port_channel_member_setup(root, service, switch, trunk, trunk_vars)            
+        with context.metrics.span("port-channel-member-setup"): 
+            self.port_channel_member_setup(context, service, switch, trunk, trunk_vars)
 
 
     # Functions to apply spanning-tree configuration to fabric 
-    def spanning_tree_mode_apply(self, service, switch):
+    def spanning_tree_mode_apply(self, context, service, switch):
         """
         Configure the Spanning-Tree Mode on a switch.
         """
 
         switch_vars = ncs.template.Variables()
-        template = ncs.template.Template(service)
 
         # Configure Spanning-Tree Mode
         switch_vars.add("DEVICE_NAME", switch.device)
 
         self.log.info(f"Configuring Spanning-Tree Mode on switch {switch.device}")
         self.log.info(f"switch_vars={switch_vars}")
-        template.apply("fabric-spanning-tree-mode", switch_vars)
+        context.templates.add("fabric-spanning-tree-mode", switch_vars)
 
 
-    def fabric_spanning_tree_root(self, tctx, root, service): 
+    def fabric_spanning_tree_root(self, tctx, context, service): 
         """
         Configure Spanning-Tree Root Bridge appropriately on the network-fabric. 
         Focusing on: 
@@ -372,13 +407,12 @@ class FabricServiceCallbacks(Service):
 
         # Template objects
         stp_vars = ncs.template.Variables()
-        template = ncs.template.Template(service)
 
         # Basic Spanning-Tree Best practices 
         #   Spanning-Tree Version rpvst 
 
         # Determine Spanning-Tree Root for fabric
-        root_type, root_bridge, root_bridge_name = self.lookup_spanning_tree_root(service)
+        root_type, root_bridge, root_bridge_name = context.root_type, context.root_bridge, context.root_bridge_name
         self.log.info(f"The {root_type} {root_bridge_name} was selected as root.")
 
         # Configure Spanning-Tree Priority on Root 
@@ -386,38 +420,10 @@ class FabricServiceCallbacks(Service):
             for switch in root_bridge.switch: 
                 self.log.info(f"Configuring spanning-tree priority on switch {switch.device}.")
                 stp_vars.add("DEVICE_NAME", switch.device)
-                stp_vars.add("STP_PRIORITY", 4096)
+                stp_vars.add("STP_PRIORITY", SPANNING_TREE_ROOT_PRIORITY)
 
                 self.log.info(f"stp_vars={stp_vars}")
-                template.apply("fabric-spanning-tree-priority", stp_vars)
-
-    def lookup_spanning_tree_root(self, service): 
-        """
-        Lookup the spanning-tree root configured for a service. 
-
-        Return tuple with (root_type, root_bridge, root_bridge_name)
-
-        If no spanning-tree root is configured, return (None, None, None)
-        """
-
-        # Determine Spanning-Tree Root and Configure 
-        root_type, root_bridge, root_bridge_name = None, None, None
-
-        # Check if a spanning-tree root is configured
-        for case in service.spanning_tree.root: 
-            # Check for a configured value for each choice option
-            if case == "network-fabric:switch-pair" and service.spanning_tree.root[case]: 
-                # self.log.info(f"The switch-pair {service.spanning_tree.root[case]} was selected as root.")
-                root_type = "switch-pair"
-                root_bridge = service.switch_pair[service.spanning_tree.root[case]]
-                root_bridge_name = root_bridge.name
-            elif case == "network-fabric:switch" and service.spanning_tree.root[case]: 
-                # self.log.info(f"The switch {service.spanning_tree.root[case]} was selected as root.")
-                root_type = "switch"
-                root_bridge = service.switch[service.spanning_tree.root[case]]
-                root_bridge_name = root_bridge.device
-
-        return (root_type, root_bridge, root_bridge_name)                
+                context.templates.add("fabric-spanning-tree-priority", stp_vars)
 
     def select_spanning_tree_root(self, service): 
         """
@@ -460,19 +466,18 @@ class FabricServiceCallbacks(Service):
         return (root_type, root_bridge, root_bridge_name)
 
     # Apply the basic layer3 config onto the switches in a layer3 pair
-    def layer3_switch_pair_setup(self, tctx, root, pair, service): 
+    def layer3_switch_pair_setup(self, tctx, context, pair, service): 
         """
         Apply base Layer Config onto a Switch Pair's member switches.
         """
 
         vars = ncs.template.Variables()
-        template = ncs.template.Template(service)
 
         for switch in pair.switch: 
             self.log.info(f"Setting up switch {switch.device} in {pair.name} for layer3.")
             vars.add("DEVICE_NAME", switch.device)
             self.log.info(f"vars={vars}")
-            template.apply("fabric-layer3-setup", vars)
+            context.templates.add("fabric-layer3-setup", vars)
 
 
 
@@ -497,3 +502,57 @@ class FabricServiceCallbacks(Service):
     # def cb_post_modification(self, tctx, op, kp, root, proplist):
     #     self.log.info('Service postmod(service=', kp, ')')
 
+
+# -----------------------------------------------
+# SERVICE CALLBACK FOR PARTITIONED NETWORK-FABRIC
+# -----------------------------------------------
+class FabricPartitionCallbacks(FabricServiceCallbacks):
+    """
+    Create for a network-fabric-partition, the device configuration of a single switch-pair 
+    or switch of a partitioned network-fabric. Uses the same helpers as the network-fabric 
+    create, on the fabric the partition belongs to.
+    """
+
+    @Service.create
+    def cb_create(self, tctx, root, service, proplist):
+        self.log.info('Service create(service=', service._path, ')')
+
+        metrics = CreateMetrics("network-fabric-partition", f"{service.fabric} {service.type} {service.name}", log=self.log)
+        fabric = root.network_fabric[service.fabric]
+
+        if str(service.type) == SWITCH_PAIR: 
+            pair = fabric.switch_pair[service.name]
+            devices = [switch.device for switch in pair.switch]
+        else: 
+            switch = fabric.switch[service.name]
+            devices = [switch.device]
+
+        # Only the platforms of the partition's switches are read, templates are owned by the partition
+        with metrics.span("fabric-context"): 
+            context = FabricContext(root, fabric, metrics=metrics, log=self.log, owner=service, devices=devices)
+
+        if str(service.type) == SWITCH_PAIR: 
+            self.log.info(f"Calling create for switch-pair {pair.name}")
+            with metrics.span(f"switch-pair-create {pair.name}"): 
+                self.switch_pair_create(tctx, root, context, fabric, pair, service.vpc_domain_id)
+
+            # Spanning-Tree root priority and layer3 base config belong to the partition of their switch-pair
+            if context.root_type == SWITCH_PAIR and context.root_bridge_name == pair.name: 
+                self.log.info(f"Applying Spanning-Tree Root Bridge Configuration to switch-pair {pair.name}")
+                with metrics.span("fabric-spanning-tree-root"): 
+                    self.fabric_spanning_tree_root(tctx, context, fabric)
+
+            if pair.layer3: 
+                self.log.info(f"Applying Layer 3 Base config onto layer3 pair [{pair.name}]")
+                with metrics.span("layer3-switch-pair-setup"): 
+                    self.layer3_switch_pair_setup(tctx, context, pair, fabric)
+        else: 
+            self.log.info(f"Calling create for switch {switch.device}")
+            with metrics.span(f"switch-create {switch.device}"): 
+                self.switch_create(context, fabric, switch)
+
+        with metrics.span("template-apply"): 
+            context.templates.flush()
+        self.log.info(f"Template batching for {service.name}: {context.templates.summary()}")
+
+        metrics.complete(root, service)
@@ -0,0 +1,34 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Partitions of a partitioned network-fabric: each switch-pair and standalone switch
+deployed as its own network-fabric-partition service (a stacked service).
+
+The network-fabric create only writes a partition entry per switch-pair and switch,
+with a fingerprint of everything the partition create reads from the fabric. FASTMAP
+only redeploys the partitions whose entry changed, so a change to one switch-pair
+doesn't re-run the templates of the rest of the fabric.
+"""
+
+from .fabric_topology import SWITCH_PAIR, SWITCH
+from .intent_render import switch_pair_intent, switch_intent, partition_fingerprint
+
+
+def fabric_partitions(service, topology):
+    """
+    The partitions of a network-fabric. Only the fabric configuration is read, no device data.
+
+    Return list of (partition type, partition name, fingerprint)
+    """
+
+    root_type, root_bridge_name = topology.spanning_tree_root[0], topology.root_bridge_name
+
+    partitions = []
+    for pair in service.switch_pair:
+        root_bridge = root_type == SWITCH_PAIR and root_bridge_name == pair.name
+        partitions.append((SWITCH_PAIR, str(pair.name), partition_fingerprint(switch_pair_intent(pair), root_bridge)))
+
+    for switch in service.switch:
+        root_bridge = root_type == SWITCH and root_bridge_name == switch.device
+        partitions.append((SWITCH, str(switch.device), partition_fingerprint(switch_intent(switch), root_bridge)))
+
+    return partitions
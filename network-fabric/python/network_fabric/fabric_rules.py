@@ -0,0 +1,93 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Platform and topology rules that decide the device configuration of a network-fabric.
+
+Used by the service create (FabricServiceCallbacks and FabricContext) and by the
+intent renderer (intent_render), so both always make the same decisions. Nothing
+here reads NSO data, every rule works on plain values.
+"""
+
+# Spanning-tree priority configured on the root bridge, for every VLAN below SPANNING_TREE_MAX_VLAN
+SPANNING_TREE_ROOT_PRIORITY = 4096
+SPANNING_TREE_MAX_VLAN = 3968
+
+# MTU of fabric-trunk port-channels
+FABRIC_TRUNK_MTU = "9216"
+
+
+class DevicePlatform(object):
+    """Platform details of an NSO device, copied out of the maagic tree."""
+
+    def __init__(self, name, model, version):
+        self.name = name
+        self.model = model
+        self.version = version
+
+
+def system_mtu_configured(platform):
+    """
+    False for platforms whose system jumbo MTU must not be set by NSO.
+
+    Nexus switches have jumbomtu set to 9216 as default, setting it in NSO can cause
+    compare-config failures. IOSv L2 switches in CML don't support a system wide MTU.
+    """
+
+    return platform.name != "NX-OS" and platform.model != "IOSv"
+
+
+def jumbo_frame_size(platform):
+    """System jumbo frame size for a switch. Catalyst Switches 3850 and 9300 max at 9198."""
+
+    if platform.name == "ios" and platform.model in ["3850", "9300", "NETSIM"]:
+        return "9198"
+    return "9216"
+
+
+def trunk_negotiation_disabled(platform):
+    """
+    Older IOS Switches supported both ISL and DOT1Q trunk negotiation.
+    This means it must be explicitly disabled on these platforms.
+    """
+
+    return platform.model != "NETSIM" and platform.name == "ios" and int(platform.version[0:2]) < 16
+
+
+def stp_guard_mode(device_name, root_bridge_devices):
+    """Default spanning-tree guard mode for fabric links on a device, root guard on the root bridge."""
+
+    return "root" if device_name in root_bridge_devices else ""
+
+
+def member_interface_template(platform, member_interface_type):
+    """
+    Template for the member interfaces of a port-channel, from the switch platform and
+    the member interface type (ie "Ethernet" or "FortyGigabitEthernet").
+
+    Return None when there's no template for the combination.
+    """
+
+    if platform.name == "NX-OS" and member_interface_type == "Ethernet":
+        return "fabric-portchannel-member-interface-nxos"
+    elif platform.name == "ios":
+        return f"fabric-portchannel-member-interface-ios-{member_interface_type.lower()}"
+    return None
+
+
+def vpc_keepalive_peers(devices, mgmt_ip):
+    """
+    VPC peer-keepalive settings of the members of a switch-pair. The first switch is
+    the primary and the second the secondary, each keepalive is sourced from its own
+    management address towards the other member's.
+
+    mgmt_ip is a function returning the management address of a device.
+
+    Return list of (device, keepalive source, keepalive destination)
+    """
+
+    primary, secondary = devices[0], devices[1]
+    primary_ip_address, secondary_ip_address = mgmt_ip(primary), mgmt_ip(secondary)
+
+    return [
+        (primary, primary_ip_address, secondary_ip_address),
+        (secondary, secondary_ip_address, primary_ip_address),
+    ]
@@ -0,0 +1,113 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Index of the switches, switch-pairs, spanning-tree root and layer3 pair of a network-fabric.
+"""
+
+from .helper_functions import find_layer3_switch_pair, lookup_spanning_tree_root
+
+# Roles a switch can have in a fabric
+SWITCH_PAIR = "switch-pair"
+SWITCH = "switch"
+
+
+class FabricTopology(object):
+    """
+    Lookups on the structure of a network-fabric, built once per create or test action
+    and shared by everything that needs them instead of re-scanning the service lists.
+
+    Each part is read from the service on first use, so a caller that only needs the
+    layer3 switch-pair (like the network-tenant create) doesn't read every switch.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self._layer3_pair = None
+        self._layer3_resolved = False
+        self._root = None
+        self._root_bridge_devices = None
+        self._pair_of = None
+        self._pair_devices = None
+        self._roles = None
+
+    @property
+    def layer3_pair(self):
+        """The layer3 enabled switch-pair of the fabric, or None."""
+
+        if not self._layer3_resolved:
+            self._layer3_pair = find_layer3_switch_pair(self.service)
+            self._layer3_resolved = True
+        return self._layer3_pair
+
+    @property
+    def spanning_tree_root(self):
+        """Tuple with (root_type, root_bridge, root_bridge_name), see lookup_spanning_tree_root."""
+
+        if self._root is None:
+            self._root = lookup_spanning_tree_root(self.service)
+        return self._root
+
+    @property
+    def root_bridge_name(self):
+        return self.spanning_tree_root[2]
+
+    @property
+    def root_bridge_devices(self):
+        """Set of the devices that make up the spanning-tree root bridge."""
+
+        if self._root_bridge_devices is None:
+            root_type, root_bridge, root_bridge_name = self.spanning_tree_root
+            if root_type == SWITCH_PAIR:
+                # Read from the root switch-pair itself, so a single partition doesn't index the whole fabric
+                self._root_bridge_devices = frozenset(switch.device for switch in root_bridge.switch)
+            elif root_type == SWITCH:
+                self._root_bridge_devices = frozenset([root_bridge_name])
+            else:
+                self._root_bridge_devices = frozenset()
+        return self._root_bridge_devices
+
+    def is_root_bridge(self, device_name):
+        """True if the device is (part of) the spanning-tree root bridge."""
+
+        return device_name in self.root_bridge_devices
+
+    def _index(self):
+        """Map every switch to its role and switch-pair in one pass over the fabric."""
+
+        if self._roles is not None:
+            return
+
+        self._pair_of = {}
+        self._pair_devices = {}
+        self._roles = {}
+        for pair in self.service.switch_pair:
+            devices = [switch.device for switch in pair.switch]
+            self._pair_devices[pair.name] = devices
+            for device_name in devices:
+                self._pair_of[device_name] = pair.name
+                self._roles[device_name] = SWITCH_PAIR
+        for switch in self.service.switch:
+            self._roles[switch.device] = SWITCH
+
+    def pair_devices(self, pair_name):
+        """The devices in a switch-pair."""
+
+        self._index()
+        return self._pair_devices.get(pair_name, [])
+
+    def pair_name(self, device_name):
+        """The switch-pair a device belongs to, or None for standalone switches."""
+
+        self._index()
+        return self._pair_of.get(device_name)
+
+    def role(self, device_name):
+        """SWITCH_PAIR or SWITCH for a device in the fabric, None if it isn't a fabric switch."""
+
+        self._index()
+        return self._roles.get(device_name)
+
+    def devices(self):
+        """All switches in the fabric."""
+
+        self._index()
+        return list(self._roles)
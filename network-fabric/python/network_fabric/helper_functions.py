@@ -3,41 +3,76 @@
 Functions used across the different Network Fabric Python modules.
 """
 
+import ncs
 from _ncs import decrypt
 
 
 def find_layer3_switch_pair(fabric): 
     """Function to locate the Layer 3 enabled switch-pair on a fabric."""
 
-    layer3_pair = None
+    # YANG allows a single layer3 switch-pair per fabric, so stop at the first one
     for pair in fabric.switch_pair: 
         if pair.layer3: 
-            layer3_pair = pair 
+            return pair 
     
-    return layer3_pair
+    return None
 
 
-def test_results_action_output(test_name, result, action_output): 
+def lookup_spanning_tree_root(service): 
     """
-    Given a test results dictionary, create action outputs for errors.
+    Lookup the spanning-tree root configured for a network-fabric service. 
+
+    Return tuple with (root_type, root_bridge, root_bridge_name)
+
+    If no spanning-tree root is configured, return (None, None, None)
     """
 
-    # Update action output and results
-    if not result["success"]:
-        for error in result["error"]: 
-            test_error = action_output.error.create()
-            test_error.test = test_name
-            test_error.message = error
+    root_type, root_bridge, root_bridge_name = None, None, None
+
+    # Check if a spanning-tree root is configured
+    for case in service.spanning_tree.root: 
+        # Check for a configured value for each choice option
+        if case == "network-fabric:switch-pair" and service.spanning_tree.root[case]: 
+            root_type = "switch-pair"
+            root_bridge = service.switch_pair[service.spanning_tree.root[case]]
+            root_bridge_name = root_bridge.name
+        elif case == "network-fabric:switch" and service.spanning_tree.root[case]: 
+            root_type = "switch"
+            root_bridge = service.switch[service.spanning_tree.root[case]]
+            root_bridge_name = root_bridge.device
 
+    return (root_type, root_bridge, root_bridge_name)
 
-def test_action_overall_status(action_output): 
+
+def vlan_ranges(vlans): 
+    """
+    Compact a collection of VLAN ids into ranges, ie [10, 11, 12, 20] to "10-12,20".
     """
-    Update the overall status of a test action.
+
+    ranges = []
+    for vlan in sorted(set(vlans)): 
+        if ranges and vlan == ranges[-1][1] + 1: 
+            ranges[-1][1] = vlan
+        else: 
+            ranges.append([vlan, vlan])
+
+    return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+def write_operational(username, path, update, description="operational data", log=None): 
+    """
+    Apply update to the node at path in a separate operational transaction, for the
+    state test actions record as they run. A failed write is logged rather than raised,
+    so it never fails the test itself.
+
+    Return True if the update was written
     """
 
-    if len(action_output.error) == 0: 
-        action_output.message = "Test was successful"
-        action_output.success = True
-    else: 
-        action_output.message = "Errors were encountered during test."
-        action_output.success = False
+    try: 
+        with ncs.maapi.single_write_trans(username, "system", db=ncs.OPERATIONAL) as t: 
+            update(ncs.maagic.get_node(t, path))
+            t.apply()
+        return True
+    except Exception as e: 
+        if log: log.info(f"Unable to record {description} for {path}: {e}")
+        return False
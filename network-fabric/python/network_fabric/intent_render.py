@@ -0,0 +1,612 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Dry-run renderer for network-fabric intent: the device configuration a fabric and its
+tenants produce, computed in plain Python without FASTMAP or CDB writes.
+
+An intent is a plain, JSON serialisable description of a fabric (see fabric_intent()),
+read from the service in NSO or from a JSON export of it. render_intent() makes the
+template applies of the service create, with the same rules (see fabric_rules) and
+variables, and evaluates the template XML offline (see template_render) into a
+normalized per-device model. diff_intents() compares two revisions so a change can be
+pre-screened and the commit dry-run skipped when no device would change.
+
+The render of each switch-pair and switch is cached by the fingerprint of its part of
+the intent (see partition_fingerprint()), so rendering a revision only renders the
+switch-pairs and switches that changed since a render of the other revision.
+
+The module only needs the standard library, so it can also be run outside NSO:
+
+    python -m network_fabric.intent_render old.json new.json --devices devices.json
+
+Files are a network-fabric JSON export (show running-config network-fabric | display json),
+optionally with network-tenant entries, or an intent saved with --save. The exit status
+is 0 when no device configuration changes and 1 when some does.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from collections import OrderedDict
+
+from .fabric_rules import DevicePlatform, FABRIC_TRUNK_MTU, SPANNING_TREE_ROOT_PRIORITY
+from .fabric_rules import jumbo_frame_size, member_interface_template, stp_guard_mode, system_mtu_configured
+from .fabric_rules import trunk_negotiation_disabled, vpc_keepalive_peers
+from .template_render import DeviceTemplates, NX_OS_NED, IOS_NED
+
+# Stand-in for VPC Domain Ids not known to the intent (allocated by the resource-manager)
+VPC_DOMAIN_ID_ALLOCATED = "allocated"
+
+SWITCH_PAIR = "switch-pair"
+SWITCH = "switch"
+
+# Switch-pair and switch renders kept by render_intent(), enough for both revisions of a few large fabrics
+RENDER_CACHE_SIZE = 1024
+
+
+# -------------------------
+# Reading intent
+# -------------------------
+def _child(node, name):
+    """
+    A child of a maagic node or of a JSON object, by its YANG name.
+    JSON members may carry the module prefix, ie "network-fabric:switch-pair".
+    """
+
+    if node is None:
+        return None
+    if isinstance(node, dict):
+        for key in (name, f"network-fabric:{name}", f"network-tenant:{name}"):
+            if key in node:
+                return node[key]
+        return None
+    return getattr(node, name.replace("-", "_"), None)
+
+
+def _entries(node, name):
+    """The entries of a list child, or [] when it isn't set."""
+
+    entries = _child(node, name)
+    return list(entries) if entries is not None else []
+
+
+def _cases(choice):
+    """(case name without prefix, value) of every case set in a choice container."""
+
+    if choice is None:
+        return []
+    if isinstance(choice, dict):
+        return [(case.split(":")[-1], value) for case, value in choice.items()]
+    return [(case.split(":")[-1], choice[case]) for case in choice]
+
+
+def _port_channels(node):
+    """Intent of the port-channel list of a multiswitch-peerlink or fabric-trunk container."""
+
+    port_channels = []
+    for port_channel in _entries(node, "port-channel"):
+        members = {}
+        for interface_type, interfaces in _cases(_child(port_channel, "member-interface")):
+            # Skip the choice itself and the cases with no interfaces
+            if interface_type != "member-interface" and interfaces is not None and len(interfaces) > 0:
+                members[interface_type] = [str(interface) for interface in interfaces]
+        description = _child(port_channel, "description")
+        port_channels.append({
+            "name": str(_child(port_channel, "name")),
+            "description": str(description) if description is not None else None,
+            "members": members,
+        })
+    return port_channels
+
+
+def _device_details(devices, device_name):
+    """Platform and management address of a device from root.devices.device or a dictionary."""
+
+    if isinstance(devices, dict):
+        details = devices.get(device_name, {})
+        return {"platform": dict(details.get("platform", {})), "mgmt-ip": details.get("mgmt-ip")}
+
+    device = devices[device_name]
+    platform = device.platform
+    try:
+        mgmt_ip = device.config.interface.mgmt["0"].ip.address.ipaddr.split("/")[0]
+    except (AttributeError, KeyError):
+        mgmt_ip = None
+    return {
+        "platform": {"name": platform.name, "model": platform.model, "version": platform.version},
+        "mgmt-ip": mgmt_ip,
+    }
+
+
+def switch_pair_intent(pair, vpc_domain_id=None):
+    """Intent of a switch-pair of a network-fabric, from its maagic node or JSON object."""
+
+    layer3 = _child(pair, "layer3")
+    return {
+        "name": str(_child(pair, "name")),
+        "layer3": layer3 is True or str(layer3).lower() == "true",
+        "switches": [str(_child(switch, "device")) for switch in _entries(pair, "switch")],
+        "vpc-domain-id": vpc_domain_id,
+        "multiswitch-peerlink": _port_channels(_child(pair, "multiswitch-peerlink")),
+        "fabric-trunk": _port_channels(_child(pair, "fabric-trunk")),
+    }
+
+
+def switch_intent(switch):
+    """Intent of a standalone switch of a network-fabric, from its maagic node or JSON object."""
+
+    return {
+        "device": str(_child(switch, "device")),
+        "fabric-trunk": _port_channels(_child(switch, "fabric-trunk")),
+    }
+
+
+def fabric_intent(service, devices, tenants=(), vpc_domain_ids=None):
+    """
+    Read the intent of a network-fabric.
+
+    service is the maagic network-fabric node or its JSON object, devices is
+    root.devices.device or a dictionary of {device: {"platform": {"name", "model",
+    "version"}, "mgmt-ip"}}, tenants the network-tenant nodes or JSON objects on the
+    fabric and vpc_domain_ids an optional dictionary of {switch-pair: VPC Domain Id}.
+
+    Return dictionary that can be saved as JSON and passed to render_intent()
+    """
+
+    vpc_domain_ids = vpc_domain_ids or {}
+
+    root_type, root_name = None, None
+    for case, value in _cases(_child(_child(service, "spanning-tree"), "root")):
+        if case in (SWITCH_PAIR, SWITCH) and value:
+            root_type, root_name = case, str(value)
+
+    intent = {
+        "fabric": str(_child(service, "name")),
+        "spanning-tree-root": {"type": root_type, "name": root_name},
+        "switch-pairs": [],
+        "switches": [],
+        "devices": {},
+        "tenants": [],
+    }
+
+    for pair in _entries(service, "switch-pair"):
+        intent["switch-pairs"].append(switch_pair_intent(pair, vpc_domain_ids.get(str(_child(pair, "name")))))
+
+    for switch in _entries(service, "switch"):
+        intent["switches"].append(switch_intent(switch))
+
+    for device_name in [d for pair in intent["switch-pairs"] for d in pair["switches"]] + [s["device"] for s in intent["switches"]]:
+        intent["devices"][device_name] = _device_details(devices, device_name)
+
+    for tenant in tenants:
+        layer3 = _child(tenant, "layer3")
+        enabled = _child(layer3, "enabled")
+        if enabled is True or str(enabled).lower() == "true":
+            intent["tenants"].append({
+                "name": str(_child(tenant, "name")),
+                "vrfs": [str(vrf) for vrf in (_child(layer3, "vrf") or [])],
+            })
+
+    return intent
+
+
+def partition_fingerprint(intent, root_bridge):
+    """
+    Fingerprint the fabric configuration of a partition.
+
+    root_bridge is part of it, as it decides the spanning-tree priority and guard mode of the partition's switches.
+    """
+
+    data = json.dumps({"intent": intent, "root-bridge": root_bridge}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def service_intent(root, service):
+    """Read the intent of a network-fabric and its network-tenants from NSO."""
+
+    tenants = [tenant for tenant in getattr(root, "network_tenant", []) if tenant.fabric == service.name]
+    return fabric_intent(service, root.devices.device, tenants=tenants)
+
+
+def export_intents(config, devices=None):
+    """
+    Read every network-fabric (and the network-tenants on it) from a JSON export.
+
+    Return dictionary of {fabric name: intent}
+    """
+
+    devices = devices or {}
+    tenants = _entries(config, "network-tenant")
+    intents = {}
+    for fabric in _entries(config, "network-fabric"):
+        name = str(_child(fabric, "name"))
+        intents[name] = fabric_intent(fabric, devices, tenants=[t for t in tenants if str(_child(t, "fabric")) == name])
+    return intents
+
+
+# -------------------------
+# Rendering intent
+# -------------------------
+# The package's device templates, parsed on first use
+DEVICE_TEMPLATES = DeviceTemplates()
+
+
+def device_ned(platform):
+    """Namespace of the NED of a device, from its DevicePlatform."""
+
+    return NX_OS_NED if platform.name == "NX-OS" else IOS_NED
+
+
+def _section(path):
+    """
+    (section, setting) of a config path rendered by template_render: the section is the path
+    down to the first list entry (ie "interface port-channel 11") and the setting the rest of it.
+    """
+
+    names = [" ".join(segment) for segment in path]
+    for index, segment in enumerate(path):
+        if len(segment) == 2:
+            return (" ".join(names[:index + 1]), " ".join(names[index + 1:]))
+    return (names[0], " ".join(names[1:]))
+
+
+class DeviceModel(object):
+    """
+    Normalized configuration of the devices of a fabric: {device: {section: {setting: value}}}.
+
+    The configuration is rendered from the template XML (see template_render), so it
+    follows the templates as they change. Sections are named after the config path down
+    to the first list entry (ie "interface port-channel 11") and settings after the rest
+    of the path (ie "enable switchport"). Settings set by several applies are merged, as
+    NSO merges template applies. Every apply is kept in applies as (template, variables)
+    and the templates applied to each device in templates.
+    """
+
+    def __init__(self, device_templates=None):
+        self.device_templates = device_templates or DEVICE_TEMPLATES
+        self.devices = {}
+        self.templates = set()
+        self.applies = []
+
+    def apply(self, template, variables, context=None, ned=None):
+        """
+        Render a template apply into the model.
+
+        Values are converted with str() like ncs.template.Variables does, ie True is 'True'.
+        context is the context node of the apply and ned the NED namespace of the device.
+        """
+
+        variables = {name: str(value) for name, value in variables.items()}
+        self.applies.append((template, variables))
+        if variables.get("DEVICE_NAME"):
+            self.templates.add((variables["DEVICE_NAME"], template))
+
+        for device_name, path, value in self.device_templates.render(template, variables, context=context, ned=ned):
+            section, setting = _section(path)
+            settings = self.devices.setdefault(device_name, {}).setdefault(section, {})
+            if setting:
+                settings[setting] = value
+
+    def merge(self, other):
+        """Add the applies rendered into another model, as if they were made on this one."""
+
+        for device_name, sections in other.devices.items():
+            device = self.devices.setdefault(device_name, {})
+            for section, settings in sections.items():
+                device.setdefault(section, {}).update(settings)
+        self.templates |= other.templates
+        self.applies.extend(other.applies)
+
+    def as_dict(self):
+        return {device: dict(sorted(sections.items())) for device, sections in sorted(self.devices.items())}
+
+
+def _platform(intent, device_name):
+    platform = intent["devices"].get(device_name, {}).get("platform", {})
+    return DevicePlatform(platform.get("name"), platform.get("model"), platform.get("version"))
+
+
+def _root_bridge_devices(intent):
+    root = intent["spanning-tree-root"]
+    if root["type"] == SWITCH_PAIR:
+        for pair in intent["switch-pairs"]:
+            if pair["name"] == root["name"]:
+                return pair["switches"]
+        return []
+    if root["type"] == SWITCH:
+        return [root["name"]]
+    return []
+
+
+def _layer3_pair(intent):
+    """The layer3 switch-pair of the fabric, the first one with layer3 set like find_layer3_switch_pair."""
+
+    for pair in intent["switch-pairs"]:
+        if pair["layer3"]:
+            return pair
+    return None
+
+
+def _switch_setup(model, intent, device_name):
+    """jumbo_mtu_configure and spanning_tree_mode_apply."""
+
+    platform = _platform(intent, device_name)
+    if system_mtu_configured(platform):
+        model.apply("fabric-system-jumbo-frames", {"FRAME_SIZE": jumbo_frame_size(platform), "DEVICE_NAME": device_name}, ned=device_ned(platform))
+    model.apply("fabric-spanning-tree-mode", {"DEVICE_NAME": device_name}, ned=device_ned(platform))
+
+
+def _member_interfaces(model, platform, port_channel, variables):
+    """port_channel_member_setup: one apply per member interface type, with the port-channel as context node."""
+
+    for interface_type in port_channel["members"]:
+        template = member_interface_template(platform, interface_type)
+        if template is not None:
+            model.apply(template, variables, context={"member-interface": port_channel["members"]}, ned=device_ned(platform))
+
+
+def _fabric_trunk(model, intent, device_name, port_channel, vpc, root_bridge_devices):
+    """fabric_trunk_create: the port-channel interface and its member interfaces."""
+
+    platform = _platform(intent, device_name)
+    variables = {
+        "DEVICE_NAME": device_name,
+        "PORTCHANNEL_ID": port_channel["name"],
+        "DESCRIPTION": port_channel["description"],
+        "VPC": vpc,
+        "MODE": "trunk",
+        "VLAN_ID": "all",
+        "DISABLE_TRUNK_NEGOTIATION": trunk_negotiation_disabled(platform),
+        "MTU_SIZE": FABRIC_TRUNK_MTU,
+        "STP_GUARD_MODE": stp_guard_mode(device_name, root_bridge_devices),
+    }
+    model.apply("fabric-portchannel-interface", variables, ned=device_ned(platform))
+    _member_interfaces(model, platform, port_channel, variables)
+
+
+def _multiswitch(model, intent, pair):
+    """multiswitch_setup: fabric-vpc-domain-base on both switches and the peer-link member interfaces."""
+
+    peerlink = pair["multiswitch-peerlink"][-1]
+    mgmt_ip = lambda device_name: intent["devices"].get(device_name, {}).get("mgmt-ip")
+    variables = {
+        "DISABLE_TRUNK_NEGOTIATION": False,
+        "VPC_ENABLED": True,
+        "VPC_DOMAIN_ID": pair["vpc-domain-id"] or VPC_DOMAIN_ID_ALLOCATED,
+        "VPC_PEERLINK_ID": peerlink["name"],
+        "LAYER3": pair["layer3"],
+        "MTU_SIZE": "",
+    }
+
+    for device_name, source, destination in vpc_keepalive_peers(pair["switches"], mgmt_ip):
+        model.apply("fabric-vpc-domain-base", {
+            **variables,
+            "DEVICE_NAME": device_name,
+            "VPC_PEER_KEEPALIVE_SOURCE": source,
+            "VPC_PEER_KEEPALIVE_DESTINATION": destination,
+        }, ned=device_ned(_platform(intent, device_name)))
+
+    for device_name in pair["switches"]:
+        _member_interfaces(model, _platform(intent, device_name), peerlink, {
+            "DEVICE_NAME": device_name,
+            "DESCRIPTION": "VPC Peer Link",
+            "MODE": "trunk",
+            "VLAN_ID": "all",
+            "DISABLE_TRUNK_NEGOTIATION": False,
+            "MTU_SIZE": "",
+            "PORTCHANNEL_ID": peerlink["name"],
+            "STP_GUARD_MODE": "",
+        })
+
+
+def _switch_pair(model, intent, pair, root_bridge_devices, root_bridge):
+    """switch_pair_create, and the root bridge priority when the switch-pair is the spanning-tree root."""
+
+    for device_name in pair["switches"]:
+        _switch_setup(model, intent, device_name)
+    _multiswitch(model, intent, pair)
+    for device_name in pair["switches"]:
+        for port_channel in pair["fabric-trunk"]:
+            _fabric_trunk(model, intent, device_name, port_channel, True, root_bridge_devices)
+
+    # The root bridge priority is only configured on a switch-pair root
+    if root_bridge:
+        for device_name in pair["switches"]:
+            model.apply("fabric-spanning-tree-priority", {"DEVICE_NAME": device_name, "STP_PRIORITY": SPANNING_TREE_ROOT_PRIORITY},
+                        ned=device_ned(_platform(intent, device_name)))
+
+
+def _switch(model, intent, switch, root_bridge_devices):
+    """switch_create."""
+
+    _switch_setup(model, intent, switch["device"])
+    for port_channel in switch["fabric-trunk"]:
+        _fabric_trunk(model, intent, switch["device"], port_channel, "", root_bridge_devices)
+
+
+# Rendered switch-pairs and switches by (DeviceTemplates, fingerprint), least recently used first
+_partition_renders = OrderedDict()
+
+
+def _partition_model(device_templates, intent, partition, root_bridge, render):
+    """
+    The DeviceModel of a switch-pair or switch, from the render cache when its part of the
+    intent, the details of its devices and whether it is the root bridge are unchanged.
+    """
+
+    devices = partition["switches"] if "switches" in partition else [partition["device"]]
+    sub_intent = {**partition, "devices": {device_name: intent["devices"].get(device_name) for device_name in devices}}
+    key = (device_templates, partition_fingerprint(sub_intent, root_bridge))
+
+    model = _partition_renders.get(key)
+    if model is not None:
+        _partition_renders.move_to_end(key)
+        return model
+
+    model = DeviceModel(device_templates)
+    render(model)
+    _partition_renders[key] = model
+    if len(_partition_renders) > RENDER_CACHE_SIZE:
+        _partition_renders.popitem(last=False)
+    return model
+
+
+def clear_render_cache():
+    """Forget the cached switch-pair and switch renders, ie after the templates changed on disk."""
+
+    _partition_renders.clear()
+
+
+def render_intent(intent, device_templates=None):
+    """
+    Render the device configuration of a fabric intent: the template applies of
+    FabricServiceCallbacks.cb_create and TenantServiceCallbacks.cb_create, with the
+    same variables, evaluated from the template XML.
+
+    VPC Domain Ids missing from the intent are rendered as VPC_DOMAIN_ID_ALLOCATED, where
+    the create would wait for the resource-manager allocation.
+
+    Return DeviceModel
+    """
+
+    device_templates = device_templates or DEVICE_TEMPLATES
+    model = DeviceModel(device_templates)
+    root_type, root_name = intent["spanning-tree-root"]["type"], intent["spanning-tree-root"]["name"]
+    root_bridge_devices = _root_bridge_devices(intent)
+
+    for pair in intent["switch-pairs"]:
+        root_bridge = root_type == SWITCH_PAIR and root_name == pair["name"]
+        model.merge(_partition_model(device_templates, intent, pair, root_bridge,
+                                     lambda partition: _switch_pair(partition, intent, pair, root_bridge_devices, root_bridge)))
+
+    for switch in intent["switches"]:
+        root_bridge = root_type == SWITCH and root_name == switch["device"]
+        model.merge(_partition_model(device_templates, intent, switch, root_bridge,
+                                     lambda partition: _switch(partition, intent, switch, root_bridge_devices)))
+
+    layer3_pair = _layer3_pair(intent)
+    if layer3_pair:
+        for device_name in layer3_pair["switches"]:
+            model.apply("fabric-layer3-setup", {"DEVICE_NAME": device_name}, ned=device_ned(_platform(intent, device_name)))
+
+        # The VRFs of layer3 network-tenants, named tenant_vrf on the layer3 switch-pair
+        for tenant in intent["tenants"]:
+            for vrf in tenant["vrfs"]:
+                for device_name in layer3_pair["switches"]:
+                    model.apply("tenant-layer3-vrf-setup", {"DEVICE_NAME": device_name, "VRFNAME": f"{tenant['name']}_{vrf}"},
+                                ned=device_ned(_platform(intent, device_name)))
+
+    return model
+
+
+# -------------------------
+# Comparing intent
+# -------------------------
+def diff_models(old, new):
+    """
+    Compare two rendered models (DeviceModel.as_dict()).
+
+    Return dictionary of {device: {"added": {section: settings}, "removed": {section: settings},
+    "changed": {section: {setting: [old, new]}}}} for the devices whose configuration changes.
+    """
+
+    diff = {}
+    for device_name in sorted(set(old) | set(new)):
+        old_sections, new_sections = old.get(device_name, {}), new.get(device_name, {})
+        added = {section: new_sections[section] for section in new_sections if section not in old_sections}
+        removed = {section: old_sections[section] for section in old_sections if section not in new_sections}
+        changed = {}
+        for section in old_sections.keys() & new_sections.keys():
+            before, after = old_sections[section], new_sections[section]
+            if before != after:
+                changed[section] = {
+                    setting: [before.get(setting), after.get(setting)]
+                    for setting in sorted(set(before) | set(after)) if before.get(setting) != after.get(setting)
+                }
+
+        if added or removed or changed:
+            diff[device_name] = {"added": added, "removed": removed, "changed": dict(sorted(changed.items()))}
+    return diff
+
+
+def diff_intents(old_intent, new_intent):
+    """Compare the device configuration of two revisions of a fabric intent, see diff_models()."""
+
+    return diff_models(render_intent(old_intent).as_dict(), render_intent(new_intent).as_dict())
+
+
+def format_diff(diff):
+    """Human readable lines for a diff from diff_models()."""
+
+    lines = []
+    for device_name, changes in diff.items():
+        lines.append(f"device {device_name}")
+        for section, settings in changes["added"].items():
+            lines.append(f"  + {section} {_format_settings(settings)}".rstrip())
+        for section, settings in changes["removed"].items():
+            lines.append(f"  - {section} {_format_settings(settings)}".rstrip())
+        for section, settings in changes["changed"].items():
+            lines.append(f"  ~ {section} " + ", ".join(f"{setting}: {old!r} -> {new!r}" for setting, (old, new) in settings.items()))
+    return lines
+
+
+def _format_settings(settings):
+    return ", ".join(f"{setting}: {value!r}" for setting, value in sorted(settings.items()))
+
+
+def _load_intents(path, devices):
+    """Intents in a file: a saved intent or a network-fabric JSON export."""
+
+    with open(path) as f:
+        data = json.load(f)
+    if "switch-pairs" in data:
+        return {data["fabric"]: data}
+    return export_intents(data.get("data", data), devices)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the device configuration of two revisions of network-fabric intent.")
+    parser.add_argument("old", help="network-fabric JSON export or saved intent before the change")
+    parser.add_argument("new", nargs="?", help="network-fabric JSON export or saved intent after the change")
+    parser.add_argument("--devices", help="JSON of {device: {\"platform\": {\"name\", \"model\", \"version\"}, \"mgmt-ip\"}}")
+    parser.add_argument("--save", help="write the intent of old to this file instead of comparing")
+    parser.add_argument("--json", action="store_true", help="print the difference as JSON")
+    args = parser.parse_args(argv)
+
+    devices = {}
+    if args.devices:
+        with open(args.devices) as f:
+            devices = json.load(f)
+
+    old = _load_intents(args.old, devices)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(old if len(old) != 1 else next(iter(old.values())), f, indent=2)
+        return 0
+
+    if not args.new:
+        parser.error("a new revision is needed to compare against")
+    new = _load_intents(args.new, devices)
+
+    diff = {}
+    for name in sorted(set(old) | set(new)):
+        empty = {"fabric": name, "spanning-tree-root": {"type": None, "name": None},
+                 "switch-pairs": [], "switches": [], "devices": {}, "tenants": []}
+        fabric_diff = diff_intents(old.get(name, empty), new.get(name, empty))
+        if fabric_diff:
+            diff[name] = fabric_diff
+
+    if args.json:
+        print(json.dumps(diff, indent=2))
+    else:
+        for name, fabric_diff in diff.items():
+            print(f"network-fabric {name}")
+            print("\n".join(format_diff(fabric_diff)))
+        if not diff:
+            print("No device configuration changes.")
+
+    return 1 if diff else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
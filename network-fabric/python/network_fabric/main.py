@@ -1,9 +1,14 @@
 # -*- mode: python; python-indent: 4 -*-
 import ncs
-from .fabric_create import FabricServiceCallbacks
+import _ncs
+from .fabric_create import FabricServiceCallbacks, FabricPartitionCallbacks
 from .fabric_actions import FabricAction
 from .tenant_create import TenantServiceCallbacks
 from .tenant_actions import TenantAction
+from .session_pool import start_session_pool, stop_session_pool
+from .result_store import start_result_store, stop_result_store
+from .snapshot_store import start_snapshot_store, stop_snapshot_store
+from .create_metrics import start_metrics_store, stop_metrics_store, MetricsDataCallbacks, METRICS_CALLPOINT
 
 
 # ---------------------------------------------
@@ -22,10 +27,26 @@ class Main(ncs.application.Application):
         self.register_service('network-fabric-servicepoint', FabricServiceCallbacks)
         self.register_action('network-fabric-full-test', FabricAction)
 
+        # network-fabric-partition, the switch-pairs and switches of partitioned fabrics
+        self.register_service('network-fabric-partition-servicepoint', FabricPartitionCallbacks)
+
         # network-tenant
         self.register_service('network-tenant-servicepoint', TenantServiceCallbacks)
         self.register_action('network-tenant-full-test', TenantAction)
 
+        # Create metrics of every service, kept in memory rather than written by the creates
+        # and served as the operational data of the metrics container of each service
+        start_metrics_store(log=self.log)
+        self.register_fun(self.start_metrics_provider, self.stop_metrics_provider)
+
+        # Pool of pyATS device sessions reused across test action invocations
+        start_session_pool(log=self.log)
+
+        # Parsed device output shared by test actions run close together
+        start_snapshot_store(log=self.log)
+
+        # Append-only store of test action runs, queried by the history actions
+        start_result_store(log=self.log)
 
         # If we registered any callback(s) above, the Application class
         # took care of creating a daemon (related to the service/action point).
@@ -33,9 +54,27 @@ class Main(ncs.application.Application):
         # When this setup method is finished, all registrations are
         # considered done and the application is 'started'.
 
+    def start_metrics_provider(self, state):
+        # Data callbacks of the config false metrics containers, registered on the daemon
+        # of the application
+        _ncs.dp.register_data_cb(state.ctx, METRICS_CALLPOINT, MetricsDataCallbacks(log=self.log))
+        return state
+
+    def stop_metrics_provider(self, state):
+        # The callbacks go with the daemon, the metrics store is stopped in teardown()
+        pass
+
     def teardown(self):
         # When the application is finished (which would happen if NCS went
         # down, packages were reloaded or some error occurred) this teardown
         # method will be called.
 
+        # Close any device sessions still held by the pool
+        stop_session_pool()
+        stop_snapshot_store()
+        stop_metrics_store()
+
+        # Runs already recorded stay on disk for the next start
+        stop_result_store()
+
         self.log.info('Main FINISHED')
@@ -3,65 +3,97 @@
 Functions used across the different Network Fabric Python modules.
 """
 
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from _ncs import decrypt
 import genie.testbed
-from pyats.async_ import pcall
+from genie.metaparser.util.exceptions import SchemaEmptyParserError
+from unicon.core.errors import TimeoutError as UniconTimeoutError
+from .session_pool import get_session_pool, learn_hostname
 
+# Upper bound on the number of devices connected to and queried at the same time
+COLLECTION_MAX_WORKERS = 10
 
-def create_testbed(root, testbed_name="testbed", devices=[], log=None):
+# Seconds a quick test may spend collecting device output
+QUICK_TEST_TIME_BUDGET = 30
+
+# Action timeout set for the full tests, and the part of it device collection may use. 
+# The rest is kept for running the tests on the collected output and reporting results
+FULL_TEST_ACTION_TIMEOUT = 360
+FULL_TEST_TIME_BUDGET = 300
+
+# Upper bounds in seconds on logging in to one device and on running one command. 
+# Both are cut down further to the time left in the collection budget
+DEVICE_CONNECT_TIMEOUT = 30
+DEVICE_COMMAND_TIMEOUT = 60
+
+# Exceptions of a device operation that ran into its timeout, see is_timeout()
+TIMEOUT_ERRORS = (TimeoutError, FuturesTimeoutError, UniconTimeoutError)
+
+# Function used to turn testbed data into a pyATS testbed. Replaced with set_testbed_loader 
+# to run the test actions against something other than real devices (ie a device simulator)
+_testbed_loader = genie.testbed.load
+
+# Command used to read port-channel state, keyed by pyATS OS
+PORTCHANNEL_SUMMARY_COMMANDS = {
+    "nxos": "show port-channel summary", 
+    "ios": "show etherchannel summary", 
+    "iosxe": "show etherchannel summary", 
+}
+
+# Keys are NSO Platform Names and Values are pyATS OS options
+DEVICE_OS_MAP = {
+    "ios": "ios", 
+    "ios-xe": "iosxe", 
+    "NX-OS": "nxos", 
+    "ios-xr": "iosxr", 
+    "asa": "asa"
+}
+
+
+def load_testbed(testbed_data): 
     """
-    Function to create a pyATS Testbed containing a given set of devices.
+    Load a pyATS testbed from testbed data with the current testbed loader.
     """
-    
-    if log: 
-        log.info(f"Creating a pyATS testbed called {testbed_name} from devices {devices}.")
-
-    testbed_data = {
-        "testbed": {
-            "name": testbed_name, 
-        }, 
-        "devices": {}
-    }
 
-    # Add devices to the testbed
-    for device in devices: 
-        testbed_data["devices"].update(
-            create_pyats_device(
-                root=root,
-                device_name=device,
-                log=log
-            )
-        )
+    return _testbed_loader(testbed_data)
 
-    # NOTE: Uncomment this line just for dev and debugging. Will print credentials in clear text
-    # if log: log.info(f"testbed_data: {testbed_data}")
 
-    # Create testbed from data
-    testbed = genie.testbed.load(testbed_data)
+def set_testbed_loader(loader=None): 
+    """
+    Replace the function used to load testbeds. Passing None restores genie.testbed.load.
+    """
 
-    return testbed
+    global _testbed_loader
+    _testbed_loader = loader if loader else genie.testbed.load
 
 
 
-def create_pyats_device(root, device_name, log=None): 
+def create_pyats_device(root, device_name, fast_connect=False, credentials=None, log=None): 
     """
     Create a pyATS testbed device from an NSO device_name
+
+    With fast_connect the login skips the round trips that discover what NSO already knows: 
+    - learn_hostname, when the hostname NSO has synced from the device is the device name 
+      (the prompt pyATS expects). Otherwise the hostname is still learned on login.
+    - the init config commands (terminal/console settings in config mode), which the test 
+      actions never need as they only run show commands. 
+    The prompt patterns themselves come from the unicon plugin selected by the device os.
+
+    credentials is a CredentialCache shared by the devices of a test run, so each authgroup 
+    is only read and decrypted once. Without one the authgroup is read for this device alone.
     """
 
     if log: 
         log.info(f'Creating pyATS device definition for device {device_name}')
 
     device = root.devices.device[device_name]
-    auth = root.devices.authgroups.group[device.authgroup].default_map
-
-    # Keys are NSO Platform Names and Values are pyATS OS options
-    device_os_map = {
-        "ios": "ios", 
-        "ios-xe": "iosxe", 
-        "NX-OS": "nxos", 
-        "ios-xr": "iosxr", 
-        "asa": "asa"
-    }
+    if credentials is None: 
+        credentials = CredentialCache(root)
+    remote_name, remote_password, password = credentials.lookup(device.authgroup)
 
     # Default ports for CLI protocols
     connection_port_map = { 
@@ -73,9 +105,14 @@ def create_pyats_device(root, device_name, log=None):
     protocol = str(device.device_type.cli.protocol)
     port = device.port if device.port else connection_port_map[protocol] 
 
+    # Fingerprint of the connection details so pooled sessions are only reused while they still match
+    connection_signature = hashlib.sha256(
+        f"{device.platform.name}|{device.address}|{protocol}|{port}|{remote_name}|{remote_password}".encode()
+    ).hexdigest()
+
     device_data = {
         device_name: {
-            "os": device_os_map[device.platform.name], 
+            "os": DEVICE_OS_MAP[device.platform.name], 
             "connections": {
                 "default": {
                     "ip": device.address, 
@@ -85,53 +122,498 @@ def create_pyats_device(root, device_name, log=None):
             },
             "credentials": {
                 "default": {
-                    "username": auth.remote_name, 
-                    "password": decrypt(auth.remote_password), 
+                    "username": remote_name, 
+                    "password": password, 
                 }
+            }, 
+            "custom": {
+                "connection_signature": connection_signature, 
             }
         }
     }
 
+    if fast_connect: 
+        hostname = device_hostname(device)
+        if hostname == device_name: 
+            device_data[device_name]["custom"]["fast_connect"] = True
+            device_data[device_name]["connections"]["default"]["arguments"] = {
+                "init_config_commands": [], 
+            }
+        elif log: 
+            log.info(f"Device {device_name} has hostname {hostname} in NSO, its hostname will be learned on login")
+
     return device_data
 
 
-def testbed_connect(testbed, log_stdout=False, log=None): 
+class CredentialCache(object): 
     """
-    Connect to devices in a testbed if one is provided
+    Authgroup credentials of a test run, read and decrypted once per authgroup however 
+    many devices share it. Safe to use from worker threads.
     """
-    # Only if a valid testbed was created
-    if testbed: 
-        if log: log.info(f"Connecting testbed {testbed.name}")
-        testbed.connect(learn_hostname=True, log_stdout=log_stdout)
+
+    def __init__(self, root): 
+        self.root = root
+        self.lookups = 0
+        self.decryptions = 0
+        self._credentials = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, authgroup): 
+        """
+        Credentials of the default map of an authgroup.
+
+        Return tuple with (remote name, encrypted remote password, decrypted remote password)
+        """
+
+        with self._lock: 
+            self.lookups += 1
+            if authgroup not in self._credentials: 
+                auth = self.root.devices.authgroups.group[authgroup].default_map
+                self._credentials[authgroup] = (auth.remote_name, auth.remote_password, decrypt(auth.remote_password))
+                self.decryptions += 1
+            return self._credentials[authgroup]
 
 
-def testbed_connection_status(testbed, log=None): 
+def device_hostname(device): 
     """
-    Report the connection status of devices in a testbed.
+    The hostname configured on an NSO device, or None if the NED doesn't model it.
     """
-    # Only if a valid testbed was created
-    if testbed and log: 
-        # Print connection status
-        for device in testbed.devices: 
-            log.info(f"Connection status {device}: {testbed.devices[device].connected}")
 
+    try: 
+        hostname = device.config.hostname
+    except AttributeError: 
+        return None
 
-def testbed_disconnect(testbed, log=None): 
+    return str(hostname) if hostname else None
+
+
+def test_time_budget(level): 
     """
-    Disconnect from all devices in a testbed.
+    Seconds a test action of a given level may spend collecting device output.
+    """
+
+    return QUICK_TEST_TIME_BUDGET if level == "quick" else FULL_TEST_TIME_BUDGET
+
+
+def device_connect(device, log_stdout=False, timeout=DEVICE_CONNECT_TIMEOUT, log=None): 
     """
+    Connect a pyATS device, checking a session out of the session pool when it is running.
 
-    def disconnect(device, log=log): 
-        """Function for use with pcall"""
+    timeout is the number of seconds the login may take before it is abandoned.
+
+    Return the connected device to use, which may be a pooled device object rather than the one provided.
+    """
 
+    if isinstance(device, LazyDevice): 
+        return device.open(log_stdout=log_stdout, timeout=timeout)
+
+    pool = get_session_pool()
+    if pool: 
+        return pool.checkout(device, log_stdout=log_stdout, connection_timeout=timeout)
+
+    if log: log.info(f"Connecting device {device.name}")
+    device.connect(learn_hostname=learn_hostname(device), log_stdout=log_stdout, connection_timeout=timeout)
+    return device
+
+
+def device_disconnect(device, discard=False, log=None): 
+    """
+    Release a pyATS device, returning it to the session pool when it is running.
+
+    With discard the session is disconnected and dropped from the pool instead, for a 
+    session left in an unknown state (a worker that ran past its deadline).
+    """
+
+    if isinstance(device, LazyDevice): 
+        device.close(discard=discard)
+        return
+
+    pool = get_session_pool()
+    if pool: 
+        if discard: 
+            pool.discard(device)
+        else: 
+            pool.checkin(device)
+        return
+
+    if device.connected: 
         if log: log.info(f"Disconnecting device {device.name}")
         device.settings.GRACEFUL_DISCONNECT_WAIT_SEC = 0
         device.settings.POST_DISCONNECT_WAIT_SEC = 0
         device.disconnect()
-        
 
-    # Only if a valid testbed was created
-    if testbed:
-        if log: log.info(f"Disconnecting testbed {testbed.name}")
 
-        pcall(disconnect, device=testbed.devices.values())
+class LazyDevice(object): 
+    """
+    A device of a DeviceRegistry, standing in for its pyATS device. 
+
+    Only the name and os are known up front. The pyATS device definition is built 
+    (reading the NSO device and its authgroup) the first time anything else is asked 
+    of it, and a session is opened the first time a command is run on it.
+
+    A device abandoned by collect_device_outputs is still used by a worker that ran 
+    past its deadline. It isn't opened again, and is left for the worker to release.
+    """
+
+    def __init__(self, registry, name): 
+        self.name = name
+        self._registry = registry
+        self._device = None
+        self.abandoned = False
+
+    @property
+    def os(self): 
+        if self._device is not None: 
+            return self._device.os
+        return self._registry.device_os(self.name)
+
+    @property
+    def built(self): 
+        return self._device is not None
+
+    @property
+    def connected(self): 
+        return self._device is not None and self._device.connected
+
+    def build(self): 
+        """Build the pyATS device if it hasn't been, return it."""
+
+        if self._device is None: 
+            self._device = self._registry.build(self.name)
+        return self._device
+
+    def open(self, log_stdout=False, timeout=DEVICE_CONNECT_TIMEOUT): 
+        """Connect the device if it isn't connected, through the session pool when it is running."""
+
+        if not self.connected: 
+            if self.abandoned: 
+                raise ConnectionError(f"device {self.name} was abandoned by a collection worker that ran past its deadline")
+            self._device = device_connect(self.build(), log_stdout=log_stdout, timeout=timeout, log=self._registry.log)
+            self._registry.count_connect()
+        return self
+
+    def abandon(self): 
+        """Leave the device to the worker still using it, release() skips it."""
+
+        self.abandoned = True
+
+    def close(self, discard=False): 
+        """
+        Release the device if it was built. A pooled session is returned to the pool, or 
+        dropped from it with discard, and not used again.
+        """
+
+        if self._device is not None: 
+            device_disconnect(self._device, discard=discard, log=self._registry.log)
+            if get_session_pool(): 
+                self._device = None
+
+    def execute(self, command, **kwargs): 
+        return self.open()._device.execute(command, **kwargs)
+
+    def parse(self, command, **kwargs): 
+        return self.open()._device.parse(command, **kwargs)
+
+    def learn(self, feature, **kwargs): 
+        return self.open()._device.learn(feature, **kwargs)
+
+    def __getattr__(self, name): 
+        # Anything else is read from the pyATS device, building it first
+        if name.startswith("_"): 
+            raise AttributeError(name)
+        return getattr(self.build(), name)
+
+    def __repr__(self): 
+        return f"<LazyDevice {self.name} built={self.built} connected={self.connected}>"
+
+
+class DeviceRegistry(object): 
+    """
+    The pyATS devices of a test action run, keyed by NSO device name and populated on demand. 
+
+    registry[device_name] returns a LazyDevice without reading anything from NSO beyond the 
+    device platform, so a test run only builds definitions for, and connects to, the devices 
+    it actually needs output from. Devices answered entirely from the snapshot store, or 
+    skipped by an incremental test, are never built. Authgroup credentials are looked up and 
+    decrypted once per run (CredentialCache). 
+
+    Devices are built from the thread that runs the action, as maagic objects aren't shared 
+    between threads, collect_device_outputs builds them before starting its workers.
+    """
+
+    def __init__(self, root, name="testbed", fast_connect=False, log=None): 
+        self.root = root
+        self.name = name
+        self.fast_connect = fast_connect
+        self.log = log
+        self.credentials = CredentialCache(root)
+        self.built = 0
+        self.connects = 0
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, device_name): 
+        if device_name not in self._devices: 
+            self._devices[device_name] = LazyDevice(self, device_name)
+        return self._devices[device_name]
+
+    def __contains__(self, device_name): 
+        return device_name in self._devices
+
+    def devices(self, device_names): 
+        """Dictionary of {device_name: LazyDevice} for the given devices, registering any new ones."""
+
+        return {device_name: self[device_name] for device_name in device_names}
+
+    def device_os(self, device_name): 
+        """pyATS os of a device from its NSO platform, or None if pyATS doesn't support the platform."""
+
+        return DEVICE_OS_MAP.get(str(self.root.devices.device[device_name].platform.name))
+
+    def build(self, device_name): 
+        """Build the pyATS device for an NSO device, in a testbed of its own."""
+
+        device_data = create_pyats_device(
+            root=self.root, 
+            device_name=device_name, 
+            fast_connect=self.fast_connect, 
+            credentials=self.credentials, 
+            log=self.log
+        )
+        testbed = load_testbed({"testbed": {"name": f"{self.name}-{device_name}"}, "devices": device_data})
+        self.built += 1
+        return testbed.devices[device_name]
+
+    def connect(self, device_names, log_stdout=False): 
+        """
+        Connect several devices at the same time, rather than one by one as tests first use them. 
+        The devices are built from this thread first.
+        """
+
+        devices = [self[device_name] for device_name in device_names]
+        if not devices: 
+            return
+        for device in devices: 
+            device.build()
+
+        if self.log: self.log.info(f"Connecting devices {list(device_names)} of {self.name}")
+        with ThreadPoolExecutor(max_workers=min(COLLECTION_MAX_WORKERS, len(devices))) as executor: 
+            list(executor.map(lambda device: device.open(log_stdout=log_stdout), devices))
+
+    def count_connect(self): 
+        """Count a device connected, called from the worker threads."""
+
+        with self._lock: 
+            self.connects += 1
+
+    def release(self): 
+        """
+        Release every device built during the run (pooled sessions are returned to the pool). 
+        Abandoned devices are released by the worker still using them when it finishes.
+        """
+
+        if self.log: self.log.info(f"Releasing devices of {self.name}: {self.summary()}")
+        for device in self._devices.values(): 
+            if device.abandoned: 
+                if self.log: self.log.info(f"Leaving device {device.name} to the collection worker still using it")
+                continue
+            device.close()
+
+    def summary(self): 
+        return (f"{self.built} of {len(self._devices)} devices built, {self.connects} connected, "
+                f"{self.credentials.decryptions} authgroup credentials decrypted")
+
+
+def is_timeout(error): 
+    """
+    True if an exception is a timeout, or was raised because of one. unicon services
+    re-raise the TimeoutError of a command as SubCommandFailure with the timeout as
+    its cause or argument.
+    """
+
+    seen = set()
+    while isinstance(error, BaseException) and id(error) not in seen: 
+        seen.add(id(error))
+        if isinstance(error, TIMEOUT_ERRORS): 
+            return True
+        if any(isinstance(arg, TIMEOUT_ERRORS) for arg in error.args): 
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def collect_device_outputs(devices, commands, cache, max_workers=None, timeout=None, on_collected=None, empty_output=(), log_stdout=False, log=None): 
+    """
+    Connect to a set of devices and parse a list of commands on each of them concurrently.
+
+    devices is a dictionary of device name to pyATS device, and commands a dictionary 
+    of device name to the list of commands to parse on that device. Each device is 
+    handled by one worker (connect, then parse its commands in order) so the total 
+    time follows the slowest device rather than the sum of all devices. Parsed output 
+    is stored in the provided CommandCache for the tests to read, and devices is 
+    updated in place with the connected (possibly pooled) device objects. Commands 
+    the cache can restore from the snapshot store are not run, and devices with 
+    every command restored are not connected to. Devices of a DeviceRegistry are 
+    only built when they have commands left to run.
+
+    Collection is deadline aware. Every login is limited to DEVICE_CONNECT_TIMEOUT 
+    seconds and every command to DEVICE_COMMAND_TIMEOUT seconds, and with a timeout 
+    (the collection budget in seconds) both are cut down to the time left before the 
+    deadline. A device that can't be logged in to, or runs a command into its timeout, 
+    is reported as unreachable/timed out and its remaining commands are skipped. Each 
+    device also gets a deadline of its fair share of the time left (time left * workers 
+    / devices not yet started), so one unresponsive switch doesn't use up the budget 
+    of the rest of the fabric. Devices with the most commands are started first. Any 
+    device not collected by the deadline is reported as an error. A worker still running 
+    then keeps its device (a LazyDevice is abandoned, so DeviceRegistry.release() skips 
+    it) and the session is discarded rather than pooled when the worker finishes.
+
+    on_collected is called with (device_name, [messages]) as each device finishes, 
+    so progress can be reported while the rest are still being collected.
+
+    empty_output lists the commands whose empty output is a result for the tests to 
+    check rather than a collection error (OSPF_VRF_COMMAND returns nothing when OSPF 
+    isn't running). 
+
+    Return dictionary of {device: [messages]} for devices that could not be fully collected.
+    """
+
+    deadline = time.monotonic() + timeout if timeout else None
+    waiting_lock = threading.Lock()
+
+    def device_deadline(): 
+        """
+        Deadline for a device starting now: its fair share of the time left, shared with 
+        the other devices still waiting for a worker, so one unresponsive device can't 
+        use up the budget of the devices queued behind it.
+        """
+
+        with waiting_lock: 
+            share = workers / waiting[0]
+            waiting[0] -= 1
+
+        now = time.monotonic()
+        return now + (deadline - now) * min(1, share)
+
+    def collect(device_name): 
+        """Connect to one device and parse its planned commands."""
+
+        device = devices[device_name]
+        device_errors = []
+        until = device_deadline() if deadline else None
+
+        def time_left(limit): 
+            """Seconds an operation limited to limit seconds may take before the device deadline."""
+
+            return limit if until is None else min(limit, until - time.monotonic())
+
+        try: 
+            if not device.connected: 
+                connect_timeout = time_left(DEVICE_CONNECT_TIMEOUT)
+                if connect_timeout <= 0: 
+                    device_errors.append(f"device {device_name} unreachable/timed out: not connected within the {timeout} second budget")
+                    return (device_name, device, device_errors)
+                device = device_connect(device, log_stdout=log_stdout, timeout=connect_timeout, log=log)
+        except Exception as e: 
+            device_errors.append(f"device {device_name} unreachable/timed out: could not be connected: {e}")
+            return (device_name, device, device_errors)
+
+        for command in pending[device_name]: 
+            command_timeout = time_left(DEVICE_COMMAND_TIMEOUT)
+            if command_timeout <= 0: 
+                device_errors.append(f"device {device_name} unreachable/timed out: '{command}' not run within the {timeout} second budget")
+                break
+
+            try: 
+                if log: log.info(f"Parsing '{command}' on device {device_name}")
+                cache.parse(device, command, timeout=command_timeout)
+            except SchemaEmptyParserError as e: 
+                # The command ran, the failure is kept in the cache for the tests to check
+                if command not in empty_output: 
+                    device_errors.append(f"device {device_name} failed to parse '{command}': {e}")
+            except Exception as e: 
+                if is_timeout(e): 
+                    # Don't wait on a device that stopped responding for the rest of its commands
+                    device_errors.append(f"device {device_name} unreachable/timed out: '{command}' took longer than {command_timeout:.1f} seconds")
+                    break
+                device_errors.append(f"device {device_name} failed to parse '{command}': {e}")
+
+        return (device_name, device, device_errors)
+
+    errors = {}
+    if not devices: 
+        return errors
+
+    # Output still fresh in the snapshot store isn't collected again, and a device
+    # with nothing left to collect isn't built or logged in to at all
+    pending = {}
+    for device_name in devices: 
+        pending[device_name] = [command for command in commands.get(device_name, []) if not cache.restore(device_name, command)]
+        if not pending[device_name]: 
+            if log: log.info(f"Using snapshots of every command on device {device_name}")
+            if on_collected: 
+                on_collected(device_name, [])
+        elif isinstance(devices[device_name], LazyDevice): 
+            # Built here rather than in the workers, as it reads the device from NSO
+            try: 
+                devices[device_name].build()
+            except Exception as e: 
+                errors[device_name] = [f"device {device_name} could not be set up for testing: {e}"]
+                pending[device_name] = []
+                if on_collected: 
+                    on_collected(device_name, errors[device_name])
+
+    schedule = [device_name for device_name in devices if pending[device_name]]
+    if not schedule: 
+        return errors
+
+    workers = max(1, min(max_workers or COLLECTION_MAX_WORKERS, len(schedule)))
+    waiting = [len(schedule)]
+    if log: log.info(f"Collecting command output from {len(schedule)} devices with {workers} workers{f' within {timeout} seconds' if timeout else ''}.")
+
+    # Longest jobs first, so the devices with the most commands aren't the ones left waiting at the deadline
+    schedule.sort(key=lambda device_name: len(pending[device_name]), reverse=True)
+
+    def release(future): 
+        """Release the device of a worker that finished after the timeout, its session isn't reused."""
+
+        if not future.cancelled(): 
+            device_disconnect(future.result()[1], discard=True, log=log)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {executor.submit(collect, device_name): device_name for device_name in schedule}
+    collected = set()
+
+    def finished(future): 
+        device_name, device, device_errors = future.result()
+        collected.add(device_name)
+        devices[device_name] = device
+        if device_errors: 
+            errors[device_name] = device_errors
+        if on_collected: 
+            on_collected(device_name, device_errors)
+
+    try: 
+        for future in as_completed(futures, timeout=timeout): 
+            finished(future)
+    except FuturesTimeoutError: 
+        pass
+
+    for future, device_name in futures.items(): 
+        if device_name not in collected and future.done() and not future.cancelled(): 
+            # Finished between the deadline and this check, its output is used
+            finished(future)
+        if device_name not in collected: 
+            errors[device_name] = [f"device {device_name} unreachable/timed out: not collected within {timeout} seconds"]
+            if on_collected: 
+                on_collected(device_name, errors[device_name])
+            if not future.cancel(): 
+                # The worker is still using the device, only it may release the device
+                if isinstance(devices[device_name], LazyDevice): 
+                    devices[device_name].abandon()
+                future.add_done_callback(release)
+
+    executor.shutdown(wait=False)
+
+    # Report errors in device order rather than the order devices finished
+    return {device_name: errors[device_name] for device_name in devices if device_name in errors}
@@ -3,7 +3,22 @@
 pyATS and Genie based tests that can be reused across different services.
 """
 
-def nxos_features_enabled(device, features=[], desired_state="enabled", log=None): 
+from collections import defaultdict
+from genie.metaparser.util.exceptions import SchemaEmptyParserError
+from .command_cache import cached_parse
+from .helper_functions import vlan_ranges
+
+# Targeted commands used in place of learning the vrf and ospf features.
+# A learn runs a whole family of show commands to build a full Genie Ops object, 
+# these are the single commands that hold the state the tests need.
+VRF_COMMAND = "show vrf"
+FEATURE_COMMAND = "show feature"
+OSPF_VRF_COMMAND = "show ip ospf vrf all"
+
+# Command holding the per VLAN spanning-tree state of a switch
+SPANNING_TREE_COMMAND = "show spanning-tree detail"
+
+def nxos_features_enabled(device, features=[], desired_state="enabled", cache=None, log=None): 
     """
     Given a device and set of features, verify they are desired state.
     """
@@ -23,7 +38,7 @@ def nxos_features_enabled(device, features=[], desired_state="enabled", log=None
         return results
     
     # Lookup feature details from device 
-    feature_data = device.parse("show feature")
+    feature_data = cached_parse(device, FEATURE_COMMAND, cache=cache)
 
     # Loop over features to check
     for feature in features: 
@@ -44,7 +59,41 @@ def nxos_features_enabled(device, features=[], desired_state="enabled", log=None
     return results
 
 
-def vrfs_exist(device, vrfs=[], desired_state=True, log=None): 
+def vrf_names(device, cache=None): 
+    """
+    The set of VRF names configured on a device, from "show vrf".
+    """
+
+    vrf_data = cached_parse(device, VRF_COMMAND, cache=cache)
+    return set(vrf_data.get("vrfs", {}))
+
+
+def ospf_vrf_names(device, cache=None): 
+    """
+    The set of VRF names with an OSPF instance on a device, from "show ip ospf vrf all". 
+
+    Return None if OSPF isn't running, which the parser reports as empty output. 
+    Any other failure (connection lost, command timed out, parser error) is raised.
+    """
+
+    try: 
+        ospf_data = cached_parse(device, OSPF_VRF_COMMAND, cache=cache)
+    except SchemaEmptyParserError: 
+        return None
+
+    return set(ospf_data.get("vrf", {}))
+
+
+def ospf_collected(device_name, cache): 
+    """
+    True if the OSPF VRF state of a device is in the cache: OSPF_VRF_COMMAND parsed, or 
+    returned empty output because OSPF isn't running. Otherwise it wasn't collected.
+    """
+
+    return cache.contains(device_name, OSPF_VRF_COMMAND) or isinstance(cache.failure(device_name, OSPF_VRF_COMMAND), SchemaEmptyParserError)
+
+
+def vrfs_exist(device, vrfs=[], desired_state=True, cache=None, log=None): 
     """
     Given a device and set of VRFs, verify they are in the desired state.
     """
@@ -58,15 +107,12 @@ def vrfs_exist(device, vrfs=[], desired_state=True, log=None):
         "error": []
     }
 
-    # lookup and learn VRFs on device
-    vrf_data = device.learn("vrf")
+    # lookup VRFs on device
+    device_vrfs = vrf_names(device, cache=cache)
 
     # Loop over desired VRFs and check
     for vrf in vrfs: 
-        try: 
-            vrf_state = vrf_data.info["vrfs"][vrf]
-        except KeyError: 
-            vrf_state = False 
+        vrf_state = vrf in device_vrfs
         
         # Check desired state 
         if desired_state == True and vrf_state == False: 
@@ -80,7 +126,7 @@ def vrfs_exist(device, vrfs=[], desired_state=True, log=None):
     return results
 
 
-def ospf_vrfs_running(device, vrfs=[], desired_state=True, log=None): 
+def ospf_vrfs_running(device, vrfs=[], desired_state=True, cache=None, log=None): 
     """
     Given a device and set of VRFs, verify that OSPF is running..
     """
@@ -94,18 +140,15 @@ def ospf_vrfs_running(device, vrfs=[], desired_state=True, log=None):
         "error": []
     }
 
-    # lookup and learn OSPF on device
-    ospf_data = device.learn("ospf")
+    # lookup OSPF VRFs on device
+    ospf_vrfs = ospf_vrf_names(device, cache=cache)
 
-    if not ospf_data.info["feature_ospf"]: 
+    if ospf_vrfs is None: 
         results["error"].append(f"OSPF is NOT running on device {device.name}.")
     else: 
         # Loop over desired VRFs and check
         for vrf in vrfs: 
-            try: 
-                vrf_ospf_state = ospf_data.info["vrf"][vrf]
-            except KeyError: 
-                vrf_ospf_state = False 
+            vrf_ospf_state = vrf in ospf_vrfs
             
             # Check desired state 
             if desired_state == True and vrf_ospf_state == False: 
@@ -117,3 +160,45 @@ def ospf_vrfs_running(device, vrfs=[], desired_state=True, log=None):
         results["success"] = False
 
     return results
+
+
+def spanning_tree_table(device_name, spanning_tree_details): 
+    """
+    Flatten the parsed SPANNING_TREE_COMMAND output of a device into rows of 
+    (device, vlan, is_root, protocol), one per VLAN and protocol.
+    """
+
+    return [
+        (device_name, int(vlan_id), bool(vlan_details.get("root_of_the_spanning_tree")), protocol)
+        for protocol, stp_details in spanning_tree_details.items()
+        for vlan_id, vlan_details in stp_details.get("vlans", {}).items()
+    ]
+
+
+def spanning_tree_root_errors(table, root_bridge_devices): 
+    """
+    Given a spanning_tree_table of any number of devices, verify the root bridge devices 
+    are root for every VLAN and no other device is root for any VLAN.
+
+    VLANs are aggregated into ranges so there is at most one message per device and 
+    problem, however many VLANs a switch carries.
+
+    Return dictionary of {device: [messages]} for the devices with a misplaced root.
+    """
+
+    not_root = defaultdict(set)
+    wrongly_root = defaultdict(set)
+    for device, vlan, is_root, protocol in table: 
+        if device in root_bridge_devices: 
+            if not is_root: 
+                not_root[device].add(vlan)
+        elif is_root: 
+            wrongly_root[device].add(vlan)
+
+    errors = defaultdict(list)
+    for device, vlans in not_root.items(): 
+        errors[device].append(f"Device {device} is NOT the Spanning-Tree root for {len(vlans)} VLANs ({vlan_ranges(vlans)}) but should be.")
+    for device, vlans in wrongly_root.items(): 
+        errors[device].append(f"Device {device} is the Spanning-Tree root for {len(vlans)} VLANs ({vlan_ranges(vlans)}) but should NOT be.")
+
+    return dict(errors)
@@ -0,0 +1,75 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Collector for the error and details entries of a test action, written to the action output once at the end.
+"""
+
+# Default maximum number of error entries, and of details entries, written to action output
+ACTION_OUTPUT_MAX_ENTRIES = 100
+
+
+class ResultCollector(object):
+    """
+    Errors and details of a test action run, held in plain Python until write().
+
+    Entries are de-duplicated on (test, message), keeping the order they were first
+    reported in. At most max_entries errors and max_entries details are written, the
+    rest are summarised in a single "N more ... suppressed" entry, so a badly broken
+    fabric doesn't produce thousands of action output entries.
+    """
+
+    def __init__(self, max_entries=ACTION_OUTPUT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.errors = {}
+        self.details = {}
+
+    def error(self, test, message):
+        """Add an error entry."""
+
+        key = (test, message)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def detail(self, test, message):
+        """Add a details entry."""
+
+        key = (test, message)
+        self.details[key] = self.details.get(key, 0) + 1
+
+    def test_result(self, test_name, result):
+        """Add the errors from the results dictionary of a test."""
+
+        if not result["success"]:
+            for error in result["error"]:
+                self.error(test_name, error)
+
+    def usage(self, test_name, usage):
+        """Add the device usage of a test (a CacheUsage) as a details entry."""
+
+        self.detail(test_name, f"Test cost {usage}")
+
+    @property
+    def success(self):
+        return len(self.errors) == 0
+
+    def write(self, action_output, success_message="Test was successful",
+              failure_message="Errors were encountered during test."):
+        """
+        Write the collected entries and the overall status of the test to the action output.
+        """
+
+        self._write_entries(action_output.details, self.details, "details")
+        self._write_entries(action_output.error, self.errors, "errors")
+
+        action_output.success = self.success
+        action_output.message = success_message if self.success else failure_message
+
+    def _write_entries(self, output_list, entries, kind):
+        for (test, message), count in list(entries.items())[:self.max_entries]:
+            entry = output_list.create()
+            entry.test = test
+            entry.message = message if count == 1 else f"{message} (reported {count} times)"
+
+        suppressed = len(entries) - self.max_entries
+        if suppressed > 0:
+            entry = output_list.create()
+            entry.test = "result limit"
+            entry.message = f"{suppressed} more {kind} suppressed, showing the first {self.max_entries}"
@@ -0,0 +1,266 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Append-only local store of test action runs, so results are kept after the action reply.
+
+The store is started by the Main application in setup(). Each completed fabric,
+tenants and tenant test is appended as one run record, and the history actions
+query it for the last runs of a service or the trend of a single switch.
+
+Records are JSON, zlib compressed and length prefixed, appended to segment files
+in RESULT_STORE_DIR. A segment is rotated when it reaches RESULT_STORE_SEGMENT_BYTES
+and the oldest segments are removed beyond RESULT_STORE_MAX_SEGMENTS, so the store
+never grows past roughly their product.
+"""
+
+import json
+import os
+import struct
+import threading
+import uuid
+import zlib
+
+# Directory of the store, relative to the NSO running directory (the working directory of the Python VM)
+RESULT_STORE_DIR = os.path.join("logs", "network-fabric-results")
+
+# Size at which a segment file is rotated, and the number of segment files kept
+RESULT_STORE_SEGMENT_BYTES = 1024 * 1024
+RESULT_STORE_MAX_SEGMENTS = 8
+
+# Error messages kept in each run record, the total count is always kept
+RESULT_STORE_MAX_ERRORS = 50
+
+SEGMENT_PREFIX = "runs-"
+SEGMENT_SUFFIX = ".seg"
+_LENGTH = struct.Struct(">I")
+
+
+class ResultStore(object):
+    """Append-only, size capped store of run records (dictionaries) on local disk."""
+
+    def __init__(self, directory=RESULT_STORE_DIR, segment_bytes=RESULT_STORE_SEGMENT_BYTES,
+                 max_segments=RESULT_STORE_MAX_SEGMENTS, log=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.log = log
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, record):
+        """Append a run record to the current segment, rotating segments as needed."""
+
+        data = zlib.compress(json.dumps(record, separators=(",", ":")).encode())
+
+        with self._lock:
+            segments = self._segments()
+            if not segments or os.path.getsize(self._path(segments[-1])) + _LENGTH.size + len(data) > self.segment_bytes:
+                segments.append((segments[-1] + 1) if segments else 1)
+
+            with open(self._path(segments[-1]), "ab") as f:
+                f.write(_LENGTH.pack(len(data)) + data)
+
+            for number in segments[:-self.max_segments]:
+                os.remove(self._path(number))
+
+    def records(self):
+        """Iterate over the stored run records, newest first."""
+
+        with self._lock:
+            segments = self._segments()
+
+        for number in reversed(segments):
+            try:
+                with open(self._path(number), "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                # Removed by a rotation since the segments were listed
+                continue
+            yield from reversed(list(self._decode(content, number)))
+
+    def runs(self, service_type, service, action=None, limit=10):
+        """The last limit runs of a service, newest first, optionally only of one test action."""
+
+        runs = []
+        for record in self.records():
+            if len(runs) >= limit:
+                break
+            if record["service-type"] == service_type and record["service"] == service \
+                    and (action is None or record["action"] == action):
+                runs.append(record)
+        return runs
+
+    def device_trend(self, service_type, service, device, limit=10):
+        """
+        The results of a device over the last limit runs of a service that tested it, newest first.
+
+        Return list of (record, [collected seconds, success]).
+        """
+
+        trend = []
+        for record in self.records():
+            if len(trend) >= limit:
+                break
+            if record["service-type"] == service_type and record["service"] == service \
+                    and device in record["devices"]:
+                trend.append((record, record["devices"][device]))
+        return trend
+
+    def _decode(self, content, number):
+        offset = 0
+        while offset + _LENGTH.size <= len(content):
+            (length,) = _LENGTH.unpack_from(content, offset)
+            offset += _LENGTH.size
+            if offset + length > len(content):
+                # A record cut short, ie by the VM stopping mid write
+                if self.log: self.log.info(f"Ignoring incomplete record at the end of result segment {number}")
+                break
+            try:
+                yield json.loads(zlib.decompress(content[offset:offset + length]))
+            except (zlib.error, ValueError) as e:
+                if self.log: self.log.info(f"Ignoring unreadable record in result segment {number}: {e}")
+            offset += length
+
+    def _segments(self):
+        """Sorted numbers of the segment files in the store."""
+
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    numbers.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    def _path(self, number):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}")
+
+
+def run_record(action, service_type, service, level, progress, collector):
+    """
+    Build the run record of a completed test action from its TestProgress and ResultCollector.
+
+    devices maps each device to [seconds from the start of the run until its output was
+    collected (None if it never was), whether every test on it passed].
+    """
+
+    devices = {}
+    tests = []
+    for elapsed, device, test, success in progress.history:
+        if device:
+            entry = devices.setdefault(device, [None, True])
+            if test == "device collection" and success:
+                entry[0] = elapsed
+            entry[1] = entry[1] and bool(success)
+        tests.append([test, device, bool(success)])
+
+    errors = [[test, message] for test, message in collector.errors]
+
+    return {
+        "id": uuid.uuid4().hex[:12],
+        "action": action,
+        "service-type": service_type,
+        "service": str(service),
+        "level": level,
+        "started": progress.started,
+        "duration": progress.duration,
+        "success": collector.success,
+        "devices": devices,
+        "tests": tests,
+        "errors": errors[:RESULT_STORE_MAX_ERRORS],
+        "error-count": len(errors),
+    }
+
+
+def record_run(action, service_type, service, level, progress, collector, log=None):
+    """
+    Append the run record of a completed test action to the package result store, if it is running.
+
+    Never fails the test itself.
+    """
+
+    store = get_result_store()
+    if not store:
+        return
+
+    try:
+        store.append(run_record(action, service_type, service, level, progress, collector))
+    except Exception as e:
+        if log: log.info(f"Unable to record {action} test run of {service_type} {service}: {e}")
+
+
+def history_action_output(service_type, service, action_input, action_output):
+    """
+    Fill the output of a history action: the last runs of a service, or the trend of one device.
+    """
+
+    store = get_result_store()
+    if not store:
+        action_output.message = "The test result store is not running."
+        return
+
+    if action_input.device:
+        trend = store.device_trend(service_type, str(service), str(action_input.device), limit=action_input.last)
+
+        # Flapping shows as a change in result between consecutive runs
+        results = [success for record, (collected, success) in trend]
+        transitions = sum(1 for newer, older in zip(results, results[1:]) if newer != older)
+
+        action_output.message = (
+            f"device {action_input.device} was tested in {len(trend)} runs, failed {results.count(False)} "
+            f"and changed result {transitions} times"
+        )
+        for record, (collected, success) in trend:
+            run = action_output.device_run.create()
+            run.id = record["id"]
+            run.action = record["action"]
+            run.started = record["started"]
+            run.success = success
+            if collected is not None:
+                run.collected = f"{collected:.3f}"
+        return
+
+    runs = store.runs(service_type, str(service), limit=action_input.last)
+    action_output.message = f"{len(runs)} test runs of {service_type} {service}"
+    for record in runs:
+        run = action_output.run.create()
+        run.id = record["id"]
+        run.action = record["action"]
+        run.level = record["level"]
+        run.started = record["started"]
+        run.duration = f"{record['duration']:.3f}"
+        run.success = record["success"]
+        run.devices = len(record["devices"])
+        run.failed_devices = sum(1 for collected, success in record["devices"].values() if not success)
+        run.errors = record["error-count"]
+        for test, message in record["errors"]:
+            run.error.create().message = f"{test}: {message}"
+
+
+# The store used by the package. Set by Main.setup() and cleared by Main.teardown()
+_result_store = None
+
+
+def start_result_store(log=None, **kwargs):
+    """Create the package result store. Tests still run, without history, if it can't be created."""
+
+    global _result_store
+    try:
+        _result_store = ResultStore(log=log, **kwargs)
+    except OSError as e:
+        _result_store = None
+        if log: log.info(f"Unable to start the test result store: {e}")
+    return _result_store
+
+
+def stop_result_store():
+    """Remove the package result store."""
+
+    global _result_store
+    _result_store = None
+
+
+def get_result_store():
+    """Return the package result store, or None if it isn't running."""
+
+    return _result_store
@@ -0,0 +1,268 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Pool of authenticated pyATS device sessions shared by the test actions.
+
+The pool is started by the Main application in setup() and drained in
+teardown(). Test actions check sessions out of it instead of logging in
+to every device on every run. A reaper thread, running while the pool is
+started, disconnects sessions left idle too long even when no test action
+runs.
+"""
+
+import threading
+import time
+
+# Default pool sizing and session lifetime settings
+POOL_MAX_SESSIONS = 50
+POOL_IDLE_TIMEOUT = 600
+POOL_HEALTH_CHECK_INTERVAL = 60
+POOL_REAP_INTERVAL = 60
+
+
+class PooledSession(object):
+    """A connected pyATS device held by the pool."""
+
+    def __init__(self, device, signature):
+        self.device = device
+        self.signature = signature
+        self.in_use = False
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+
+
+class SessionPool(object):
+    """
+    Keep connected pyATS devices per NSO device name between action runs.
+
+    - Sessions idle longer than idle_timeout are disconnected, by the reaper
+      thread every reap_interval seconds (see start_reaper()) and on every
+      check out and check in.
+    - Sessions idle longer than health_check_interval are probed before reuse.
+    - At most max_sessions sessions are kept. When the pool is full the least
+      recently used idle session is evicted, and if every session is in use
+      the caller gets an unpooled connection that is closed on check in.
+    """
+
+    def __init__(self, max_sessions=POOL_MAX_SESSIONS, idle_timeout=POOL_IDLE_TIMEOUT,
+                 health_check_interval=POOL_HEALTH_CHECK_INTERVAL, reap_interval=POOL_REAP_INTERVAL, log=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.reap_interval = reap_interval
+        self.log = log
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop_reaper = threading.Event()
+
+    def start_reaper(self):
+        """Start the thread disconnecting idle sessions past their timeout every reap_interval seconds."""
+
+        if self._reaper:
+            return
+        self._stop_reaper.clear()
+        self._reaper = threading.Thread(target=self._reap_loop, name="network-fabric-session-reaper", daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self):
+        """Stop the reaper thread and wait for it to finish."""
+
+        reaper, self._reaper = self._reaper, None
+        if reaper:
+            self._stop_reaper.set()
+            reaper.join()
+
+    def reap(self):
+        """Disconnect the idle sessions past their timeout, return how many were disconnected."""
+
+        with self._lock:
+            expired = self._expire_idle()
+
+        if expired and self.log: self.log.info(f"Disconnecting {len(expired)} idle pooled device sessions")
+        self._close(expired)
+        return len(expired)
+
+    def _reap_loop(self):
+        while not self._stop_reaper.wait(self.reap_interval):
+            self.reap()
+
+    def checkout(self, device, log_stdout=False, connection_timeout=None):
+        """
+        Return a connected device to use in place of the provided (unconnected) one.
+
+        connection_timeout limits the login when a new session has to be opened.
+        """
+
+        signature = connection_signature(device)
+        stale = []
+
+        with self._lock:
+            stale.extend(self._expire_idle())
+            session = self._sessions.get(device.name)
+
+            if session and not session.in_use and session.signature == signature:
+                session.in_use = True
+            else:
+                if session and not session.in_use:
+                    # Connection details changed since the session was opened
+                    stale.append(self._sessions.pop(device.name))
+                session = None
+
+        self._close(stale)
+
+        if session:
+            if self._healthy(session):
+                if self.log: self.log.info(f"Reusing pooled session for device {device.name}")
+                return session.device
+            with self._lock:
+                self._sessions.pop(device.name, None)
+            self._close([session])
+
+        # No reusable session, log in and try to add the new session to the pool
+        if self.log: self.log.info(f"Opening new session for device {device.name}")
+        if connection_timeout is None:
+            device.connect(learn_hostname=learn_hostname(device), log_stdout=log_stdout)
+        else:
+            device.connect(learn_hostname=learn_hostname(device), log_stdout=log_stdout,
+                           connection_timeout=connection_timeout)
+        self._add(device, signature)
+        return device
+
+    def checkin(self, device):
+        """Return a device to the pool, or disconnect it if it isn't pooled."""
+
+        pooled = False
+        with self._lock:
+            stale = self._expire_idle()
+            session = self._sessions.get(device.name)
+            if session and session.device is device:
+                session.in_use = False
+                session.last_used = time.monotonic()
+                pooled = True
+
+        self._close(stale)
+        if not pooled:
+            self._close_device(device)
+
+    def discard(self, device):
+        """Disconnect a device and drop its session from the pool, for a session that can't be trusted to be reused."""
+
+        with self._lock:
+            session = self._sessions.get(device.name)
+            if session and session.device is device:
+                self._sessions.pop(device.name)
+
+        if self.log: self.log.info(f"Discarding session for device {device.name}")
+        self._close_device(device)
+
+    def drain(self):
+        """Disconnect and forget every session in the pool."""
+
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+
+        if self.log: self.log.info(f"Draining {len(sessions)} pooled device sessions")
+        self._close(sessions)
+
+    def _add(self, device, signature):
+        evicted = []
+        with self._lock:
+            if device.name in self._sessions:
+                # Another run already pooled a session for this device, keep this one unpooled
+                return
+            if len(self._sessions) >= self.max_sessions:
+                idle = [s for s in self._sessions.values() if not s.in_use]
+                if not idle:
+                    if self.log: self.log.info(f"Session pool full, device {device.name} will not be pooled")
+                    return
+                oldest = min(idle, key=lambda s: s.last_used)
+                evicted.append(self._sessions.pop(oldest.device.name))
+
+            session = PooledSession(device, signature)
+            session.in_use = True
+            self._sessions[device.name] = session
+
+        self._close(evicted)
+
+    def _expire_idle(self):
+        """Remove idle sessions past their timeout. Caller must hold the lock."""
+
+        now = time.monotonic()
+        expired = [name for name, s in self._sessions.items()
+                   if not s.in_use and now - s.last_used > self.idle_timeout]
+        return [self._sessions.pop(name) for name in expired]
+
+    def _healthy(self, session):
+        """Check a session is still usable, probing the device if it has been idle a while."""
+
+        device = session.device
+        try:
+            if not device.is_connected():
+                return False
+            now = time.monotonic()
+            if now - session.last_checked > self.health_check_interval:
+                device.execute("")
+                session.last_checked = now
+            return True
+        except Exception as e:
+            if self.log: self.log.info(f"Pooled session for device {device.name} failed health check: {e}")
+            return False
+
+    def _close(self, sessions):
+        for session in sessions:
+            self._close_device(session.device)
+
+    def _close_device(self, device):
+        try:
+            if device.connected:
+                if self.log: self.log.info(f"Disconnecting device {device.name}")
+                device.settings.GRACEFUL_DISCONNECT_WAIT_SEC = 0
+                device.settings.POST_DISCONNECT_WAIT_SEC = 0
+                device.disconnect()
+        except Exception as e:
+            if self.log: self.log.info(f"Error disconnecting device {device.name}: {e}")
+
+
+def connection_signature(device):
+    """The connection signature recorded for a device by create_pyats_device."""
+
+    return device.custom.get("connection_signature") if device.custom else None
+
+
+def learn_hostname(device):
+    """
+    True if the device prompt has to be learned on login, False for devices set up
+    for fast connect by create_pyats_device (the hostname is already known from NSO).
+    """
+
+    return not (device.custom and device.custom.get("fast_connect"))
+
+
+# The pool used by the package. Set by Main.setup() and cleared by Main.teardown()
+_session_pool = None
+
+
+def start_session_pool(log=None, **kwargs):
+    """Create the package session pool and start its reaper thread."""
+
+    global _session_pool
+    _session_pool = SessionPool(log=log, **kwargs)
+    _session_pool.start_reaper()
+    return _session_pool
+
+
+def stop_session_pool():
+    """Stop the reaper thread, then drain and remove the package session pool."""
+
+    global _session_pool
+    pool, _session_pool = _session_pool, None
+    if pool:
+        pool.stop_reaper()
+        pool.drain()
+
+
+def get_session_pool():
+    """Return the package session pool, or None if it isn't running."""
+
+    return _session_pool
@@ -0,0 +1,135 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Time-bounded store of parsed device output shared by the test actions.
+
+The store is started by the Main application in setup() and cleared in
+teardown(). Every CommandCache created by a test action reads through it,
+so tests of other services on the same switches within SNAPSHOT_TTL seconds,
+ie the tenant tests of a fabric's layer3 switch-pair, reuse the parsed output
+instead of running the commands on the switches again. A test never reuses
+output it took or reused before, re-running a test always reads the switches.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a parsed output is reused for, and the number of (device, command) outputs kept
+SNAPSHOT_TTL = 120
+SNAPSHOT_MAX_ENTRIES = 2000
+
+
+class Snapshot(object):
+    """Parsed output of a command on a device."""
+
+    def __init__(self, output, version, source=None):
+        self.output = output
+        self.version = version
+        # The tests that took or were given the snapshot, none of them get it (again)
+        self.readers = {source}
+        self.stored = time.monotonic()
+
+
+class SnapshotStore(object):
+    """
+    Parsed device output keyed by (device, command), shared between action runs.
+
+    - A snapshot is reused for at most ttl seconds.
+    - A snapshot is only reused while the device version it was taken at (the last
+      transaction id NSO knows for the device) is unchanged, so a commit to a switch
+      makes the next test read it again.
+    - A test (source) is never given a snapshot it took or was already given, so
+      re-running a test always reads the switches. Operational state like links and
+      OSPF changes without a new transaction id.
+    - At most max_entries snapshots are kept, the least recently used are evicted.
+
+    Only output of devices that passed their checks is stored, see CommandCache.share().
+    """
+
+    def __init__(self, ttl=SNAPSHOT_TTL, max_entries=SNAPSHOT_MAX_ENTRIES, log=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.log = log
+        self.hits = 0
+        self.misses = 0
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, device_name, command, version=None, source=None):
+        """
+        Return the parsed output of a command on a device if a fresh snapshot of it is held, else None.
+
+        A snapshot is returned to source (the test reading the store) only once, and
+        never if source took it.
+        """
+
+        key = (device_name, command)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and (time.monotonic() - snapshot.stored > self.ttl or snapshot.version != version):
+                del self._snapshots[key]
+                snapshot = None
+
+            if snapshot is None or (source is not None and source in snapshot.readers):
+                self.misses += 1
+                return None
+
+            self._snapshots.move_to_end(key)
+            if source is not None:
+                snapshot.readers.add(source)
+            self.hits += 1
+            return snapshot.output
+
+    def put(self, device_name, command, output, version=None, source=None):
+        """
+        Store the parsed output of a command on a device, evicting the least recently used if full.
+
+        source is the test that ran the command, it is never given the snapshot.
+        """
+
+        key = (device_name, command)
+        with self._lock:
+            self._snapshots[key] = Snapshot(output, version, source)
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > self.max_entries:
+                self._snapshots.popitem(last=False)
+
+    def invalidate(self, device_name=None):
+        """Drop the snapshots of a device, or every snapshot."""
+
+        with self._lock:
+            if device_name is None:
+                self._snapshots.clear()
+                return
+            for key in [key for key in self._snapshots if key[0] == device_name]:
+                del self._snapshots[key]
+
+    def __len__(self):
+        return len(self._snapshots)
+
+
+# The store used by the package. Set by Main.setup() and cleared by Main.teardown()
+_snapshot_store = None
+
+
+def start_snapshot_store(log=None, **kwargs):
+    """Create the package snapshot store."""
+
+    global _snapshot_store
+    _snapshot_store = SnapshotStore(log=log, **kwargs)
+    return _snapshot_store
+
+
+def stop_snapshot_store():
+    """Drop every snapshot and remove the package snapshot store."""
+
+    global _snapshot_store
+    store, _snapshot_store = _snapshot_store, None
+    if store:
+        store.invalidate()
+
+
+def get_snapshot_store():
+    """Return the package snapshot store, or None if it isn't running."""
+
+    return _snapshot_store
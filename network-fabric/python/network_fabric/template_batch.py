@@ -0,0 +1,78 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Batching of template applications made during a service create.
+"""
+
+import ncs
+
+
+class TemplateBatch(object):
+    """
+    Collect template applications during a create and apply them together.
+
+    - One ncs.template.Template object is kept per context node instead of
+      creating a new one for every apply.
+    - Identical applies (same template, context and variables) are only made once.
+    - A single list-driven apply can stand in for several per-item applies,
+      for example all member interfaces of a port-channel. The number of
+      items it covers is passed as count so the saved applies can be reported.
+
+    Applies are queued in order and made by flush(), normally at the end of cb_create.
+    """
+
+    def __init__(self, service, metrics=None, log=None):
+        self.service = service
+        self.metrics = metrics
+        self.log = log
+        self.requested = 0
+        self.applied = 0
+        self._templates = {}
+        self._queue = []
+        self._queued = set()
+
+    def add(self, template_name, vars=None, context=None, count=1):
+        """
+        Queue a template apply.
+
+        vars is snapshotted so the caller can keep modifying its Variables object.
+        context is an optional maagic node to use as the template context node.
+        """
+
+        self.requested += count
+
+        items = tuple(vars) if vars else ()
+        path = context._path if context is not None else None
+        key = (template_name, path, items)
+
+        if key in self._queued:
+            return
+        self._queued.add(key)
+        self._queue.append(key)
+        if self.metrics: self.metrics.count_template_applies()
+
+    def flush(self):
+        """Apply every queued template in the order they were added."""
+
+        for template_name, path, items in self._queue:
+            if self.log: self.log.info(f"Applying template {template_name}")
+            self._template(path).apply(template_name, ncs.template.Variables(items))
+            self.applied += 1
+
+        self._queue = []
+        self._queued = set()
+
+    def _template(self, path):
+        if path not in self._templates:
+            self._templates[path] = ncs.template.Template(self.service, path)
+        return self._templates[path]
+
+    @property
+    def saved(self):
+        """Number of template applications avoided by batching."""
+
+        return self.requested - self.applied
+
+    def summary(self):
+        """Human readable summary of the batching for logs."""
+
+        return f"{self.applied} template applies for {self.requested} requested, {self.saved} saved."
@@ -0,0 +1,360 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Offline evaluation of the package's device templates: the device configuration a
+template apply sets, read from the template XML in templates/ with the variables and
+context node of the apply, without NSO. The intent renderer (intent_render) renders
+through it so its output always follows the templates.
+
+Only the template features the device templates use are supported: {$VAR},
+{string(.)} and context node paths in text, <?if?>/<?elif?>/<?else?>/<?end?>,
+<?foreach?> over a path of the context node and <?for?> loops, with =, !=, < and +
+in expressions. Anything else raises TemplateError, so a template change the
+evaluator doesn't understand fails loudly rather than rendering something else.
+
+Only the standard library is used, like intent_render.
+"""
+
+import functools
+import os
+import re
+import xml.etree.ElementTree as ET
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "templates")
+
+# NED namespaces of the device templates, config for a NED other than the device's is skipped like NSO does
+NX_OS_NED = "http://tail-f.com/ned/cisco-nx"
+IOS_NED = "urn:ios"
+NED_NAMESPACES = (NX_OS_NED, IOS_NED)
+
+# Leaves that key a list entry when they are its first child, the entry is named "<list> <key>"
+LIST_KEYS = ("name", "id")
+
+# Value of a leaf the template deletes (tags="delete"), and of an empty leaf or a list entry with only its key
+DELETED = "(deleted)"
+EXISTS = True
+
+# Upper bound for <?for?> loops, a loop condition that never turns false is a template error
+MAX_LOOP = 100000
+
+
+class TemplateError(Exception):
+    """A template, or a template feature, the evaluator doesn't support."""
+
+
+class _Scope(object):
+    """Variables and context node of an expression."""
+
+    def __init__(self, variables, context):
+        self.variables = variables
+        self.context = context
+
+    def child(self, context=None, **variables):
+        return _Scope({**self.variables, **variables}, self.context if context is None else context)
+
+
+def _parse(path):
+    """Parse a template, keeping its processing instructions."""
+
+    with open(path) as f:
+        text = f.read()
+    # NSO accepts whitespace before the processing instruction name, ie <? end ?>
+    text = re.sub(r"<\?\s+", "<?", text)
+    parser = ET.XMLParser(target=ET.TreeBuilder(insert_pis=True))
+    return ET.fromstring(text, parser=parser)
+
+
+def _split(tag):
+    """(namespace, local name) of an element tag."""
+
+    if tag.startswith("{"):
+        namespace, _, name = tag[1:].partition("}")
+        return (namespace, name)
+    return (None, tag)
+
+
+def _is_pi(node):
+    return node.tag is ET.ProcessingInstruction
+
+
+# -------------------------
+# Expressions
+# -------------------------
+_TOKEN = re.compile(r"\s*(\$[\w-]+|'[^']*'|\"[^\"]*\"|!=|=|<|\+|[\w./()-]+)")
+
+
+@functools.lru_cache(maxsize=None)
+def _tokens(expression):
+    """Tokens of an expression, cached as the same expressions are evaluated for every apply and loop."""
+
+    tokens, position = [], 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if not match:
+            raise TemplateError(f"unsupported expression {{{expression}}}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tuple(tokens)
+
+
+def _child_nodes(node, name):
+    """Children of a context node by YANG name: a maagic node, or a dictionary like a JSON export."""
+
+    if isinstance(node, dict):
+        for key in (name, f"network-fabric:{name}"):
+            if key in node:
+                value = node[key]
+                break
+        else:
+            return []
+    else:
+        value = getattr(node, name.replace("-", "_"), None)
+
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)) or (not isinstance(value, (str, dict)) and hasattr(value, "__iter__") and hasattr(value, "__len__")):
+        return list(value)
+    return [value]
+
+
+def _nodes(context, path):
+    """The nodes a relative path selects from the context node."""
+
+    if path.startswith("/"):
+        raise TemplateError(f"absolute path {path} is not supported in device templates")
+    nodes = [context]
+    for step in path.split("/"):
+        nodes = [child for node in nodes for child in _child_nodes(node, step)]
+    return nodes
+
+
+def _operand(token, scope):
+    if token.startswith("$"):
+        name = token[1:]
+        if name not in scope.variables:
+            raise TemplateError(f"variable {name} is not set")
+        return scope.variables[name]
+    if token[0] in "'\"":
+        return token[1:-1]
+    if re.fullmatch(r"\d+(\.\d+)?", token):
+        return float(token)
+    if token == "string(.)" or token == ".":
+        return str(scope.context)
+    return _nodes(scope.context, token)
+
+
+def _string(value):
+    """XPath string value."""
+
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else str(value)
+    if isinstance(value, list):
+        return str(value[0]) if value else ""
+    return str(value)
+
+
+def _number(value):
+    try:
+        return float(_string(value))
+    except ValueError:
+        return float("nan")
+
+
+def _true(value):
+    """XPath boolean value."""
+
+    if isinstance(value, float):
+        return value != 0
+    return len(value) > 0
+
+
+def evaluate(expression, scope):
+    """Evaluate a template expression (the text between braces)."""
+
+    tokens = _tokens(expression)
+    if len(tokens) == 1:
+        return _operand(tokens[0], scope)
+    if len(tokens) != 3:
+        raise TemplateError(f"unsupported expression {{{expression}}}")
+
+    left, operator, right = _operand(tokens[0], scope), tokens[1], _operand(tokens[2], scope)
+    if operator == "+":
+        return _number(left) + _number(right)
+    if operator == "<":
+        return 1.0 if _number(left) < _number(right) else 0.0
+    if isinstance(left, float) or isinstance(right, float):
+        equal = _number(left) == _number(right)
+    else:
+        equal = _string(left) == _string(right)
+    if operator == "=":
+        return 1.0 if equal else 0.0
+    if operator == "!=":
+        return 0.0 if equal else 1.0
+    raise TemplateError(f"unsupported operator {operator} in {{{expression}}}")
+
+
+def substitute(text, scope):
+    """Text with every {expression} replaced by its string value."""
+
+    return re.sub(r"\{([^}]*)\}", lambda match: _string(evaluate(match.group(1), scope)), text)
+
+
+# -------------------------
+# Templates
+# -------------------------
+class DeviceTemplates(object):
+    """
+    The device templates of the package, parsed once and evaluated for each apply.
+
+    render() returns the leaves an apply sets as (device, path, value). path is a tuple
+    of (name,) for containers and leaves and (name, key) for list entries, from below
+    the device's config element.
+    """
+
+    def __init__(self, templates_dir=TEMPLATES_DIR):
+        self.templates_dir = templates_dir
+        self._templates = {}
+
+    def template(self, name):
+        if name not in self._templates:
+            self._templates[name] = _parse(os.path.join(self.templates_dir, f"{name}.xml"))
+        return self._templates[name]
+
+    def render(self, name, variables, context=None, ned=None):
+        """
+        The configuration a template apply sets.
+
+        variables is a dictionary of {variable: value}, values as the template sees them
+        (str() of the value added to ncs.template.Variables). context is the context node
+        of the apply, a maagic node or a dictionary, for <?foreach?> and relative paths.
+        ned is the namespace of the device's NED, config for other NEDs is skipped.
+
+        Return list of (device name, path, value)
+        """
+
+        leaves = []
+        root = self.template(name)
+        scope = _Scope(dict(variables), context)
+        if _split(root.tag)[1] == "config-template":
+            self._children(list(root), scope, (), leaves, ned)
+        else:
+            self._element(root, scope, (), leaves, ned)
+
+        rendered = []
+        for path, value in leaves:
+            if len(path) < 3 or path[0] != ("devices",) or path[1][0] != "device" or path[2] != ("config",):
+                if len(path) >= 2 and path[0] == ("devices",):
+                    continue
+                raise TemplateError(f"template {name} sets {path} outside of a device config")
+            if len(path) > 3:
+                rendered.append((path[1][1], path[3:], value))
+        return rendered
+
+    def _children(self, children, scope, path, leaves, ned):
+        index = 0
+        while index < len(children):
+            child = children[index]
+            if not _is_pi(child):
+                self._element(child, scope, path, leaves, ned)
+                index += 1
+                continue
+
+            keyword, _, argument = (child.text or "").strip().partition(" ")
+            if keyword not in ("if", "foreach", "for"):
+                raise TemplateError(f"unexpected <?{child.text}?>")
+            branches, index = self._block(children, index)
+
+            if keyword == "if":
+                for branch_keyword, condition, body in branches:
+                    if branch_keyword == "else" or _true(evaluate(_braces(condition), scope)):
+                        self._children(body, scope, path, leaves, ned)
+                        break
+            elif keyword == "foreach":
+                for node in _nodes(scope.context, _braces(argument)):
+                    self._children(branches[0][2], scope.child(context=node), path, leaves, ned)
+            else:
+                self._for(argument, branches[0][2], scope, path, leaves, ned)
+
+    def _block(self, children, start):
+        """
+        The branches of the <?if?>, <?foreach?> or <?for?> at children[start].
+
+        Return tuple with ([(keyword, argument, body)], index after its <?end?>)
+        """
+
+        keyword, _, argument = children[start].text.strip().partition(" ")
+        branches = [(keyword, argument, [])]
+        depth = 0
+        for index in range(start + 1, len(children)):
+            child = children[index]
+            if _is_pi(child):
+                child_keyword, _, child_argument = child.text.strip().partition(" ")
+                if child_keyword in ("if", "foreach", "for"):
+                    depth += 1
+                elif child_keyword == "end" and depth:
+                    depth -= 1
+                elif child_keyword == "end":
+                    return (branches, index + 1)
+                elif child_keyword in ("elif", "else") and not depth:
+                    branches.append((child_keyword, child_argument, []))
+                    continue
+            branches[-1][2].append(child)
+        raise TemplateError(f"<?{children[start].text}?> has no <?end?>")
+
+    def _for(self, argument, body, scope, path, leaves, ned):
+        match = re.fullmatch(r"\s*(\w+)=([^;]*);\s*\{([^}]*)\}\s*;\s*(\w+)=\{([^}]*)\}\s*", argument)
+        if not match or match.group(1) != match.group(4):
+            raise TemplateError(f"unsupported <?for {argument}?>")
+        variable, start, condition, step = match.group(1), match.group(2), match.group(3), match.group(5)
+
+        loop = scope.child(**{variable: substitute(start.strip(), scope)})
+        for _ in range(MAX_LOOP):
+            if not _true(evaluate(condition, loop)):
+                return
+            self._children(body, loop, path, leaves, ned)
+            loop = loop.child(**{variable: _string(evaluate(step, loop))})
+        raise TemplateError(f"<?for {argument}?> ran more than {MAX_LOOP} times")
+
+    def _element(self, element, scope, path, leaves, ned):
+        if not isinstance(element.tag, str):
+            # Comments
+            return
+        namespace, name = _split(element.tag)
+        if ned and namespace in NED_NAMESPACES and namespace != ned:
+            return
+
+        children = list(element)
+        if not children:
+            text = (element.text or "").strip()
+            if element.get("tags") == "delete":
+                value = DELETED
+            elif text:
+                value = substitute(text, scope)
+            else:
+                value = EXISTS
+            leaves.append((path + ((name,),), value))
+            return
+
+        nested = []
+        self._children(children, scope, (), nested, ned)
+        if not nested:
+            return
+
+        first_path, first_value = nested[0]
+        if len(first_path) == 1 and first_path[0][0] in LIST_KEYS and isinstance(first_value, str) and first_value != DELETED:
+            entry = path + ((name, first_value),)
+            rest = nested[1:]
+            if not rest:
+                leaves.append((entry, EXISTS))
+            leaves.extend((entry + child_path, value) for child_path, value in rest)
+        else:
+            leaves.extend((path + ((name,),) + child_path, value) for child_path, value in nested)
+
+
+def _braces(argument):
+    """The expression of a processing instruction argument, ie {$MODE = "trunk"}."""
+
+    match = re.fullmatch(r"\s*\{(.*)\}\s*", argument)
+    if not match:
+        raise TemplateError(f"expected {{expression}}, got {argument!r}")
+    return match.group(1)
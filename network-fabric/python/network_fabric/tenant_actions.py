@@ -2,10 +2,15 @@ import ncs
 from ncs.dp import Action
 from _ncs import decrypt
 from _ncs.dp import action_set_timeout
-from .helper_functions import find_layer3_switch_pair, test_results_action_output, test_action_overall_status
-from .pyats_helpers import create_testbed, testbed_connect, testbed_disconnect
-from .pyats_helpers import testbed_connection_status
-from .pyats_tests import nxos_features_enabled, vrfs_exist, ospf_vrfs_running
+from .pyats_helpers import DeviceRegistry, collect_device_outputs, QUICK_TEST_TIME_BUDGET, FULL_TEST_ACTION_TIMEOUT
+from .pyats_tests import nxos_features_enabled, vrfs_exist, ospf_vrfs_running, ospf_collected, FEATURE_COMMAND, VRF_COMMAND, OSPF_VRF_COMMAND
+from .command_cache import CommandCache
+from .snapshot_store import get_snapshot_store
+from .verification_state import device_versions
+from .fabric_topology import FabricTopology
+from .test_progress import TestProgress
+from .result_collector import ResultCollector
+from .result_store import record_run, history_action_output
 
 
 class TenantAction(Action): 
@@ -18,43 +23,82 @@ class TenantAction(Action):
         trans.maapi.install_crypto_keys()
 
         if name == 'tenant':
-            # This test can run longer than the default. Increasing timeout to 6 minutes
-            action_set_timeout(uinfo, 360)
+            # The full test can run longer than the default. Increasing timeout to 6 minutes
+            if str(action_input.level) == "full": 
+                action_set_timeout(uinfo, FULL_TEST_ACTION_TIMEOUT)
 
-            self.tenant_test(service, root, action_input, action_output)
+            self.tenant_test(service, root, action_input, action_output, username=uinfo.username)
 
-    def tenant_test(self, service, root, action_input, action_output): 
+        elif name == 'history': 
+            history_action_output("network-tenant", service.name, action_input, action_output)
+
+    def tenant_test(self, service, root, action_input, action_output, username=None): 
+
+        # Results are streamed to the test progress container as they come in
+        progress = TestProgress(username, f"{service._path}/test", "tenant", log=self.log)
+        progress.start()
+
+        # Errors and details are collected during the test and written to the action output at the end
+        collector = ResultCollector(max_entries=action_input.max_results)
 
         # Currently all tests related to Layer 3 configuration. If tests are added other than L3 this if condition will need to change.
         if service.layer3.enabled: 
             self.log.info(f'Running tenant_test on network-tenant {service.name}')
 
-            # Setup - Create Testbed for Layer 3 Pair
-            self.log.info(f"Setting up pyATS Testbed for network-tenant {service.name}")
+            # Setup - Register the Layer 3 Pair devices 
+            self.log.info(f"Setting up pyATS devices for network-tenant {service.name}")
             # Find network-fabric and layer3 switch pair 
             fabric = root.network_fabric[service.fabric]
-            layer3_pair = find_layer3_switch_pair(fabric)
+            layer3_pair = FabricTopology(fabric).layer3_pair
 
-            testbed = create_testbed(
-                root=root,
-                testbed_name=f"{service.name}_testbed_layer3pair_{layer3_pair.name}",
-                devices=[switch.device for switch in layer3_pair.switch], 
+            # Each switch is only built and connected when a test needs output that isn't in a snapshot
+            registry = DeviceRegistry(
+                root, 
+                name=f"{service.name}_testbed_layer3pair_{layer3_pair.name}", 
+                fast_connect=fabric.test.fast_connect, 
                 log=self.log
             )
+            devices = registry.devices([switch.device for switch in layer3_pair.switch])
 
-            # for debuging, print out testbed 
-            self.log.info(f"testbed = {testbed}")
+            # List of VRFs for the tenant
+            vrfs = [f"{service.name}_{vrf}" for vrf in service.layer3.vrf]
 
-            # Setup - Connect to testbed
-            testbed_connect(testbed, log=self.log)
-            testbed_connection_status(testbed, log=self.log)
+            # Output parsed by another recent test is reused while the switches are unchanged, unless fresh
+            versions = device_versions(root, devices)
+            source = f"{service._path}/test/tenant"
+
+            # Quick tests check the tenant VRFs are running OSPF with a single command per device
+            if str(action_input.level) == "quick": 
+                self.quick_tenant_test(devices, vrfs, collector, progress, versions=versions, fresh=action_input.fresh, source=source)
+                registry.release()
+                collector.detail("device registry", registry.summary())
+                collector.write(action_output)
+                progress.finish(collector.success)
+                record_run("tenant", "network-tenant", service.name, "quick", progress, collector, log=self.log)
+                return
+
+            # All device output for this run is shared between the tests through one cache
+            cache = CommandCache(snapshots=None if action_input.fresh else get_snapshot_store(), versions=versions, source=source)
+
+            # Devices a check failed on, their output isn't shared with other tests
+            failed_devices = set()
+
+            # Setup - Connect the switches, except those every command can be answered for from snapshots
+            commands = [FEATURE_COMMAND, VRF_COMMAND, OSPF_VRF_COMMAND]
+            missing = [device for device in devices if not all([cache.restore(device, command) for command in commands])]
+            if missing: 
+                registry.connect(missing)
+            else: 
+                self.log.info(f"Using snapshots of every command on {registry.name}")
 
             # Tests to run on Tenant
             # Layer 3 - Features Enabled (hsrp, interface-vlan, ospf) - Note: hsrp feature called "hsrp_engine" in show command
-            for device in testbed.devices: 
+            usage = cache.usage()
+            for device in devices: 
                 result = nxos_features_enabled(
-                    device=testbed.devices[device], 
+                    device=devices[device], 
                     features=["hsrp_engine", "interface-vlan", "ospf"], 
+                    cache=cache, 
                     log=self.log,
                 )
 
@@ -62,20 +106,19 @@ class TenantAction(Action):
                 # self.log.info(f"result: {result}")
 
                 # Update action output and results
-                test_results_action_output(
-                    test_name="nxos feature enabled", 
-                    result=result, 
-                    action_output=action_output
-                )
+                collector.test_result("nxos feature enabled", result)
+                progress.test_result("nxos feature enabled", result, device=device)
+                if not result["success"]: 
+                    failed_devices.add(device)
+            collector.usage("nxos feature enabled", cache.usage() - usage)
 
             # Layer 3 - VRFs exist for tenant 
-            # List of VRFs for the tenant
-            vrfs = [f"{service.name}_{vrf}" for vrf in service.layer3.vrf]
-
-            for device in testbed.devices: 
+            usage = cache.usage()
+            for device in devices: 
                 result = vrfs_exist(
-                    device=testbed.devices[device], 
+                    device=devices[device], 
                     vrfs=vrfs, 
+                    cache=cache, 
                     log=self.log,
                 )
 
@@ -83,38 +126,112 @@ class TenantAction(Action):
                 # self.log.info(f"result: {result}")
 
                 # Update action output and results
-                test_results_action_output(
-                    test_name="tenant vrfs exist", 
-                    result=result, 
-                    action_output=action_output
-                )
+                collector.test_result("tenant vrfs exist", result)
+                progress.test_result("tenant vrfs exist", result, device=device)
+                if not result["success"]: 
+                    failed_devices.add(device)
+            collector.usage("tenant vrfs exist", cache.usage() - usage)
 
             # Layer 3 - OSPF process running for VRF 
-            for device in testbed.devices: 
-                result = ospf_vrfs_running(
-                    device=testbed.devices[device], 
-                    vrfs=vrfs, 
-                    log=self.log,
-                )
+            usage = cache.usage()
+            for device in devices: 
+                try: 
+                    result = ospf_vrfs_running(
+                        device=devices[device], 
+                        vrfs=vrfs, 
+                        cache=cache, 
+                        log=self.log,
+                    )
+                except Exception as e: 
+                    # Only empty output means OSPF isn't running, the OSPF state of the device is unknown
+                    result = {"success": False, "details": [], "error": [f"device {device} failed to parse '{OSPF_VRF_COMMAND}': {e}"]}
+                    collector.test_result("device collection", result)
+                    progress.test_result("device collection", result, device=device)
+                    failed_devices.add(device)
+                    continue
 
                 # for debuging, print results 
                 # self.log.info(f"result: {result}")
 
                 # Update action output and results
-                test_results_action_output(
-                    test_name="tenant ospf vrfs running", 
-                    result=result, 
-                    action_output=action_output
-                )
+                collector.test_result("tenant ospf vrfs running", result)
+                progress.test_result("tenant ospf vrfs running", result, device=device)
+                if not result["success"]: 
+                    failed_devices.add(device)
+            collector.usage("tenant ospf vrfs running", cache.usage() - usage)
+
 
+            # Report how many device round trips the command cache saved
+            collector.detail("command cache", cache.summary())
+            self.log.info(f"Command cache: {cache.summary()}")
 
-            # Cleanup - Disconnect from Testbed
-            testbed_disconnect(testbed, log=self.log)
-            testbed_connection_status(testbed, log=self.log)
+            # Output from snapshots may not show a change made on the switch itself since it was taken
+            if cache.snapshot_hits: 
+                collector.detail("snapshots", cache.snapshot_summary())
+
+            # Output of the switches that passed is shared with the tests of other services
+            cache.share(failed_devices)
+
+            # Cleanup - Release the devices that were connected (pooled sessions are returned to the pool)
+            registry.release()
+            collector.detail("device registry", registry.summary())
 
         else: 
             self.log.info(f"network-tenant {service.name} has layer3 disabled. No tests to run.")
 
         # Set overall action status
-        test_action_overall_status(action_output)
-        
\ No newline at end of file
+        collector.write(action_output)
+        progress.finish(collector.success)
+        record_run("tenant", "network-tenant", service.name, str(action_input.level), progress, collector, log=self.log)
+        
+
+    def quick_tenant_test(self, devices, vrfs, collector, progress, versions=None, fresh=False, source=None): 
+        """
+        Quick tenant test. Parse OSPF_VRF_COMMAND once on each layer3 switch, without 
+        any learn(), within QUICK_TEST_TIME_BUDGET seconds and check every tenant VRF 
+        has OSPF running. A VRF with OSPF running exists and has the ospf feature enabled.
+
+        devices is a dictionary of device name to pyATS device, released by the caller. 
+        With fresh the snapshot store isn't used. source is the test the command cache 
+        is for, see CommandCache.
+        """
+
+        self.log.info(f"Running quick tenant test on devices {list(devices)}")
+
+        cache = CommandCache(snapshots=None if fresh else get_snapshot_store(), versions=versions, source=source)
+        failed_devices = set()
+        collection_errors = collect_device_outputs(
+            devices=devices, 
+            commands={device: [OSPF_VRF_COMMAND] for device in devices}, 
+            cache=cache, 
+            timeout=QUICK_TEST_TIME_BUDGET, 
+            on_collected=lambda device, errors: progress.result("device collection", not errors, "; ".join(errors) or "collected", device=device), 
+            empty_output=[OSPF_VRF_COMMAND], 
+            log=self.log
+        )
+
+        for device in devices: 
+            # Empty output means OSPF isn't running and is reported by the test, 
+            # devices the command didn't run or failed on are collection errors
+            if not ospf_collected(device, cache): 
+                errors = collection_errors.get(device) or [f"device {device} was not collected: {OSPF_VRF_COMMAND}"]
+                collector.test_result("device collection", {"success": False, "details": [], "error": errors})
+                failed_devices.add(device)
+                continue
+
+            result = ospf_vrfs_running(
+                device=devices[device], 
+                vrfs=vrfs, 
+                cache=cache, 
+                log=self.log,
+            )
+
+            collector.test_result("tenant ospf vrfs running", result)
+            progress.test_result("tenant ospf vrfs running", result, device=device)
+            if not result["success"]: 
+                failed_devices.add(device)
+
+        collector.usage("tenant ospf vrfs running", cache.usage())
+        if cache.snapshot_hits: 
+            collector.detail("snapshots", cache.snapshot_summary())
+        cache.share(failed_devices)
@@ -2,7 +2,8 @@
 import ncs
 from ncs.application import Service
 import resource_manager.id_allocator as id_allocator
-from .helper_functions import find_layer3_switch_pair
+from .fabric_topology import FabricTopology
+from .create_metrics import CreateMetrics
 
 
 # ------------------------
@@ -16,18 +17,23 @@ class TenantServiceCallbacks(Service):
     def cb_create(self, tctx, root, service, proplist):
         self.log.info('Service create(service=', service._path, ')')
 
+        # Timing spans for each phase of the create
+        metrics = CreateMetrics("network-tenant", service.name, log=self.log)
+
         # For a tenant with layer3.enable = False no VRF configuration is done.
         if not service.layer3.enabled: 
             self.log.info(f"Network Tenant {service.name} has layer3 disabled. No VRF creation will be done.")
+            metrics.complete(root, service)
             return
 
         # VRF Creation: Lookup network-fabric resources
         self.log.info(f"Creating VRFs for {service.name} on network-fabric {service.fabric}.")
 
         # Find network-fabric and layer3 switch pair 
-        fabric = root.network_fabric[service.fabric]
-        # Lookup the Layer 3 Switch-Pair for the fabric on which VRFs will be created
-        layer3_pair = find_layer3_switch_pair(fabric)
+        with metrics.span("fabric-lookup"): 
+            fabric = root.network_fabric[service.fabric]
+            # Lookup the Layer 3 Switch-Pair for the fabric on which VRFs will be created
+            layer3_pair = FabricTopology(fabric).layer3_pair
 
         # If a layer3_pair was NOT found, print error message and return function
         if not layer3_pair: 
@@ -42,10 +48,14 @@ class TenantServiceCallbacks(Service):
         self.log.info(f"VRFs will be created on switch-pair {layer3_pair.name} on network-fabric {fabric.name} for this tenant.")
         for vrf in service.layer3.vrf: 
             self.log.info(f"Creating VRF {vrf}. (Note: Actual VRF name will be {service.name}_{vrf} on devices).")
-            self.create_vrf(vrf, layer3_pair, service)
+            with metrics.span("create-vrf"): 
+                self.create_vrf(vrf, layer3_pair, service, metrics=metrics)
+
+        # Keep the create timing in the package metrics store
+        metrics.complete(root, service)
 
     # Apply the basic layer3 config onto the switches in a layer3 pair
-    def create_vrf(self, vrf, layer3_pair, service): 
+    def create_vrf(self, vrf, layer3_pair, service, metrics=None): 
         """
         Create a VRF on each member of the Layer 3 Pair for a Fabric
         """
@@ -62,6 +72,7 @@ class TenantServiceCallbacks(Service):
             vars.add("VRFNAME", vrf_name)
             self.log.info(f"vars={vars}")
             template.apply("tenant-layer3-vrf-setup", vars)
+            if metrics: metrics.count_template_applies()
 
 
 
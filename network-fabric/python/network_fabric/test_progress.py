@@ -0,0 +1,136 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Live progress of a running test action, written to operational data as results come in.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from .helper_functions import write_operational
+
+# Seconds between operational writes while a test is running
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+
+class TestProgress(object):
+    """
+    Stream per-device and per-test results of a test action into the progress
+    container of the test container (see the test-progress grouping).
+
+    Results are queued and written in a separate operational transaction at most
+    every flush_interval seconds, so they can be followed while the action runs
+    and are kept if the action is stopped by its timeout. Queued results are
+    written by a timer once the interval has passed, even when no result follows
+    them.
+    """
+
+    def __init__(self, username, test_path, action, flush_interval=PROGRESS_FLUSH_INTERVAL, log=None):
+        self.username = username
+        self.path = f"{test_path}/progress"
+        self.action = action
+        self.flush_interval = flush_interval
+        self.log = log
+        self._pending = []
+        self._next_id = 1
+        self._flushed = 0.0
+        self._timer = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.history = []
+        self.started = now()
+        self._start_time = time.monotonic()
+
+    def start(self):
+        """Clear the results of the previous run and mark the test as running."""
+
+        self.started = now()
+        self._start_time = time.monotonic()
+
+        def write(progress):
+            progress.result.delete()
+            progress.action = self.action
+            progress.started = self.started
+            progress.status = "running"
+            progress.success = None
+
+        self._write(write)
+        self._flushed = time.monotonic()
+
+    def result(self, test, success, message="", device=None):
+        """Add a single result, writing the queued results if the flush interval has passed."""
+
+        with self._lock:
+            self._pending.append((self._next_id, now(), device, test, success, message))
+            self.history.append((round(self.duration, 3), device, test, success))
+            self._next_id += 1
+            wait = self.flush_interval - (time.monotonic() - self._flushed)
+            due = wait <= 0
+            if not due and self._timer is None:
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if due:
+            self.flush()
+
+    def test_result(self, test, result, device=None):
+        """Add the result of a test from its results dictionary."""
+
+        if result["success"]:
+            message = "passed"
+        else:
+            message = "; ".join(str(error) for error in result["error"])
+        self.result(test, result["success"], message, device=device)
+
+    @property
+    def duration(self):
+        """Seconds since the test was started."""
+
+        return time.monotonic() - self._start_time
+
+    def flush(self):
+        """Write any queued results, from the test or the flush timer."""
+
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._flushed = time.monotonic()
+                timer, self._timer = self._timer, None
+            if timer:
+                timer.cancel()
+            if not pending:
+                return
+
+            def write(progress):
+                for id, time_added, device, test, success, message in pending:
+                    entry = progress.result.create(id)
+                    entry.time = time_added
+                    if device:
+                        entry.device = device
+                    entry.test = test
+                    entry.success = success
+                    entry.message = message
+                progress.updated = now()
+
+            self._write(write)
+
+    def finish(self, success):
+        """Write the remaining results and mark the test as completed."""
+
+        self.flush()
+
+        def write(progress):
+            progress.status = "completed"
+            progress.success = success
+            progress.updated = now()
+
+        self._write(write)
+
+    def _write(self, update):
+        """Apply an update to the progress container, see write_operational()."""
+
+        write_operational(self.username, self.path, update, description="test progress", log=self.log)
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
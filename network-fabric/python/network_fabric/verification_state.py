@@ -0,0 +1,147 @@
+# -*- mode: python; python-indent: 4 -*-
+"""
+Per-device fingerprints of the last successful fabric test, used by incremental tests.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from .fabric_topology import FabricTopology
+from .helper_functions import write_operational
+
+
+def port_channel_intent(port_channels):
+    """The port-channel ids and member interfaces configured on a list of port-channels."""
+
+    intent = []
+    for port_channel in port_channels:
+        members = []
+        for case in port_channel.member_interface:
+            # Skip the "choice" case and collect the members of the configured case
+            if case != "network-fabric:member-interface" and len(port_channel.member_interface[case]) > 0:
+                members.extend(f'{case.split(":")[1]}{interface}' for interface in port_channel.member_interface[case])
+        intent.append([str(port_channel.name), sorted(members)])
+
+    return intent
+
+
+def fabric_device_intents(service, topology=None):
+    """
+    The part of a network-fabric service that the fabric test verifies on each switch.
+
+    Return dictionary of {device_name: intent}
+    """
+
+    root_bridge_name = (topology or FabricTopology(service)).root_bridge_name
+
+    intents = {}
+    for pair in service.switch_pair:
+        switches = [str(switch.device) for switch in pair.switch]
+        pair_intent = {
+            "switch-pair": str(pair.name),
+            "switches": switches,
+            "multiswitch-peerlink": port_channel_intent(pair.multiswitch_peerlink.port_channel),
+            "fabric-trunk": port_channel_intent(pair.fabric_trunk.port_channel),
+            "spanning-tree-root": str(root_bridge_name),
+        }
+        for device_name in switches:
+            intents[device_name] = pair_intent
+
+    for switch in service.switch:
+        intents[str(switch.device)] = {
+            "switch": str(switch.device),
+            "fabric-trunk": port_channel_intent(switch.fabric_trunk.port_channel),
+            "spanning-tree-root": str(root_bridge_name),
+        }
+
+    return intents
+
+
+def device_transaction_id(root, device_name):
+    """The last transaction id NSO knows for a device, or None if the device doesn't provide one."""
+
+    try:
+        transaction_id = root.devices.device[device_name].state.last_transaction_id
+    except (AttributeError, KeyError):
+        return None
+
+    return str(transaction_id) if transaction_id else None
+
+
+def device_versions(root, device_names):
+    """Last transaction id of each device, the version snapshots of its parsed output must match."""
+
+    return {device_name: device_transaction_id(root, device_name) for device_name in device_names}
+
+
+def device_fingerprint(root, device_name, intent, level):
+    """
+    Fingerprint a device's fabric intent, its last transaction id and the test level.
+
+    Return None when the device has no transaction id, as a change to its configuration couldn't be detected.
+    """
+
+    transaction_id = device_transaction_id(root, device_name)
+    if transaction_id is None:
+        return None
+
+    data = json.dumps({"intent": intent, "transaction-id": transaction_id, "level": level}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def unchanged_devices(service, fingerprints):
+    """
+    Find the devices whose fingerprint matches their last successful test.
+
+    Return dictionary of {device_name: verified timestamp}
+    """
+
+    verified = service.test.verified_device
+
+    unchanged = {}
+    for device_name, fingerprint in fingerprints.items():
+        if fingerprint is not None and device_name in verified:
+            entry = verified[device_name]
+            if entry.fingerprint == fingerprint:
+                unchanged[device_name] = entry.verified
+
+    return unchanged
+
+
+def verification_age(verified):
+    """Human readable time since a verified timestamp."""
+
+    seconds = int((datetime.now(timezone.utc) - datetime.fromisoformat(str(verified))).total_seconds())
+    hours, seconds = divmod(max(seconds, 0), 3600)
+    minutes, seconds = divmod(seconds, 60)
+
+    return f"{hours}h {minutes:02d}m {seconds:02d}s"
+
+
+def record_verifications(username, service_path, fingerprints, passed, failed, log=None):
+    """
+    Store the fingerprints of the devices that passed a fabric test.
+
+    Entries for failed devices are removed so the next incremental test checks them
+    again, as are entries for devices no longer in the fabric (not in fingerprints).
+    Devices skipped by an incremental test keep their entry.
+
+    Written in a separate operational transaction, see write_operational().
+    """
+
+    def update(test):
+        verified = test.verified_device
+        now = datetime.now(timezone.utc).isoformat()
+
+        stale = [str(entry.device) for entry in verified if str(entry.device) not in fingerprints]
+        for device_name in stale + [device_name for device_name in failed if device_name in verified]:
+            del verified[device_name]
+
+        for device_name in passed:
+            if fingerprints.get(device_name) is None:
+                continue
+            entry = verified.create(device_name)
+            entry.fingerprint = fingerprints[device_name]
+            entry.verified = now
+
+    write_operational(username, f"{service_path}/test", update, description="verified devices", log=log)